@@ -0,0 +1,189 @@
+"""
+Control de admisión para el tráfico de cotización.
+
+Anónimos (demo) y usuarios con sesión usan pools de capacidad separados, así
+un peak de tráfico demo (campañas de marketing) no consume los cupos de
+quienes pagan. Para demo además hay un límite de requests simultáneos por IP.
+
+Cuando un pool está lleno el request espera en una cola corta; si la espera
+estimada (o la real) supera el máximo, se rechaza de inmediato con 429 +
+Retry-After en vez de dejarlo colgado hasta un timeout.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+from fastapi import HTTPException
+
+DEMO_MAX_CONCURRENT = int(os.getenv("DEMO_MAX_CONCURRENT", "4"))
+DEMO_MAX_PER_IP = int(os.getenv("DEMO_MAX_PER_IP", "2"))
+DEMO_MAX_QUEUE = int(os.getenv("DEMO_MAX_QUEUE", "8"))
+DEMO_MAX_QUEUE_WAIT_SECONDS = float(os.getenv("DEMO_MAX_QUEUE_WAIT_SECONDS", "3"))
+AUTH_MAX_CONCURRENT = int(os.getenv("AUTH_MAX_CONCURRENT", "32"))
+AUTH_MAX_QUEUE = int(os.getenv("AUTH_MAX_QUEUE", "64"))
+AUTH_MAX_QUEUE_WAIT_SECONDS = float(os.getenv("AUTH_MAX_QUEUE_WAIT_SECONDS", "30"))
+# Proxies propios delante de la app (Railway: 1). 0 = no confiar en X-Forwarded-For
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
+
+_HOLD_EWMA_ALPHA = 0.2
+
+
+def client_ip(request) -> str:
+    """
+    IP del cliente según X-Forwarded-For. El cliente controla lo que viene a la
+    izquierda del header; solo se confía en lo que agregaron nuestros
+    TRUSTED_PROXY_HOPS proxies, así que se toma ese salto contado desde la derecha.
+    """
+    forwarded = request.headers.get("x-forwarded-for") if TRUSTED_PROXY_HOPS > 0 else None
+    if forwarded:
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        if hops:
+            return hops[-min(TRUSTED_PROXY_HOPS, len(hops))]
+    return request.client.host if request.client else "unknown"
+
+
+class Ticket:
+    """Cupo tomado en un pool; release() es idempotente."""
+
+    def __init__(self, pool: "AdmissionPool", ip: str):
+        self._pool = pool
+        self._ip = ip
+        self._start = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._pool._release(self._ip, time.monotonic() - self._start)
+
+
+class AdmissionPool:
+    def __init__(
+        self,
+        name: str,
+        capacity: int,
+        max_queue: int,
+        max_wait: float,
+        per_ip: Optional[int] = None,
+        initial_hold: float = 2.0,
+    ):
+        self.name = name
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.per_ip = per_ip
+        self.active = 0
+        self.avg_hold = initial_hold  # EWMA de segundos que se ocupa un cupo
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._by_ip: Counter = Counter()
+        self.stats: Dict[str, float] = {
+            "admitted": 0, "queued": 0, "shed_per_ip": 0, "shed_queue_full": 0,
+            "shed_expected_wait": 0, "shed_timeout": 0, "max_queue_wait": 0.0,
+        }
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self.avg_hold * (len(self._waiters) + 1) / self.capacity))
+
+    def _shed(self, reason: str, ip: Optional[str] = None) -> None:
+        self.stats[f"shed_{reason}"] += 1
+        if ip is not None:
+            self._leave(ip)
+        raise HTTPException(
+            status_code=429,
+            detail="Demasiadas solicitudes en este momento. Intenta de nuevo en unos segundos.",
+            headers={"Retry-After": str(self._retry_after())},
+        )
+
+    def _leave(self, ip: str) -> None:
+        self._by_ip[ip] -= 1
+        if self._by_ip[ip] <= 0:
+            del self._by_ip[ip]
+
+    async def acquire(self, ip: str) -> Ticket:
+        if self.per_ip is not None and self._by_ip[ip] >= self.per_ip:
+            self._shed("per_ip")
+        self._by_ip[ip] += 1
+
+        if self.active < self.capacity and not self._waiters:
+            self.active += 1
+            self.stats["admitted"] += 1
+            return Ticket(self, ip)
+
+        if len(self._waiters) >= self.max_queue:
+            self._shed("queue_full", ip)
+        # Espera esperada ≈ posición en la cola / capacidad * duración media de un cupo
+        if (len(self._waiters) + 1) / self.capacity * self.avg_hold > self.max_wait:
+            self._shed("expected_wait", ip)
+
+        self.stats["queued"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(future, timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self._remove_waiter(future)
+            self._shed("timeout", ip)
+        except asyncio.CancelledError:
+            self._remove_waiter(future)
+            if future.done() and not future.cancelled():
+                self._release(ip, 0.0)  # el cupo ya se había transferido
+            else:
+                self._leave(ip)
+            raise
+        self.stats["max_queue_wait"] = max(self.stats["max_queue_wait"], time.monotonic() - start)
+        self.stats["admitted"] += 1
+        return Ticket(self, ip)
+
+    def _remove_waiter(self, future: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(future)
+        except ValueError:
+            pass
+
+    def _release(self, ip: str, held: float) -> None:
+        if held:
+            self.avg_hold += _HOLD_EWMA_ALPHA * (held - self.avg_hold)
+        self._leave(ip)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # el cupo pasa directo al siguiente
+                return
+        self.active -= 1
+
+    def snapshot(self) -> Dict[str, float]:
+        return dict(
+            self.stats,
+            active=self.active,
+            queued_now=len(self._waiters),
+            capacity=self.capacity,
+            avg_hold_seconds=round(self.avg_hold, 3),
+        )
+
+
+demo_pool = AdmissionPool("demo", DEMO_MAX_CONCURRENT, DEMO_MAX_QUEUE, DEMO_MAX_QUEUE_WAIT_SECONDS, per_ip=DEMO_MAX_PER_IP)
+user_pool = AdmissionPool("user", AUTH_MAX_CONCURRENT, AUTH_MAX_QUEUE, AUTH_MAX_QUEUE_WAIT_SECONDS)
+
+
+def pool_for(user) -> AdmissionPool:
+    return demo_pool if user is None else user_pool
+
+
+async def acquire(request, user) -> Ticket:
+    """Cupo para el request (429 con Retry-After si no hay capacidad a tiempo)."""
+    return await pool_for(user).acquire(client_ip(request))
+
+
+@asynccontextmanager
+async def admission(request, user):
+    """`async with admission(request, current_user):` alrededor del trabajo pesado."""
+    ticket = await acquire(request, user)
+    try:
+        yield ticket
+    finally:
+        ticket.release()
@@ -1,3 +1,8 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -14,6 +19,93 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 días
 
 security = HTTPBearer()
 
+# Cache de usuarios autenticados: evita un SELECT por request (el dashboard
+# hace muchas llamadas por página). TTL corto + invalidación explícita.
+AUTH_USER_CACHE_TTL_SECONDS = float(os.getenv("AUTH_USER_CACHE_TTL_SECONDS", "30"))
+AUTH_USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "2048"))
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Usuario autenticado (solo lectura, sin sesión ORM)."""
+    id: int
+    email: Optional[str]
+    username: Optional[str]
+    name: Optional[str]
+    avatar_url: Optional[str]
+    provider: Optional[str]
+    is_active: bool
+    is_admin: bool
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(
+            id=user.id,
+            email=user.email,
+            username=user.username,
+            name=user.name,
+            avatar_url=user.avatar_url,
+            provider=user.provider,
+            is_active=bool(user.is_active),
+            is_admin=bool(user.is_admin),
+        )
+
+
+class _UserCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, user_id: int) -> Optional[Principal]:
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is None or entry[0] <= time.monotonic():
+                self.stats["misses"] += 1
+                return None
+            self._data.move_to_end(user_id)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def load(self, user_id: int, db: Session) -> Optional[Principal]:
+        with self._lock:
+            generation = self._generation
+        user = db.query(User).filter(User.id == user_id).first()
+        if user is None:
+            return None
+        principal = Principal.from_user(user)
+        with self._lock:
+            if generation == self._generation:  # no guardar lo leído antes de una invalidación
+                self._data[user_id] = (time.monotonic() + self.ttl, principal)
+                self._data.move_to_end(user_id)
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+        return principal
+
+    def invalidate(self, user_id: Optional[int] = None) -> None:
+        with self._lock:
+            self._generation += 1
+            if user_id is None:
+                self._data.clear()
+            else:
+                self._data.pop(user_id, None)
+
+
+_user_cache = _UserCache(AUTH_USER_CACHE_SIZE, AUTH_USER_CACHE_TTL_SECONDS)
+
+
+def get_principal(user_id: int, db: Session) -> Optional[Principal]:
+    """Principal del usuario (desde cache o BD); None si no existe."""
+    return _user_cache.get(user_id) or _user_cache.load(user_id, db)
+
+
+def invalidate_user(user_id: Optional[int] = None) -> None:
+    """Descarta el usuario cacheado (borrado, desactivado, datos de perfil); None = todos."""
+    _user_cache.invalidate(user_id)
+
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -41,7 +133,7 @@ def verify_token(token: str) -> dict:
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
-) -> User:
+) -> Principal:
     token = credentials.credentials
     payload = verify_token(token)
     user_id_str = payload.get("sub")
@@ -59,7 +151,7 @@ async def get_current_user(
             detail="ID de usuario inválido",
         )
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = get_principal(user_id, db)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -78,7 +170,7 @@ async def get_current_user(
 async def get_current_user_optional(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False)),
     db: Session = Depends(get_db)
-) -> Optional[User]:
+) -> Optional[Principal]:
     """Versión opcional de get_current_user para modo demo"""
     if not credentials:
         return None
@@ -91,7 +183,7 @@ async def get_current_user_optional(
             return None
         
         user_id = int(user_id_str)
-        user = db.query(User).filter(User.id == user_id).first()
+        user = get_principal(user_id, db)
         if user is None or not user.is_active:
             return None
         
@@ -124,6 +216,7 @@ def get_or_create_user(
             user.avatar_url = avatar_url
         db.commit()
         db.refresh(user)
+        invalidate_user(user.id)
         return user
     
     # Si no existe por provider_id, buscar por email
@@ -140,6 +233,7 @@ def get_or_create_user(
             user.avatar_url = avatar_url
         db.commit()
         db.refresh(user)
+        invalidate_user(user.id)
         return user
     
     # Crear nuevo usuario
@@ -0,0 +1,97 @@
+"""
+Cancelación cooperativa cuando el cliente se desconecta.
+
+Si el apoderado cierra el modal de cotización, el request se abandona pero
+los threads de cotización seguían scrapeando todos los items y proveedores.
+run_cancellable() vigila la conexión mientras corre el trabajo; al
+desconectarse cancela el task (corta las llamadas al LLM en curso) y marca el
+CancelToken del contexto, que los threads de cotización y Playwright
+consultan antes de empezar trabajo nuevo. `stats` cuenta el trabajo evitado.
+"""
+import asyncio
+import os
+import threading
+from contextvars import ContextVar
+from typing import Any, Awaitable, Optional, Tuple
+
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "0.5"))
+CANCEL_POLL_SECONDS = float(os.getenv("CANCEL_POLL_SECONDS", "0.2"))
+
+stats = {
+    "requests_cancelled": 0,  # clientes que se fueron con trabajo pendiente
+    "items_skipped": 0,  # items que no se llegaron a cotizar
+    "provider_calls_skipped": 0,  # búsquedas en proveedores no iniciadas o abandonadas
+    "playwright_skipped": 0,  # navegadores no lanzados / páginas no evaluadas
+    "llm_calls_cancelled": 0,  # llamadas al LLM cortadas por no tener quién las espere
+}
+_stats_lock = threading.Lock()
+
+
+def count(metric: str, n: int = 1) -> None:
+    with _stats_lock:
+        stats[metric] += n
+
+
+class ClientDisconnected(Exception):
+    """El cliente cerró la conexión antes de recibir la respuesta."""
+
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+
+_cancel_token: ContextVar[Optional[CancelToken]] = ContextVar("cancel_token", default=None)
+
+
+def current_cancel_token() -> Optional[CancelToken]:
+    """Token del request actual (se propaga a threads vía contextvars.copy_context)."""
+    return _cancel_token.get()
+
+
+def is_cancelled() -> bool:
+    token = _cancel_token.get()
+    return token is not None and token.cancelled
+
+
+def start_cancellable(work: Awaitable[Any]) -> Tuple[asyncio.Future, CancelToken]:
+    """Lanza work como task con un CancelToken propio en su contexto."""
+    token = CancelToken()
+    reset = _cancel_token.set(token)
+    try:
+        task = asyncio.ensure_future(work)  # el task copia el contexto con el token
+    finally:
+        _cancel_token.reset(reset)
+    return task, token
+
+
+def abandon(task: asyncio.Future, token: CancelToken) -> None:
+    """Cancela el trabajo pendiente (task + threads que miran el token)."""
+    if not task.done():
+        token.cancel()
+        task.cancel()
+
+
+async def run_cancellable(request, work: Awaitable[Any], poll: float = DISCONNECT_POLL_SECONDS) -> Any:
+    """
+    Ejecuta work y lo cancela si el cliente se desconecta antes de que
+    termine (lanza ClientDisconnected).
+    """
+    task, token = start_cancellable(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                count("requests_cancelled")
+                raise ClientDisconnected()
+    finally:
+        abandon(task, token)
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Float, JSON, ForeignKey, Text, Enum
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Float, JSON, ForeignKey, Text, Enum, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -180,6 +180,59 @@ class AppSetting(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+class ParsedDocument(Base):
+    """Resultado final de parseo de un documento, indexado por hash de contenido."""
+    __tablename__ = "parsed_documents"
+    __table_args__ = (
+        UniqueConstraint("content_hash", "method", name="uq_parsed_documents_hash_method"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(64), index=True)  # sha256 del archivo subido
+    method = Column(String, default="rules_ai")  # pipeline que generó el resultado
+    parser_version = Column(String)  # si no coincide con PARSER_VERSION, se ignora
+    items = Column(JSON)  # items normalizados (ParsedItem)
+    curso = Column(String, nullable=True)
+    raw_text_preview = Column(Text, nullable=True)
+    lines_count = Column(Integer, default=0)
+    dubious_sent_to_ai = Column(Integer, default=0)
+    hits = Column(Integer, default=0)  # veces que se reutilizó
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow)
+
+
+class LLMLineCache(Base):
+    """Items extraídos por el LLM para una línea dudosa normalizada."""
+    __tablename__ = "llm_line_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    line_hash = Column(String(64), unique=True, index=True)  # sha256(versión + línea normalizada)
+    normalized_line = Column(Text)
+    items = Column(JSON)  # lista (posiblemente vacía: el LLM la descartó)
+    parser_version = Column(String)
+    hits = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class QuoteJob(Base):
+    """Trabajo en segundo plano de parseo/cotización (sobrevive a reinicios)."""
+    __tablename__ = "quote_jobs"
+
+    id = Column(String(32), primary_key=True)  # uuid4 hex
+    kind = Column(String)  # "parse_quote" | "batch_quote"
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)  # None = demo
+    status = Column(String, default="queued", index=True)  # queued | running | done | error
+    stage = Column(String, nullable=True)  # parsing | quoting | done
+    params = Column(JSON)  # entrada ya validada (proveedores, items, archivo, límites)
+    progress = Column(JSON, nullable=True)  # contadores por etapa
+    partial_items = Column(JSON, nullable=True)  # {índice: item cotizado}
+    result = Column(JSON, nullable=True)  # misma respuesta que el endpoint síncrono
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)  # heartbeat mientras corre
+
+
 def get_db():
     db = SessionLocal()
     try:
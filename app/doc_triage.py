@@ -0,0 +1,158 @@
+"""
+Triage rápido de documentos antes de extraer.
+
+Mira las primeras páginas (densidad de texto, tablas, tasa de aciertos del
+parser de reglas sobre una muestra) y, en PDFs, revisa barato la capa de
+texto de todas las páginas; elige el camino más barato que va a funcionar:
+- "rules":    capa de texto buena y el parser de reglas entiende casi todo.
+- "rules_ai": hay texto, pero el parser de reglas no alcanza → LLM de texto.
+- "vision":   páginas escaneadas (sin capa de texto) o imágenes; si el resto
+              tiene texto, solo las escaneadas van a visión (documento mixto).
+"""
+import os
+from dataclasses import asdict, dataclass, field
+from itertools import islice
+from pathlib import Path
+from typing import List, Tuple
+
+from app.extractors import iter_pages
+from app.rules_parser import find_dubious_lines, parse_with_rules, split_lines
+
+TRIAGE_SAMPLE_PAGES = int(os.getenv("TRIAGE_SAMPLE_PAGES", "3"))
+TRIAGE_MIN_CHARS_PER_PAGE = int(os.getenv("TRIAGE_MIN_CHARS_PER_PAGE", "80"))
+TRIAGE_RULES_HIT_RATE = float(os.getenv("TRIAGE_RULES_HIT_RATE", "0.9"))
+TRIAGE_RULES_HIT_RATE_TABLES = float(os.getenv("TRIAGE_RULES_HIT_RATE_TABLES", "0.95"))
+TRIAGE_MIN_ITEMS = int(os.getenv("TRIAGE_MIN_ITEMS", "3"))
+
+ROUTE_RULES = "rules"
+ROUTE_RULES_AI = "rules_ai"
+ROUTE_VISION = "vision"
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+@dataclass
+class TriageResult:
+    route: str
+    reason: str
+    pages_sampled: int = 0
+    pages_total: int = 0
+    chars_per_page: List[int] = field(default_factory=list)
+    scanned_pages: List[int] = field(default_factory=list)  # índices 0-based, de todo el documento
+    tables: int = 0
+    rules_items: int = 0
+    rules_dubious: int = 0
+    text_route: str = ""  # camino de las páginas con texto si no se usa visión (rules / rules_ai)
+
+    @property
+    def rules_hit_rate(self) -> float:
+        total = self.rules_items + self.rules_dubious
+        return self.rules_items / total if total else 0.0
+
+    def to_dict(self) -> dict:
+        return dict(asdict(self), rules_hit_rate=round(self.rules_hit_rate, 3))
+
+
+def _rules_sample(result: TriageResult, text: str) -> None:
+    parsed = parse_with_rules(split_lines(text))
+    ok = [it for it in parsed["items"] if it.get("cantidad") is not None and it.get("detalle")]
+    result.rules_items = len(ok)
+    result.rules_dubious = len(find_dubious_lines(parsed))
+
+
+def _scanned_pdf_pages(path: Path) -> Tuple[int, List[int]]:
+    """
+    (n° de páginas, páginas sin capa de texto y con imágenes) de todo el PDF.
+    Usa pdfium (dependencia de pdfplumber): cuenta caracteres sin análisis de layout.
+    """
+    import pypdfium2 as pdfium
+    from pypdfium2 import raw as pdfium_c
+
+    pdf = pdfium.PdfDocument(str(path))
+    try:
+        scanned = []
+        for i in range(len(pdf)):
+            page = pdf[i]
+            try:
+                textpage = page.get_textpage()
+                chars = textpage.count_chars()
+                textpage.close()
+                if chars < TRIAGE_MIN_CHARS_PER_PAGE and next(
+                    page.get_objects(filter=[pdfium_c.FPDF_PAGEOBJ_IMAGE]), None
+                ) is not None:
+                    scanned.append(i)
+            finally:
+                page.close()
+        return len(pdf), scanned
+    finally:
+        pdf.close()
+
+
+def _sample_pdf(path: Path, result: TriageResult) -> str:
+    import pdfplumber
+
+    texts = []
+    sampled_scanned = []
+    with pdfplumber.open(str(path)) as pdf:
+        result.pages_total = len(pdf.pages)
+        for i, page in enumerate(pdf.pages[:TRIAGE_SAMPLE_PAGES]):
+            chars = len(page.chars)
+            result.chars_per_page.append(chars)
+            if chars < TRIAGE_MIN_CHARS_PER_PAGE:
+                if page.images:
+                    sampled_scanned.append(i)
+                continue
+            result.tables += len(page.find_tables())
+            texts.append(page.extract_text() or "")
+        result.pages_sampled = len(result.chars_per_page)
+
+    # Las escaneadas pueden estar después de la muestra: se revisan todas las páginas
+    try:
+        result.pages_total, result.scanned_pages = _scanned_pdf_pages(path)
+    except Exception as e:
+        print(f"⚠️  No se pudo revisar la capa de texto de todas las páginas: {e}")
+        result.scanned_pages = sampled_scanned
+    return "\n".join(texts)
+
+
+def decide_route(result: TriageResult) -> TriageResult:
+    """Regla de decisión sobre las métricas ya tomadas (separada para testear)."""
+    threshold = TRIAGE_RULES_HIT_RATE_TABLES if result.tables else TRIAGE_RULES_HIT_RATE
+    if result.rules_items >= TRIAGE_MIN_ITEMS and result.rules_hit_rate >= threshold:
+        result.route, result.reason = ROUTE_RULES, f"reglas reconocen {result.rules_hit_rate:.0%} de la muestra"
+    else:
+        result.route, result.reason = ROUTE_RULES_AI, f"reglas reconocen solo {result.rules_hit_rate:.0%} de la muestra"
+    result.text_route = result.route
+
+    if result.scanned_pages:
+        total = result.pages_total or result.pages_sampled
+        if len(result.scanned_pages) * 2 >= total:
+            result.reason = "páginas escaneadas sin capa de texto"
+        else:
+            result.reason = f"{len(result.scanned_pages)} de {total} páginas escaneadas (mixto)"
+        result.route = ROUTE_VISION
+    return result
+
+
+def triage_document(path: Path) -> TriageResult:
+    """Clasifica el documento (bloqueante: llamar vía threadpool desde endpoints)."""
+    ext = path.suffix.lower()
+    result = TriageResult(route=ROUTE_RULES_AI, reason="")
+    if ext in IMAGE_EXTENSIONS:
+        result.route, result.reason = ROUTE_VISION, "imagen"
+        return result
+
+    try:
+        if ext == ".pdf":
+            text = _sample_pdf(path, result)
+        else:
+            text = "\n".join(islice(iter_pages(path), 200))  # párrafos/filas
+            result.pages_sampled = 1
+            result.chars_per_page.append(len(text))
+    except Exception as e:
+        print(f"⚠️  Triage falló, se usa reglas + IA: {e}")
+        result.reason = "triage falló"
+        return result
+
+    _rules_sample(result, text)
+    return decide_route(result)
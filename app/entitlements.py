@@ -0,0 +1,145 @@
+"""
+Límites efectivos por usuario (entitlements), resueltos una vez y cacheados.
+
+Junta en una sola resolución lo que antes cada endpoint consultaba por su
+cuenta (setting plans_enabled, Subscription + Plan): el resultado se guarda
+en memoria con TTL y se invalida explícitamente cuando cambian planes,
+suscripciones o settings (update_plan, process_webhook, change_user_plan,
+set_setting_bool).
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from app.database import Plan, SessionLocal, Subscription
+from app.settings import get_setting_bool
+
+ENTITLEMENTS_TTL_SECONDS = float(os.getenv("ENTITLEMENTS_TTL_SECONDS", "60"))
+
+ALL_PROVIDERS = ["dimeiggs", "libreria_nacional", "jamila", "coloranimal", "pronobel", "prisa", "lasecretaria"]
+DEMO_PROVIDERS = ["dimeiggs", "libreria_nacional"]
+DEMO_MAX_ITEMS = 5
+DEMO_MAX_PROVIDERS = 2
+
+
+@dataclass(frozen=True)
+class Entitlements:
+    plans_enabled: bool
+    is_demo: bool  # sin login y con planes habilitados
+    is_paid: bool  # suscripción vigente a un plan distinto de free
+    plan_name: str
+    max_items: Optional[int]
+    max_providers: Optional[int]
+    monthly_limit: Optional[int]
+
+    @property
+    def limits(self) -> dict:
+        return {"max_items": self.max_items, "max_providers": self.max_providers, "monthly_limit": self.monthly_limit}
+
+    def limit_providers(self, requested: Optional[List[str]]) -> Tuple[List[str], bool]:
+        """Proveedores a usar según el plan y si se recortó lo pedido."""
+        if self.max_providers is None:
+            return (requested or list(ALL_PROVIDERS)), False
+        if self.is_demo:
+            if requested:
+                return requested[:DEMO_MAX_PROVIDERS], True
+            return list(DEMO_PROVIDERS), False
+        if requested and len(requested) > self.max_providers:
+            return requested[:self.max_providers], True
+        if not requested:
+            defaults = ALL_PROVIDERS[:5] if self.max_providers >= 5 else DEMO_PROVIDERS
+            return defaults[:self.max_providers], False
+        return requested, False
+
+
+_UNLIMITED = Entitlements(False, False, False, "unlimited", None, None, None)
+_DEMO = Entitlements(True, True, False, "demo", DEMO_MAX_ITEMS, DEMO_MAX_PROVIDERS, None)
+_FREE_DEFAULT = dict(max_items=5, max_providers=2, monthly_limit=None)
+
+# user_id (None = demo) -> (vence_en, Entitlements)
+_cache: Dict[Optional[int], Tuple[float, Entitlements]] = {}
+_lock = threading.Lock()
+_generation = 0  # sube con cada invalidación: no se guarda lo resuelto antes de ella
+stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+
+def _resolve(user_id: Optional[int], db) -> Tuple[Entitlements, Optional[datetime]]:
+    if not get_setting_bool(db, "plans_enabled", True):
+        return _UNLIMITED, None
+    if user_id is None:
+        return _DEMO, None
+
+    row = (
+        db.query(Subscription, Plan)
+        .outerjoin(Plan, Plan.id == Subscription.plan_id)
+        .filter(Subscription.user_id == user_id)
+        .first()
+    )
+    subscription, plan = row if row else (None, None)
+    if subscription is None:
+        plan = db.query(Plan).filter(Plan.name == "free").first()
+
+    limits = (
+        dict(max_items=plan.max_items, max_providers=plan.max_providers, monthly_limit=plan.monthly_limit)
+        if plan else _FREE_DEFAULT
+    )
+    expires_at = subscription.expires_at if subscription is not None else None
+    active = subscription is not None and not (expires_at and expires_at < datetime.utcnow())
+    # Igual que get_user_subscription: suscripción vencida = plan free
+    plan_name = plan.name if active and plan else "free"
+    return Entitlements(
+        plans_enabled=True,
+        is_demo=False,
+        is_paid=plan_name != "free",
+        plan_name=plan_name,
+        **limits,
+    ), expires_at if active else None
+
+
+def get_entitlements(user_id: Optional[int], db=None) -> Entitlements:
+    """
+    Límites efectivos del usuario (None = demo sin login). Se cachean
+    ENTITLEMENTS_TTL_SECONDS (o hasta que vence la suscripción, si es antes).
+    """
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(user_id)
+        if entry is not None and entry[0] > now:
+            stats["hits"] += 1
+            return entry[1]
+        stats["misses"] += 1
+        generation = _generation
+
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        ent, expires_at = _resolve(user_id, db)
+    except Exception as e:
+        print(f"❌ Error resolviendo límites del usuario {user_id}: {e}")
+        return Entitlements(True, user_id is None, False, "free", **_FREE_DEFAULT)
+    finally:
+        if own_session:
+            db.close()
+
+    ttl = ENTITLEMENTS_TTL_SECONDS
+    if expires_at is not None:
+        ttl = min(ttl, max(0.0, (expires_at - datetime.utcnow()).total_seconds()))
+    with _lock:
+        if generation == _generation:
+            _cache[user_id] = (now + ttl, ent)
+    return ent
+
+
+def invalidate_entitlements(user_id: Optional[int] = None) -> None:
+    """Descarta los límites cacheados de un usuario (o de todos si user_id es None)."""
+    global _generation
+    with _lock:
+        _generation += 1
+        stats["invalidations"] += 1
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
@@ -1,7 +1,5 @@
 from pathlib import Path
-import pdfplumber
-from docx import Document
-import pandas as pd
+from typing import Iterator
 import hashlib
 import json
 
@@ -30,58 +28,95 @@ def extract_from_pdf(path: Path, use_cache: bool = True) -> str:
         if cache_key in _PDF_CACHE:
             return _PDF_CACHE[cache_key]
     
-    parts = []
+    result = "\n".join(iter_pdf_pages(path))
     
+    if use_cache:
+        _PDF_CACHE[cache_key] = result
+    
+    return result
+
+def iter_pdf_pages(path: Path) -> Iterator[str]:
+    """
+    Itera el texto de un PDF página a página (sin caché).
+    Si la extracción normal falla a mitad de camino, reintenta con lazyload
+    saltando las páginas ya entregadas.
+    """
+    import pdfplumber  # import diferido: pesa y no todos los endpoints lo usan
+
+    done = 0
     try:
-        # Intenta extracción normal (más rápida)
         with pdfplumber.open(str(path)) as pdf:
             for page in pdf.pages:
                 text = page.extract_text()
+                done += 1
                 if text:
-                    parts.append(text)
+                    yield text
+        return
     except Exception as e:
-        # Si falla, intenta con configuración alternativa
         print(f"⚠️  PDF extraction warning: {e}")
-        try:
-            with pdfplumber.open(str(path), lazyload=True) as pdf:
-                for page in pdf.pages:
-                    text = page.extract_text()
-                    if text:
-                        parts.append(text)
-        except Exception as e2:
-            print(f"❌ PDF extraction failed: {e2}")
-            return ""
-    
-    result = "\n".join(parts)
-    
-    if use_cache:
-        _PDF_CACHE[cache_key] = result
-    
-    return result
 
-def extract_from_docx(path: Path) -> str:
-    """Extrae texto de documentos DOCX"""
+    try:
+        with pdfplumber.open(str(path), lazyload=True) as pdf:
+            for page in pdf.pages[done:]:
+                text = page.extract_text()
+                if text:
+                    yield text
+    except Exception as e2:
+        print(f"❌ PDF extraction failed: {e2}")
+
+def iter_docx_blocks(path: Path) -> Iterator[str]:
+    """Itera párrafos y filas de tablas de un DOCX"""
+    from docx import Document
+
     doc = Document(str(path))
-    parts = []
     for p in doc.paragraphs:
         if p.text.strip():
-            parts.append(p.text.strip())
+            yield p.text.strip()
     for t in doc.tables:
         for row in t.rows:
             cells = [c.text.strip() for c in row.cells if c.text.strip()]
             if cells:
-                parts.append(" ".join(cells))
-    return "\n".join(parts)
+                yield " ".join(cells)
+
+def extract_from_docx(path: Path) -> str:
+    """Extrae texto de documentos DOCX"""
+    return "\n".join(iter_docx_blocks(path))
+
+def iter_excel_rows(path: Path) -> Iterator[str]:
+    """Itera las filas no vacías de una hoja de cálculo Excel"""
+    import pandas as pd
 
-def extract_from_excel(path: Path) -> str:
-    """Extrae texto de hojas de cálculo Excel"""
     df = pd.read_excel(str(path), engine="openpyxl")
-    lines = []
     for _, row in df.iterrows():
         cells = [str(v).strip() for v in row.values if pd.notna(v)]
         if cells:
-            lines.append(" ".join(cells))
-    return "\n".join(lines)
+            yield " ".join(cells)
+
+def extract_from_excel(path: Path) -> str:
+    """Extrae texto de hojas de cálculo Excel"""
+    return "\n".join(iter_excel_rows(path))
+
+def iter_pages(path: Path) -> Iterator[str]:
+    """
+    Versión streaming de extract_text: entrega el texto por bloques
+    (página en PDF, párrafo/fila de tabla en DOCX, fila en Excel) para que
+    el parser de reglas trabaje sin materializar el documento completo.
+    """
+    ext = path.suffix.lower()
+    if ext == ".pdf":
+        cached = _PDF_CACHE.get(_get_cache_key(path))
+        if cached is not None:
+            yield cached
+            return
+        yield from iter_pdf_pages(path)
+        return
+    if ext == ".docx":
+        yield from iter_docx_blocks(path)
+        return
+    if ext in (".xlsx", ".xls"):
+        yield from iter_excel_rows(path)
+        return
+    raise ValueError(f"Tipo no soportado: {ext}")
 
 def extract_text(path: Path) -> str:
     """Extrae texto de PDF, DOCX o Excel"""
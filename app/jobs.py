@@ -0,0 +1,345 @@
+"""
+Trabajos en segundo plano para parseo + cotización.
+
+El endpoint de envío guarda el job (tabla quote_jobs) y responde de inmediato
+con su id; un pool de workers asyncio lo ejecuta y va persistiendo el avance
+por etapa (items parseados, cotizados, proveedores pendientes) y los items ya
+cotizados, que se consultan con GET /api/jobs/{id}.
+
+Al arrancar, recover_jobs() vuelve a encolar los jobs pendientes y los que
+quedaron "running" sin heartbeat (worker reiniciado). Cada job se toma con un
+UPDATE condicional, así que con varios procesos lo ejecuta uno solo.
+"""
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from app.database import QuoteJob, SessionLocal
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_FLUSH_SECONDS = float(os.getenv("JOB_FLUSH_SECONDS", "0.5"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "10"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_ERROR = "error"
+
+STAGE_PARSING = "parsing"
+STAGE_QUOTING = "quoting"
+STAGE_DONE = "done"
+
+
+class QuoteProgress:
+    """
+    Avance de un parseo + cotización. Los callbacks de proveedores llegan
+    desde threads del executor, por eso todo pasa por un lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = 0  # sube con cada cambio (para saber si hay que persistir)
+        self.items_version = 0  # sube solo cuando cambian los items cotizados
+        self.stage: Optional[str] = None
+        self.items_parsed = 0
+        self.items_total: Optional[int] = None  # se conoce al terminar el parseo
+        self.items_quoted = 0
+        self.providers_pending = 0
+        self._pending_by_item: Dict[int, int] = {}
+        self.quoted: Dict[int, Dict[str, Any]] = {}
+
+    def _touch(self) -> None:
+        self.version += 1
+
+    def set_stage(self, stage: str) -> None:
+        with self._lock:
+            self.stage = stage
+            self._touch()
+
+    def add_parsed(self, n: int) -> None:
+        with self._lock:
+            self.items_parsed += n
+            self._touch()
+
+    def set_total(self, n: int) -> None:
+        with self._lock:
+            self.items_total = n
+            self._touch()
+
+    def item_queued(self, index: int, n_providers: int) -> None:
+        with self._lock:
+            self._pending_by_item[index] = n_providers
+            self.providers_pending += n_providers
+            self._touch()
+
+    def provider_done(self, index: int, provider: str, hits: int, error: Optional[str]) -> None:
+        with self._lock:
+            if self._pending_by_item.get(index, 0) > 0:
+                self._pending_by_item[index] -= 1
+                self.providers_pending -= 1
+                self._touch()
+
+    def item_quoted(self, index: int, item: Dict[str, Any]) -> None:
+        with self._lock:
+            # items sin búsqueda (lectura, sin detalle) no pasan por provider_done
+            self.providers_pending -= self._pending_by_item.pop(index, 0)
+            self.items_quoted += 1
+            self.quoted[index] = item
+            self.items_version += 1
+            self._touch()
+
+    def counters(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "items_parsed": self.items_parsed,
+                "items_total": self.items_total,
+                "items_quoted": self.items_quoted,
+                "providers_pending": self.providers_pending,
+            }
+
+    def snapshot(self, items_since: int = -1):
+        """
+        (versión, etapa, contadores, versión de items, items cotizados) consistentes
+        entre sí; los items son None si no cambiaron desde items_since.
+        """
+        counters = self.counters()
+        with self._lock:
+            quoted = None
+            if self.items_version != items_since:
+                quoted = {str(i): it for i, it in self.quoted.items()}
+            return self.version, self.stage, counters, self.items_version, quoted
+
+
+JobRunner = Callable[[Dict[str, Any], QuoteProgress], Awaitable[Dict[str, Any]]]
+
+_runners: Dict[str, JobRunner] = {}
+_queue: Optional[asyncio.Queue] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_workers: List[asyncio.Task] = []
+_on_finish: Dict[str, Callable[[], None]] = {}  # job_id -> callback al terminar (p.ej. liberar cupo de admisión)
+stats = {"submitted": 0, "completed": 0, "failed": 0, "recovered": 0}
+
+
+def register_job_runner(kind: str):
+    """
+    Decorador: runner(params, progress) -> resultado final del job. El runner
+    abre sus propias sesiones cortas si necesita la DB (el job no retiene una).
+    """
+    def decorator(fn: JobRunner) -> JobRunner:
+        _runners[kind] = fn
+        return fn
+    return decorator
+
+
+def start_job_workers() -> None:
+    """Levanta el pool de workers en el loop actual (idempotente)."""
+    global _queue, _loop
+    loop = asyncio.get_running_loop()
+    if _loop is loop:
+        return
+    _loop, _queue = loop, asyncio.Queue()
+    _workers[:] = [loop.create_task(_worker()) for _ in range(JOB_WORKERS)]
+
+
+def _insert_job(job_id: str, kind: str, params: Dict[str, Any], user_id: Optional[int]) -> None:
+    db = SessionLocal()
+    try:
+        db.add(QuoteJob(id=job_id, kind=kind, user_id=user_id, status=STATUS_QUEUED, params=params))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def submit_job(
+    kind: str,
+    params: Dict[str, Any],
+    user_id: Optional[int] = None,
+    on_finish: Optional[Callable[[], None]] = None,
+) -> str:
+    """
+    Persiste el job (en un thread: no bloquea el event loop) y lo encola.
+    on_finish se llama cuando el job termina en este proceso, o de inmediato
+    si no se pudo guardar. Retorna el id.
+    """
+    if kind not in _runners:
+        raise ValueError(f"Tipo de job desconocido: {kind}")
+    job_id = uuid4().hex
+    try:
+        await asyncio.to_thread(_insert_job, job_id, kind, params, user_id)
+    except BaseException:
+        if on_finish is not None:
+            on_finish()
+        raise
+    if on_finish is not None:
+        _on_finish[job_id] = on_finish
+    stats["submitted"] += 1
+    start_job_workers()
+    _queue.put_nowait(job_id)
+    return job_id
+
+
+def recover_jobs() -> int:
+    """
+    Reencola los jobs pendientes y los "running" sin heartbeat reciente
+    (proceso reiniciado). Los que ya agotaron JOB_MAX_ATTEMPTS quedan en error.
+    """
+    start_job_workers()
+    stale_before = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+    db = SessionLocal()
+    try:
+        stale = db.query(QuoteJob).filter(
+            QuoteJob.status == STATUS_RUNNING,
+            QuoteJob.updated_at < stale_before,
+        ).all()
+        for job in stale:
+            if (job.attempts or 0) >= JOB_MAX_ATTEMPTS:
+                job.status, job.error = STATUS_ERROR, "El job se interrumpió demasiadas veces"
+            else:
+                job.status = STATUS_QUEUED
+            job.updated_at = datetime.utcnow()
+        db.commit()
+
+        queued = [job_id for (job_id,) in db.query(QuoteJob.id).filter(QuoteJob.status == STATUS_QUEUED)
+                  .order_by(QuoteJob.created_at)]
+    finally:
+        db.close()
+
+    for job_id in queued:
+        _queue.put_nowait(job_id)
+    stats["recovered"] += len(queued)
+    if queued:
+        print(f"🔁 {len(queued)} jobs reencolados")
+    return len(queued)
+
+
+async def _worker() -> None:
+    while True:
+        job_id = await _queue.get()
+        try:
+            await _run_job(job_id)
+        except Exception as e:
+            print(f"❌ Error ejecutando job {job_id}: {e}")
+        finally:
+            on_finish = _on_finish.pop(job_id, None)
+            if on_finish is not None:
+                on_finish()
+            _queue.task_done()
+
+
+# Las funciones de DB son síncronas y abren su propia sesión corta; desde los
+# workers se llaman con asyncio.to_thread para no frenar el event loop.
+
+def _claim(job_id: str) -> Optional[QuoteJob]:
+    """Toma el job (UPDATE condicional); None si otro worker/proceso ya lo tomó."""
+    db = SessionLocal()
+    try:
+        claimed = db.query(QuoteJob).filter(
+            QuoteJob.id == job_id,
+            QuoteJob.status == STATUS_QUEUED,
+        ).update({
+            QuoteJob.status: STATUS_RUNNING,
+            QuoteJob.attempts: QuoteJob.attempts + 1,
+            QuoteJob.updated_at: datetime.utcnow(),
+        }, synchronize_session=False)
+        db.commit()
+        if claimed != 1:
+            return None
+        job = db.get(QuoteJob, job_id)
+        db.expunge(job)
+        return job
+    finally:
+        db.close()
+
+
+def _save_progress(job_id: str, progress: QuoteProgress, items_since: int = -1, **extra) -> Tuple[int, int]:
+    """Guarda etapa, contadores y (solo si cambiaron) los items cotizados. Retorna (versión, versión de items)."""
+    version, stage, counters, items_version, quoted = progress.snapshot(items_since)
+    values = {
+        QuoteJob.stage: stage,
+        QuoteJob.progress: counters,
+        QuoteJob.updated_at: datetime.utcnow(),
+    }
+    if quoted is not None:
+        values[QuoteJob.partial_items] = quoted
+    values.update({getattr(QuoteJob, key): value for key, value in extra.items()})
+    db = SessionLocal()
+    try:
+        db.query(QuoteJob).filter(QuoteJob.id == job_id).update(values, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+    return version, items_version
+
+
+async def _flush_loop(job_id: str, progress: QuoteProgress, saved: List[int]) -> None:
+    """
+    Persiste el avance cuando cambia (como máximo cada JOB_FLUSH_SECONDS) y hace
+    heartbeat. saved = [versión, versión de items] ya persistidas.
+    """
+    saved_at = 0.0
+    try:
+        while True:
+            await asyncio.sleep(JOB_FLUSH_SECONDS)
+            if progress.version != saved[0] or time.monotonic() - saved_at >= JOB_HEARTBEAT_SECONDS:
+                saved[:] = await asyncio.to_thread(_save_progress, job_id, progress, saved[1])
+                saved_at = time.monotonic()
+    except Exception as e:
+        print(f"⚠️  No se pudo guardar el avance del job {job_id}: {e}")
+
+
+async def _run_job(job_id: str) -> None:
+    job = await asyncio.to_thread(_claim, job_id)
+    if job is None:
+        return  # otro worker/proceso lo tomó
+    runner = _runners.get(job.kind)
+    progress = QuoteProgress()
+    saved = [-1, -1]
+    flusher = asyncio.create_task(_flush_loop(job_id, progress, saved))
+    try:
+        if runner is None:
+            raise ValueError(f"Tipo de job desconocido: {job.kind}")
+        result = await runner(job.params or {}, progress)
+    except Exception as e:
+        print(f"❌ Job {job_id} ({job.kind}) falló: {e}")
+        stats["failed"] += 1
+        flusher.cancel()
+        await asyncio.to_thread(
+            _save_progress, job_id, progress, saved[1], status=STATUS_ERROR, error=str(e)[:500],
+        )
+        return
+    finally:
+        flusher.cancel()
+
+    stats["completed"] += 1
+    progress.set_stage(STAGE_DONE)
+    await asyncio.to_thread(_save_progress, job_id, progress, saved[1], status=STATUS_DONE, result=result)
+
+
+def get_job(db, job_id: str) -> Optional[QuoteJob]:
+    return db.query(QuoteJob).filter(QuoteJob.id == job_id).first()
+
+
+def job_to_dict(job: QuoteJob) -> Dict[str, Any]:
+    """Estado del job para el endpoint de polling (items parciales hasta que termina)."""
+    partial = job.partial_items or {}
+    data = {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "stage": job.stage,
+        "progress": job.progress or {},
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+    }
+    if job.status == STATUS_DONE:
+        data["result"] = job.result
+    else:
+        data["items"] = [dict(partial[key], index=int(key)) for key in sorted(partial, key=int)]
+    return data
@@ -0,0 +1,98 @@
+"""
+Parser JSON incremental para respuestas en streaming del LLM.
+
+El modelo responde {"curso": ..., "items": [{...}, {...}, ...]}. A medida que
+llegan los fragmentos se recorre el texto una sola vez (sin re-escanear con
+regex) y cada objeto de "items" se entrega apenas se cierra su llave.
+
+Los fragmentos se guardan en una lista; para escanear solo se mantiene la cola
+desde el inicio del item (o string) abierto, así el costo es lineal en el largo
+de la respuesta en vez de copiar todo el texto acumulado en cada fragmento.
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+
+class ItemStreamParser:
+    def __init__(self, array_key: str = "items"):
+        self.array_key = array_key
+        self._chunks: List[str] = []
+        self._buf = ""  # cola del texto aún necesaria para escanear/cortar items
+        self._offset = 0  # posición absoluta de _buf[0]
+        self._pos = 0  # posición absoluta del próximo carácter a escanear
+        # Pila de contenedores abiertos: ("{", None) o ("[", clave del arreglo)
+        self._stack: List[tuple] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._pending_key: Optional[str] = None
+        self._item_start: Optional[int] = None
+        self.items_seen = 0
+
+    @property
+    def text(self) -> str:
+        """Texto completo recibido (se une bajo demanda, típicamente al final)."""
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Agrega un fragmento y retorna los items que quedaron completos."""
+        if not chunk:
+            return []
+        self._chunks.append(chunk)
+
+        keep = self._pos
+        if self._in_string:
+            keep = min(keep, self._string_start)
+        if self._item_start is not None:
+            keep = min(keep, self._item_start)
+        buf = self._buf = self._buf[keep - self._offset:] + chunk
+        base = self._offset = keep
+        end = base + len(buf)
+        done: List[Dict[str, Any]] = []
+
+        for i in range(self._pos, end):
+            c = buf[i - base]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._last_string = buf[self._string_start + 1 - base:i - base]
+                continue
+
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c == ":":
+                self._pending_key = self._last_string
+            elif c == ",":
+                self._pending_key = None
+            elif c == "{":
+                # Objeto directamente dentro de {"items": [ ... ]} en el nivel superior
+                if len(self._stack) == 2 and self._stack[1] == ("[", self.array_key):
+                    self._item_start = i
+                self._stack.append(("{", None))
+                self._pending_key = None
+            elif c == "[":
+                self._stack.append(("[", self._pending_key))
+                self._pending_key = None
+            elif c in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if c == "}" and self._item_start is not None and len(self._stack) == 2:
+                    try:
+                        item = json.loads(buf[self._item_start - base:i + 1 - base])
+                    except ValueError:
+                        item = None
+                    if isinstance(item, dict):
+                        self.items_seen += 1
+                        done.append(item)
+                    self._item_start = None
+
+        self._pos = end
+        return done
@@ -0,0 +1,61 @@
+"""
+Búsqueda de múltiples palabras clave en una sola pasada (Aho-Corasick).
+Compartido por el parser de reglas y el validador de items del LLM.
+"""
+from __future__ import annotations
+
+from typing import Iterable, Optional
+
+# pyahocorasick - opcional, si no está se usa un escaneo precalculado
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    ahocorasick = None
+    AHOCORASICK_AVAILABLE = False
+
+
+class KeywordMatcher:
+    """
+    Detecta si un texto contiene (como substring, sin distinguir mayúsculas)
+    alguna de las palabras clave.
+
+    - Las palabras se pasan a mayúsculas una sola vez al construir.
+    - Se descartan las que contienen a otra palabra del conjunto
+      ("CUOTAS" ya queda cubierta por "CUOTA").
+    - Con pyahocorasick se recorre el texto una sola vez con el autómata;
+      sin él, se escanean las palabras ya normalizadas.
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        upper = {k.upper() for k in keywords if k}
+        self.keywords = tuple(sorted(
+            k for k in upper
+            if not any(other != k and other in k for other in upper)
+        ))
+        self._automaton = None
+        if AHOCORASICK_AVAILABLE and self.keywords:
+            automaton = ahocorasick.Automaton()
+            for k in self.keywords:
+                automaton.add_word(k, k)
+            automaton.make_automaton()
+            self._automaton = automaton
+
+    def find(self, *texts: str) -> Optional[str]:
+        """Retorna la primera palabra clave encontrada en alguno de los textos, o None."""
+        # Un separador que ninguna palabra clave contiene permite revisar
+        # varios campos en una sola pasada sin crear coincidencias falsas
+        text = "\n".join(t.upper() for t in texts if t)
+        if not text:
+            return None
+        if self._automaton is not None:
+            for _, keyword in self._automaton.iter(text):
+                return keyword
+            return None
+        for keyword in self.keywords:
+            if keyword in text:
+                return keyword
+        return None
+
+    def contains_any(self, *texts: str) -> bool:
+        return self.find(*texts) is not None
@@ -0,0 +1,209 @@
+"""
+Clasificador local liviano para líneas dudosas (item / no-item).
+
+Naive Bayes multinomial sobre n-gramas hasheados (palabras + trigramas de
+caracteres), entrenado offline con el historial del LLM guardado en
+llm_line_cache (ver scripts/train_line_classifier.py). Las líneas con alta
+confianza se resuelven localmente (cantidad/unidad por reglas) y solo las
+dudosas van a call_llm_fix.
+"""
+import json
+import math
+import os
+import re
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+LINE_CLASSIFIER_PATH = Path(os.getenv("LINE_CLASSIFIER_PATH", "models/line_classifier.json"))
+LINE_CLASSIFIER_ITEM_THRESHOLD = float(os.getenv("LINE_CLASSIFIER_ITEM_THRESHOLD", "0.95"))
+LINE_CLASSIFIER_SKIP_THRESHOLD = float(os.getenv("LINE_CLASSIFIER_SKIP_THRESHOLD", "0.05"))
+
+_WORD_RE = re.compile(r"[a-záéíóúñü]+|\d+")
+_SPACES_RE = re.compile(r"\s+")
+
+# "medio/media" solo es 1/2 (medio pliego, media resma): la única cantidad es la frase "media docena"
+NUMBER_WORDS = {
+    "un": 1, "una": 1, "uno": 1, "dos": 2, "tres": 3, "cuatro": 4, "cinco": 5,
+    "seis": 6, "siete": 7, "ocho": 8, "nueve": 9, "diez": 10, "once": 11,
+    "doce": 12, "quince": 15, "veinte": 20, "media docena": 6,
+}
+UNIT_WORDS = {
+    "caja": "caja", "cajas": "caja", "sobre": "sobre", "sobres": "sobre",
+    "pliego": "pliego", "pliegos": "pliego", "bolsa": "bolsa", "bolsas": "bolsa",
+    "resma": "resma", "resmas": "resma", "pack": "pack", "paquete": "pack", "paquetes": "pack",
+    "unidad": "unid", "unidades": "unid", "unid": "unid",
+}
+_QTY_RE = re.compile(
+    r"^\s*(?:(?P<num>\d{1,3})|(?P<word>"
+    + "|".join(w.replace(" ", r"\s+") for w in sorted(NUMBER_WORDS, key=len, reverse=True))
+    + r"))\b\s*"
+    r"(?:(?P<unit>" + "|".join(sorted(UNIT_WORDS, key=len, reverse=True)) + r")\b\s*(?:de\s+)?)?",
+    re.IGNORECASE,
+)
+_TRAILING_QTY_RE = re.compile(r"\s+(\d{1,3})\s*$")
+
+
+# Semillas de crc32 para separar los espacios de features (palabras, trigramas, forma)
+_WORD_SEED = zlib.crc32(b"w:")
+_GRAM_SEED = zlib.crc32(b"c:")
+_SHAPE_SEED = zlib.crc32(b"shape:")
+
+
+def _features(line: str, n_features: int) -> List[int]:
+    text = _SPACES_RE.sub(" ", line.strip().lower())
+    crc = zlib.crc32
+    words = _WORD_RE.findall(text)
+    feats = [crc(w.encode("utf-8"), _WORD_SEED) % n_features for w in words]
+    # forma de la línea: dígitos al inicio/fin, largo
+    shape = "%s%s%d" % ("d" if text[:1].isdigit() else "a", "d" if text[-1:].isdigit() else "a", min(len(words), 12))
+    feats.append(crc(shape.encode("ascii"), _SHAPE_SEED) % n_features)
+    # trigramas de bytes (utf-8) con bordes
+    padded = b" " + text.encode("utf-8") + b" "
+    feats.extend(crc(padded[i:i + 3], _GRAM_SEED) % n_features for i in range(len(padded) - 2))
+    return feats
+
+
+class LineClassifier:
+    """Naive Bayes multinomial con features hasheadas (inferencia en microsegundos, sin numpy)."""
+
+    def __init__(self, n_features: int = 2 ** 18, alpha: float = 1.0):
+        self.n_features = n_features
+        self.alpha = alpha
+        self.class_log_prior = [0.0, 0.0]
+        self.feature_log_prob: List[Dict[int, float]] = [{}, {}]
+        self.unseen_log_prob = [0.0, 0.0]
+        self._log_odds: Dict[int, float] = {}
+        self._unseen_log_odds = 0.0
+        self._prior_log_odds = 0.0
+
+    def _compile(self) -> None:
+        """Precalcula log P(f|item) - log P(f|no-item): una sola búsqueda por feature al predecir."""
+        lp0, lp1 = self.feature_log_prob
+        u0, u1 = self.unseen_log_prob
+        self._log_odds = {f: lp1.get(f, u1) - lp0.get(f, u0) for f in set(lp0) | set(lp1)}
+        self._unseen_log_odds = u1 - u0
+        self._prior_log_odds = self.class_log_prior[1] - self.class_log_prior[0]
+
+    def fit(self, lines: Iterable[str], labels: Iterable[bool]) -> "LineClassifier":
+        counts: List[Dict[int, float]] = [{}, {}]
+        docs = [0, 0]
+        for line, label in zip(lines, labels):
+            cls = 1 if label else 0
+            docs[cls] += 1
+            for f in _features(line, self.n_features):
+                counts[cls][f] = counts[cls].get(f, 0) + 1
+
+        total_docs = sum(docs)
+        for cls in (0, 1):
+            self.class_log_prior[cls] = math.log((docs[cls] + 1) / (total_docs + 2))
+            denom = sum(counts[cls].values()) + self.alpha * self.n_features
+            self.feature_log_prob[cls] = {f: math.log((c + self.alpha) / denom) for f, c in counts[cls].items()}
+            self.unseen_log_prob[cls] = math.log(self.alpha / denom)
+        self._compile()
+        return self
+
+    def predict_proba(self, line: str) -> float:
+        """Probabilidad de que la línea sea un útil escolar."""
+        log_odds, unseen = self._log_odds, self._unseen_log_odds
+        score = self._prior_log_odds
+        for f in _features(line, self.n_features):
+            score += log_odds.get(f, unseen)
+        score = max(min(score, 700.0), -700.0)
+        return 1.0 / (1.0 + math.exp(-score))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "n_features": self.n_features,
+            "alpha": self.alpha,
+            "class_log_prior": self.class_log_prior,
+            "feature_log_prob": [{str(k): v for k, v in probs.items()} for probs in self.feature_log_prob],
+            "unseen_log_prob": self.unseen_log_prob,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LineClassifier":
+        model = cls(n_features=data["n_features"], alpha=data["alpha"])
+        model.class_log_prior = data["class_log_prior"]
+        model.feature_log_prob = [{int(k): v for k, v in probs.items()} for probs in data["feature_log_prob"]]
+        model.unseen_log_prob = data["unseen_log_prob"]
+        model._compile()
+        return model
+
+    def save(self, path: Path = LINE_CLASSIFIER_PATH) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_dict()), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: Path = LINE_CLASSIFIER_PATH) -> "LineClassifier":
+        return cls.from_dict(json.loads(Path(path).read_text(encoding="utf-8")))
+
+
+def extract_quantity_unit(line: str) -> Tuple[Optional[int], Optional[str], str]:
+    """(cantidad, unidad, detalle) de líneas tipo "dos cajas de lápices" o "Témpera 12 colores 2"."""
+    text = line.strip()
+    m = _QTY_RE.match(text)
+    if m and (m.group("num") or m.group("word")):
+        word = _SPACES_RE.sub(" ", (m.group("word") or "").lower())
+        qty = int(m.group("num")) if m.group("num") else NUMBER_WORDS[word]
+        unit = UNIT_WORDS.get((m.group("unit") or "").lower())
+        detail = text[m.end():].strip()
+        if " " in word:  # "media docena de lápices"
+            detail = re.sub(r"^de\s+", "", detail, flags=re.IGNORECASE)
+        if detail:
+            return qty, unit, detail
+    m = _TRAILING_QTY_RE.search(text)
+    if m:
+        return int(m.group(1)), None, text[:m.start()].strip()
+    return None, None, text
+
+
+_model: Optional[LineClassifier] = None
+_model_loaded = False
+
+
+def get_classifier() -> Optional[LineClassifier]:
+    """Modelo entrenado (se carga una vez); None si no hay archivo → todo va al LLM."""
+    global _model, _model_loaded
+    if not _model_loaded:
+        _model_loaded = True
+        if LINE_CLASSIFIER_PATH.exists():
+            try:
+                _model = LineClassifier.load(LINE_CLASSIFIER_PATH)
+                print(f"✅ Clasificador local de líneas cargado ({LINE_CLASSIFIER_PATH})")
+            except Exception as e:
+                print(f"⚠️  No se pudo cargar el clasificador de líneas: {e}")
+    return _model
+
+
+def classify_lines(lines: List[str], model: Optional[LineClassifier] = None):
+    """
+    Separa las líneas en resueltas localmente y dudosas para el LLM.
+    Retorna (resueltas: línea -> items, pendientes: [líneas]).
+    """
+    model = model or get_classifier()
+    if model is None:
+        return {}, list(lines)
+
+    resolved: Dict[str, List[Dict[str, Any]]] = {}
+    pending: List[str] = []
+    for line in lines:
+        p_item = model.predict_proba(line)
+        if p_item <= LINE_CLASSIFIER_SKIP_THRESHOLD:
+            resolved[line] = []
+            continue
+        if p_item >= LINE_CLASSIFIER_ITEM_THRESHOLD:
+            qty, unit, detail = extract_quantity_unit(line)
+            if qty and detail:
+                resolved[line] = [{
+                    "asignatura": None,
+                    "detalle": detail,
+                    "cantidad": qty,
+                    "unidad": unit,
+                    "item_original": line,
+                    "confianza": round(p_item, 3),
+                }]
+                continue
+        pending.append(line)
+    return resolved, pending
@@ -0,0 +1,179 @@
+"""
+Micro-batching de llamadas call_llm_fix entre requests concurrentes.
+
+En horas peak muchas familias suben listas en el mismo segundo, y cada una
+manda un prompt chico (3-10 líneas dudosas) pagando el PROMPT_TEMPLATE
+completo. El batcher junta las líneas que llegan dentro de una ventana corta,
+hace una sola llamada con ids de línea y devuelve a cada request sus items.
+"""
+import asyncio
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.cancellation import count
+from app.llm_client import acall_llm_fix, acall_llm_fix_with_ids, get_llm_priority, set_llm_priority
+
+LLM_BATCH_WINDOW_MS = int(os.getenv("LLM_BATCH_WINDOW_MS", "100"))  # 0 = sin batching
+LLM_BATCH_MAX_LINES = int(os.getenv("LLM_BATCH_MAX_LINES", "80"))
+
+_SPACES_RE = re.compile(r"\s+")
+
+
+def _key(text: str) -> str:
+    return _SPACES_RE.sub(" ", (text or "").strip().lower())
+
+
+class LLMFixBatcher:
+    """
+    Acumula líneas de varias requests por window_ms (o hasta max_lines) y
+    las resuelve con una sola llamada al LLM. Líneas iguales de distintas
+    requests se envían una vez y su resultado se entrega a todas.
+    """
+
+    def __init__(self, window_ms: int = LLM_BATCH_WINDOW_MS, max_lines: int = LLM_BATCH_MAX_LINES, fix_fn=None):
+        self.window = window_ms / 1000
+        self.max_lines = max_lines
+        self._fix_fn = fix_fn or acall_llm_fix_with_ids
+        self._pending: List[Tuple[List[str], asyncio.Future, int]] = []
+        self._pending_lines = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.batches_sent = 0
+        self.orphans_dropped = 0  # items sin línea de origen en batches de varias requests
+
+    async def submit(self, lines: List[str]) -> dict:
+        """Mismo contrato que acall_llm_fix: {"curso": None, "items": [...]}."""
+        if not lines:
+            return {"curso": None, "items": []}
+        if self.window <= 0:
+            return await acall_llm_fix(lines)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((list(lines), future, get_llm_priority()))
+        self._pending_lines += len(lines)
+
+        if self._pending_lines >= self.max_lines:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._pending_lines = self._pending, [], 0
+        if batch:
+            asyncio.get_running_loop().create_task(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[List[str], asyncio.Future, int]]) -> None:
+        # Requests que ya se cancelaron (cliente desconectado) no aportan líneas
+        live = [entry for entry in batch if not entry[1].done()]
+        if not live:
+            return
+        # El batch hereda la prioridad más alta de sus requests (el task tiene su propio contexto)
+        set_llm_priority(min(priority for _, _, priority in live))
+        batch = [(lines, fut) for lines, fut, _ in live]
+
+        ids: Dict[str, str] = {}  # línea normalizada -> line_id
+        entries: List[Tuple[str, str]] = []
+        for lines, _ in batch:
+            for text in lines:
+                key = _key(text)
+                if key not in ids:
+                    ids[key] = f"L{len(entries) + 1}"
+                    entries.append((ids[key], text))
+
+        # Si todas las requests del batch se cancelan durante la llamada, se corta
+        task = asyncio.current_task()
+
+        def abandon_if_orphan(_):
+            if all(fut.cancelled() for _, fut in batch) and not task.done():
+                count("llm_calls_cancelled")
+                task.cancel()
+
+        for _, fut in batch:
+            fut.add_done_callback(abandon_if_orphan)
+
+        try:
+            self.batches_sent += 1
+            result = await self._fix_fn(entries)
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+
+        by_id, orphans = self._route(result, entries, ids)
+        waiting = [(lines, fut) for lines, fut in batch if not fut.done()]
+        if orphans and len(waiting) > 1:
+            # No se sabe de qué request vienen: se descartan y las líneas sin
+            # items de cada request se vuelven a pedir solo con sus líneas
+            self.orphans_dropped += len(orphans)
+            print(f"⚠️  {len(orphans)} items del batch sin línea de origen: se repiten las líneas sin items por request")
+            await asyncio.gather(*(self._resolve_alone(lines, fut, by_id, ids) for lines, fut in waiting))
+            return
+        for lines, fut in waiting:
+            # Con una sola request los items sin línea de origen son suyos (van
+            # como no asignados; el cache por línea no guarda esas líneas como vacías)
+            items = self._items_for(lines, by_id, ids)
+            items.extend(dict(it) for it in orphans)
+            fut.set_result({"curso": None, "items": items})
+
+    @staticmethod
+    def _items_for(lines: List[str], by_id: Dict[str, List[Dict[str, Any]]], ids: Dict[str, str]) -> List[Dict[str, Any]]:
+        items: List[Dict[str, Any]] = []
+        for text in dict.fromkeys(lines):
+            for it in by_id.get(ids[_key(text)], []):
+                items.append({**it, "item_original": text})
+        return items
+
+    async def _resolve_alone(self, lines: List[str], fut: asyncio.Future, by_id, ids: Dict[str, str]) -> None:
+        """Entrega los items ya ruteados y repite, solo para esta request, sus líneas sin items."""
+        items = self._items_for(lines, by_id, ids)
+        unmatched = [text for text in dict.fromkeys(lines) if ids[_key(text)] not in by_id]
+        if unmatched and not fut.done():
+            own_ids: Dict[str, str] = {}
+            own_entries: List[Tuple[str, str]] = []
+            for text in unmatched:
+                if _key(text) not in own_ids:
+                    own_ids[_key(text)] = f"L{len(own_entries) + 1}"
+                    own_entries.append((own_ids[_key(text)], text))
+            try:
+                self.batches_sent += 1
+                result = await self._fix_fn(own_entries)
+            except Exception as e:
+                print(f"⚠️  Reintento de líneas sin items falló: {e}")
+            else:
+                own_by_id, own_orphans = self._route(result, own_entries, own_ids)
+                items.extend(self._items_for(unmatched, own_by_id, own_ids))
+                items.extend(dict(it) for it in own_orphans)
+        if not fut.done():
+            fut.set_result({"curso": None, "items": items})
+
+    @staticmethod
+    def _route(result: dict, entries: List[Tuple[str, str]], ids: Dict[str, str]):
+        """
+        Agrupa items por line_id; si el modelo no lo devolvió, usa item_original.
+        Retorna (items por line_id, items sin línea de origen).
+        """
+        valid_ids = {line_id for line_id, _ in entries}
+        by_id: Dict[str, List[Dict[str, Any]]] = {}
+        orphans: List[Dict[str, Any]] = []
+        raw_items = result.get("items") if isinstance(result, dict) else []
+        for it in raw_items or []:
+            if not isinstance(it, dict):
+                continue
+            line_id = str(it.pop("line_id", "") or "").strip("[] ")
+            if line_id not in valid_ids:
+                line_id = ids.get(_key(it.get("item_original") or ""))
+            if line_id is None:
+                orphans.append(it)
+            else:
+                by_id.setdefault(line_id, []).append(it)
+        return by_id, orphans
+
+
+fix_batcher = LLMFixBatcher()
@@ -1,10 +1,19 @@
+import asyncio
+import heapq
+import itertools
 import json
 import re
 import os
-import base64
+import time
+from collections import deque
+from contextvars import ContextVar
 from pathlib import Path
-from openai import OpenAI
+from typing import AsyncIterator, Optional
 from app.schemas import ParsedList
+from app.keyword_matcher import KeywordMatcher
+from app.text_chunker import TextChunk, chunk_text
+from app.llm_router import LLMBackend, LLMRouter
+from app.json_stream import ItemStreamParser
 
 # Configuración de proveedores LLM
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq").lower()  # groq (gratis) o openai
@@ -20,19 +29,57 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 OPENAI_VISION_MODEL = os.getenv("OPENAI_VISION_MODEL", "gpt-4o")
 
-# Inicializar cliente según el proveedor
-client = None
-if LLM_PROVIDER == "groq" and GROQ_API_KEY:
-    client = OpenAI(
-        api_key=GROQ_API_KEY,
-        base_url="https://api.groq.com/openai/v1"
-    )
-    print("✅ Usando Groq (GRATIS) para extracción con IA")
-elif LLM_PROVIDER == "openai" and OPENAI_API_KEY:
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    print("✅ Usando OpenAI para extracción con IA")
-else:
-    print("⚠️  WARNING: No hay LLM configurado. Configure GROQ_API_KEY (gratis) o OPENAI_API_KEY")
+# Timeouts: por intento (cliente HTTP) y plazo total de la llamada incluyendo reintentos
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "120"))
+
+# Extracción del documento completo: tamaño de chunk y chunks simultáneos
+LLM_CHUNK_CHARS = int(os.getenv("LLM_CHUNK_CHARS", "6000"))
+LLM_CHUNK_CONCURRENCY = int(os.getenv("LLM_CHUNK_CONCURRENCY", "4"))
+
+# Backends async entre los que se rutean las llamadas de los endpoints
+# (ver llm_router). "local" apunta a un servidor compatible con OpenAI, p.ej.
+# scripts/llm_standin_server.py para tests y benchmarks.
+LLM_BACKENDS = [b.strip().lower() for b in os.getenv("LLM_BACKENDS", LLM_PROVIDER).split(",") if b.strip()]
+LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() in ("1", "true", "yes")
+LOCAL_LLM_BASE_URL = os.getenv("LOCAL_LLM_BASE_URL", "http://127.0.0.1:8089/v1")
+LOCAL_LLM_MODEL = os.getenv("LOCAL_LLM_MODEL", "standin")
+
+# Los clientes (y el SDK de openai) se crean recién en la primera llamada:
+# importar este módulo no tiene efectos secundarios (ver log_llm_config).
+client = None  # cliente síncrono (scripts y tests manuales), ver get_client()
+
+
+def _sync_client_kwargs() -> Optional[dict]:
+    if LLM_PROVIDER == "groq" and GROQ_API_KEY:
+        return {"api_key": GROQ_API_KEY, "base_url": "https://api.groq.com/openai/v1"}
+    if LLM_PROVIDER == "openai" and OPENAI_API_KEY:
+        return {"api_key": OPENAI_API_KEY}
+    return None
+
+
+def get_client():
+    """Cliente síncrono según el proveedor (None si no hay API key)."""
+    global client
+    if client is None:
+        kwargs = _sync_client_kwargs()
+        if kwargs:
+            from openai import OpenAI
+            client = OpenAI(timeout=LLM_TIMEOUT_SECONDS, max_retries=LLM_MAX_RETRIES, **kwargs)
+    return client
+
+
+def log_llm_config() -> None:
+    """Informa el proveedor configurado (hook de startup; no crea clientes)."""
+    if LLM_PROVIDER == "groq" and GROQ_API_KEY:
+        print("✅ Usando Groq (GRATIS) para extracción con IA")
+    elif LLM_PROVIDER == "openai" and OPENAI_API_KEY:
+        print("✅ Usando OpenAI para extracción con IA")
+    elif "local" not in LLM_BACKENDS:
+        print("⚠️  WARNING: No hay LLM configurado. Configure GROQ_API_KEY (gratis) o OPENAI_API_KEY")
+    if len(LLM_BACKENDS) > 1:
+        print(f"✅ Backends LLM: {', '.join(LLM_BACKENDS)} (hedge: {'sí' if LLM_HEDGE else 'no'})")
 
 # Función helper para obtener el modelo correcto
 def get_model(use_vision: bool = False) -> str:
@@ -145,6 +192,8 @@ INVALID_KEYWORDS = {
     "abiertos", "cerrados", "cerrado",
     "covid", "sanitario",
 }
+_INVALID_MATCHER = KeywordMatcher(INVALID_KEYWORDS)
+_TIME_RE = re.compile(r"^\d{1,2}:\d{2}\s+(hrs|horas)")
 
 def validate_llm_items(items: list) -> list:
     """
@@ -156,14 +205,8 @@ def validate_llm_items(items: list) -> list:
         detalle = (item.get("detalle") or "").strip().upper()
         original = (item.get("item_original") or "").strip().upper()
         
-        # Revisar si contiene palabras clave inválidas
-        is_invalid = False
-        for keyword in INVALID_KEYWORDS:
-            if keyword.upper() in detalle or keyword.upper() in original:
-                is_invalid = True
-                break
-        
-        if is_invalid:
+        # Revisar si contiene palabras clave inválidas (una pasada, ver KeywordMatcher)
+        if _INVALID_MATCHER.contains_any(detalle, original):
             continue
         
         # Debe tener cantidad
@@ -179,7 +222,7 @@ def validate_llm_items(items: list) -> list:
             continue
         
         # Patrones de horarios
-        if re.search(r"^\d{1,2}:\d{2}\s+(hrs|horas)", detalle):
+        if _TIME_RE.search(detalle):
             continue
         
         valid_items.append(item)
@@ -188,16 +231,10 @@ def validate_llm_items(items: list) -> list:
 
 
 
-def call_llm_fix(dub_lines: list[str]) -> dict:
-    """
-    Llama al LLM para extraer útiles de líneas dudosas.
-    """
-    if not client:
-        raise RuntimeError("LLM no configurado. Configure GROQ_API_KEY o OPENAI_API_KEY")
-    
+def _fix_request(dub_lines: list[str]) -> dict:
+    """Argumentos de chat.completions.create para corregir líneas dudosas."""
     prompt = PROMPT_TEMPLATE.format(content="\n".join(dub_lines))
-
-    response = client.chat.completions.create(
+    return dict(
         model=get_model(use_vision=False),
         messages=[
             {"role": "system", "content": "Responde SOLO en JSON válido. Sin texto extra."},
@@ -207,46 +244,426 @@ def call_llm_fix(dub_lines: list[str]) -> dict:
         response_format={"type": "json_object"} if LLM_PROVIDER == "openai" else None
     )
 
+
+def _parse_response(response, ensure_shape: bool = False) -> dict:
+    """Extrae el JSON de la respuesta, valida items y (opcional) asegura curso/items."""
     raw = response.choices[0].message.content
 
     # Extraer JSON de la respuesta
     json_str = _extract_json(raw)
     result = json.loads(json_str)
-    
+
     # Post-procesamiento: validar y filtrar items inválidos
     if "items" in result:
         result["items"] = validate_llm_items(result["items"])
-    
+
+    if ensure_shape:
+        if "curso" not in result:
+            result["curso"] = None
+        if "items" not in result:
+            result["items"] = []
+
     return result
 
 
-def _encode_image_to_base64(image_path: Path) -> str:
-    """Codifica una imagen a base64 para enviarla a la API de OpenAI"""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+# ============================================================================
+# SCHEDULER DE LLAMADAS
+# Groq (free tier) y OpenAI limitan requests y tokens por minuto. En vez de
+# fallar en ráfagas, cada llamada estima sus tokens, espera turno en una cola
+# por prioridad (pagados primero) hasta que el presupuesto de la ventana de
+# 60 s lo permita, y ante un 429 se bloquea el backend el tiempo que indican
+# los headers de reset.
+# ============================================================================
+
+PRIORITY_PAID = 0
+PRIORITY_FREE = 1
+PRIORITY_DEMO = 2
+
+_llm_priority: ContextVar[int] = ContextVar("llm_priority", default=PRIORITY_FREE)
+
+# (RPM, TPM) por defecto de cada proveedor; se pueden sobreescribir por env
+_DEFAULT_RATE_LIMITS = {"groq": (30, 12000), "openai": (500, 200000), "local": (10000, 10_000_000)}
+LLM_RPM = int(os.getenv("LLM_RPM", _DEFAULT_RATE_LIMITS.get(LLM_PROVIDER, (60, 60000))[0]))
+LLM_TPM = int(os.getenv("LLM_TPM", _DEFAULT_RATE_LIMITS.get(LLM_PROVIDER, (60, 60000))[1]))
+LLM_QUEUE_MAX_WAIT_SECONDS = float(os.getenv("LLM_QUEUE_MAX_WAIT_SECONDS", "60"))
+LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "3"))
+
+
+class LLMQueueTimeout(RuntimeError):
+    """La llamada no obtuvo turno dentro de LLM_QUEUE_MAX_WAIT_SECONDS."""
+
+
+def set_llm_priority(priority: int) -> None:
+    """Prioridad de las llamadas al LLM hechas desde el contexto actual (request)."""
+    _llm_priority.set(priority)
+
+
+def get_llm_priority() -> int:
+    return _llm_priority.get()
+
+
+def estimate_tokens(request: dict) -> int:
+    """Estimación barata: ~4 caracteres por token de entrada + salida esperada."""
+    chars = 0
+    for message in request.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                # Imágenes: ~1000 tokens cada una
+                chars += len(part.get("text", "")) if part.get("type") == "text" else 4000
+    return chars // 4 + (request.get("max_tokens") or 1024)
+
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_reset_duration(value) -> Optional[float]:
+    """Segundos a partir de "30", "7.66s", "2m59.56s" o "120ms"."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def rate_limit_reset_seconds(headers) -> Optional[float]:
+    """Tiempo de espera indicado por un 429 (retry-after o x-ratelimit-reset-*)."""
+    if not headers:
+        return None
+    retry_after = parse_reset_duration(headers.get("retry-after"))
+    if retry_after is not None:
+        return retry_after
+    resets = [
+        parse_reset_duration(headers.get(h))
+        for h in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")
+    ]
+    resets = [r for r in resets if r is not None]
+    return max(resets) if resets else None
+
+
+class RateBudget:
+    """Requests y tokens consumidos por un backend en una ventana móvil de 60 s."""
+
+    WINDOW = 60.0
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.blocked_until = 0.0
+        self._events = deque()  # (timestamp, tokens)
+        self._tokens = 0
+
+    def _prune(self, now: float) -> None:
+        while self._events and now - self._events[0][0] >= self.WINDOW:
+            _, tokens = self._events.popleft()
+            self._tokens -= tokens
+
+    def wait_time(self, tokens: int, now: Optional[float] = None) -> float:
+        """Segundos hasta que una llamada de `tokens` quepa en el presupuesto."""
+        now = time.monotonic() if now is None else now
+        self._prune(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if not self._events:
+            # Ventana vacía: incluso una llamada más grande que el TPM debe poder salir
+            return 0.0
+
+        wait = 0.0
+        if len(self._events) >= self.rpm:
+            oldest_needed = self._events[len(self._events) - self.rpm][0]
+            wait = max(wait, self.WINDOW - (now - oldest_needed))
+        excess = self._tokens + tokens - self.tpm
+        if excess > 0:
+            freed = 0
+            for ts, used in self._events:
+                freed += used
+                if freed >= excess:
+                    wait = max(wait, self.WINDOW - (now - ts))
+                    break
+        return max(wait, 0.0)
+
+    def record(self, tokens: int, now: Optional[float] = None) -> None:
+        self._events.append((time.monotonic() if now is None else now, tokens))
+        self._tokens += tokens
+
+    def block_for(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class LLMScheduler:
+    """Cola por prioridad (y orden de llegada) frente al presupuesto de un backend."""
+
+    def __init__(self, budget: RateBudget):
+        self.budget = budget
+        self.stats = {"calls": 0, "rate_limited": 0, "queue_timeouts": 0, "max_queue_wait_s": 0.0}
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond: Optional[asyncio.Condition] = None
+        self._loop = None
+
+    def _condition(self) -> asyncio.Condition:
+        # Las primitivas de asyncio quedan atadas a un loop (tests usan varios)
+        loop = asyncio.get_running_loop()
+        if self._cond is None or self._loop is not loop:
+            self._cond = asyncio.Condition()
+            self._loop = loop
+            self._heap = []
+        return self._cond
+
+    async def acquire(self, tokens: int, priority: int = PRIORITY_FREE) -> None:
+        cond = self._condition()
+        entry = (priority, next(self._seq))
+        start = time.monotonic()
+        async with cond:
+            heapq.heappush(self._heap, entry)
+            try:
+                while True:
+                    wait = None
+                    if self._heap[0] == entry:
+                        wait = self.budget.wait_time(tokens)
+                        if wait <= 0:
+                            break
+                    remaining = LLM_QUEUE_MAX_WAIT_SECONDS - (time.monotonic() - start)
+                    if remaining <= 0:
+                        self.stats["queue_timeouts"] += 1
+                        raise LLMQueueTimeout("Cola del LLM saturada, intente más tarde")
+                    try:
+                        await asyncio.wait_for(cond.wait(), remaining if wait is None else min(wait, remaining))
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                self._heap.remove(entry)
+                heapq.heapify(self._heap)
+                cond.notify_all()
+                raise
+
+            heapq.heappop(self._heap)
+            self.budget.record(tokens)
+            self.stats["calls"] += 1
+            self.stats["max_queue_wait_s"] = max(self.stats["max_queue_wait_s"], time.monotonic() - start)
+            cond.notify_all()
+
+
+def _rate_limits(name: str):
+    """(RPM, TPM) del backend: GROQ_RPM/GROQ_TPM, etc.; LLM_RPM/LLM_TPM para el principal."""
+    rpm, tpm = _DEFAULT_RATE_LIMITS.get(name, (60, 60000))
+    if name == LLM_PROVIDER:
+        rpm, tpm = LLM_RPM, LLM_TPM
+    return (
+        int(os.getenv(f"{name.upper()}_RPM", rpm)),
+        int(os.getenv(f"{name.upper()}_TPM", tpm)),
+    )
+
+
+def _backend_settings(name: str):
+    """(kwargs del cliente, modelo, modelo visión, json_mode) o None si falta configuración."""
+    if name == "groq" and GROQ_API_KEY:
+        return {"api_key": GROQ_API_KEY, "base_url": "https://api.groq.com/openai/v1"}, GROQ_MODEL, GROQ_VISION_MODEL, False
+    if name == "openai" and OPENAI_API_KEY:
+        return {"api_key": OPENAI_API_KEY}, OPENAI_MODEL, OPENAI_VISION_MODEL, True
+    if name == "local":
+        kwargs = {"api_key": os.getenv("LOCAL_LLM_API_KEY", "local"), "base_url": LOCAL_LLM_BASE_URL}
+        return kwargs, LOCAL_LLM_MODEL, LOCAL_LLM_MODEL, False
+    return None
+
+
+def build_router(names=None, hedge: bool = LLM_HEDGE) -> LLMRouter:
+    """Un AsyncOpenAI por backend: cada uno mantiene su pool de conexiones compartido."""
+    from openai import AsyncOpenAI
+
+    backends = []
+    for name in names if names is not None else LLM_BACKENDS:
+        settings = _backend_settings(name)
+        if settings is None:
+            continue
+        kwargs, model, vision_model, json_mode = settings
+        backends.append(LLMBackend(
+            name=name,
+            client=AsyncOpenAI(timeout=LLM_TIMEOUT_SECONDS, max_retries=LLM_MAX_RETRIES, **kwargs),
+            model=model,
+            vision_model=vision_model,
+            json_mode=json_mode,
+            scheduler=LLMScheduler(RateBudget(*_rate_limits(name))),
+        ))
+    return LLMRouter(backends, hedge=hedge)
+
+
+router: Optional[LLMRouter] = None  # se construye en la primera llamada (get_router)
+
+
+def get_router() -> LLMRouter:
+    global router
+    if router is None:
+        router = build_router()
+    return router
+
+
+def get_scheduler(backend: Optional[str] = None) -> LLMScheduler:
+    for b in get_router().backends:
+        if backend is None or b.name == backend:
+            return b.scheduler
+    raise KeyError(backend)
+
+
+async def _acreate_on(backend: LLMBackend, request: dict, tokens: int, priority: int):
+    """
+    Llamada a un backend pasando por su scheduler, con reintentos ante 429.
+    LLM_DEADLINE_SECONDS acota el total (espera en cola + intentos + backoff).
+    """
+    from openai import RateLimitError
+
+    scheduler = backend.scheduler
+    async with asyncio.timeout(LLM_DEADLINE_SECONDS):
+        for attempt in range(LLM_RATE_LIMIT_RETRIES + 1):
+            await scheduler.acquire(tokens, priority)
+            try:
+                return await backend.client.chat.completions.create(**request)
+            except RateLimitError as e:
+                scheduler.stats["rate_limited"] += 1
+                if attempt == LLM_RATE_LIMIT_RETRIES:
+                    raise
+                headers = e.response.headers if getattr(e, "response", None) is not None else None
+                reset = rate_limit_reset_seconds(headers)
+                if reset is None:
+                    reset = min(2 ** attempt, 30)
+                scheduler.budget.block_for(reset)
+                print(f"⏳ LLM {backend.name} con rate limit (429), reintentando en {reset:.1f}s")
+
+
+async def _acreate(use_vision: bool = False, **kwargs):
+    """
+    Llamada async al LLM: el router elige el backend (y opcionalmente hace
+    hedge), cada backend aplica su scheduler. El plazo total cubre todos los
+    reintentos en el backend; si la request que espera se cancela (cliente
+    desconectado, timeout), se cancela también la llamada HTTP.
+    """
+    tokens = estimate_tokens(kwargs)
+    priority = get_llm_priority()
+
+    async def attempt(backend: LLMBackend):
+        return await _acreate_on(backend, _backend_request(backend, kwargs, use_vision), tokens, priority)
+
+    return await get_router().call(attempt)
 
 
-def _pdf_to_images_base64(pdf_path: Path) -> list[str]:
+def _backend_request(backend: LLMBackend, kwargs: dict, use_vision: bool) -> dict:
+    """Ajusta modelo y response_format al backend elegido."""
+    request = dict(kwargs, model=backend.vision_model if use_vision else backend.model)
+    if "response_format" in request:
+        request["response_format"] = {"type": "json_object"} if backend.json_mode else None
+    return request
+
+
+_CURSO_RE = re.compile(r'"curso"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+async def astream_items(request: dict, use_vision: bool = False, meta: Optional[dict] = None) -> AsyncIterator[dict]:
+    """
+    Completion en streaming: entrega cada item (ya validado) apenas el modelo
+    cierra su objeto, sin esperar la respuesta completa ni re-escanear el texto.
+    El ruteo/hedge aplica a la apertura del stream; entre fragmentos rige
+    LLM_TIMEOUT_SECONDS. Si se pasa meta, al terminar queda meta["curso"].
+    """
+    tokens = estimate_tokens(request)
+    priority = get_llm_priority()
+
+    async def attempt(backend: LLMBackend):
+        return await _acreate_on(backend, dict(_backend_request(backend, request, use_vision), stream=True), tokens, priority)
+
+    stream = await get_router().call(attempt)
+    parser = ItemStreamParser()
+    chunks = stream.__aiter__()
+    try:
+        while True:
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), timeout=LLM_TIMEOUT_SECONDS)
+            except StopAsyncIteration:
+                break
+            if not chunk.choices:
+                continue
+            for item in parser.feed(chunk.choices[0].delta.content or ""):
+                for valid in validate_llm_items([item]):
+                    yield valid
+    finally:
+        await stream.close()
+
+    if meta is not None:
+        m = _CURSO_RE.search(parser.text)
+        meta["curso"] = json.loads(f'"{m.group(1)}"') if m else None
+    if parser.items_seen == 0 and parser.text.strip():
+        # El modelo no respetó el formato {"items": [...]}: intento tradicional
+        try:
+            result = json.loads(_extract_json(parser.text))
+        except ValueError:
+            return
+        for valid in validate_llm_items(result.get("items") or []):
+            yield valid
+
+
+_LINE_ID_INSTRUCTIONS = """
+**Identificadores de línea:**
+Cada línea del contenido empieza con un identificador entre corchetes, por ejemplo [L3].
+Agrega a cada item el campo "line_id" con el identificador de la línea de la que se extrajo (ej: "L3").
+"""
+
+
+def _fix_request_with_ids(entries: list[tuple[str, str]]) -> dict:
+    """Como _fix_request, pero cada línea lleva un id para devolver los items a su origen."""
+    request = _fix_request([f"[{line_id}] {text}" for line_id, text in entries])
+    prompt = request["messages"][1]["content"]
+    request["messages"][1]["content"] = prompt.replace(
+        "**Contenido a analizar:**", _LINE_ID_INSTRUCTIONS + "\n**Contenido a analizar:**", 1
+    )
+    return request
+
+
+def call_llm_fix(dub_lines: list[str]) -> dict:
+    """
+    Llama al LLM para extraer útiles de líneas dudosas.
+    """
+    sync_client = get_client()
+    if not sync_client:
+        raise RuntimeError("LLM no configurado. Configure GROQ_API_KEY o OPENAI_API_KEY")
+
+    response = sync_client.chat.completions.create(**_fix_request(dub_lines))
+    return _parse_response(response)
+
+
+async def acall_llm_fix(dub_lines: list[str]) -> dict:
+    """Versión async de call_llm_fix (no bloquea el event loop)."""
+    response = await _acreate(**_fix_request(dub_lines))
+    return _parse_response(response)
+
+
+def astream_llm_fix(dub_lines: list[str]) -> AsyncIterator[dict]:
+    """Versión streaming de acall_llm_fix: items a medida que el modelo los genera."""
+    return astream_items(_fix_request(dub_lines))
+
+
+async def acall_llm_fix_with_ids(entries: list[tuple[str, str]]) -> dict:
+    """acall_llm_fix para líneas (line_id, texto); los items traen "line_id"."""
+    response = await _acreate(**_fix_request_with_ids(entries))
+    return _parse_response(response)
+
+
+def _pdf_to_images(pdf_path: Path, pages: Optional[list[int]] = None) -> list[str]:
     """
-    Convierte las páginas de un PDF a imágenes en base64.
+    Data URLs de las páginas a enviar (ver app/page_render.py): solo esas
+    páginas, en paralelo, a la resolución efectiva del modelo y en JPEG/WebP.
     Requiere pdf2image y poppler instalados.
     """
     try:
-        from pdf2image import convert_from_path
-        
-        # Convertir PDF a imágenes (máximo 5 páginas para no exceder límites)
-        images = convert_from_path(str(pdf_path), dpi=150, first_page=1, last_page=5)
-        
-        base64_images = []
-        for img in images:
-            # Guardar temporalmente como PNG
-            import io
-            img_byte_arr = io.BytesIO()
-            img.save(img_byte_arr, format='PNG')
-            img_byte_arr = img_byte_arr.getvalue()
-            base64_images.append(base64.b64encode(img_byte_arr).decode('utf-8'))
-        
-        return base64_images
+        from app.page_render import render_pdf_pages
+        return render_pdf_pages(pdf_path, pages)
     except ImportError:
         print("⚠️  pdf2image no instalado. No se puede usar visión con PDFs.")
         return []
@@ -255,38 +672,11 @@ def _pdf_to_images_base64(pdf_path: Path) -> list[str]:
         return []
 
 
-def call_llm_with_vision(file_path: Path) -> dict:
-    """
-    Usa GPT-4 Vision para extraer items directamente de un PDF/imagen.
-    Mucho mejor para PDFs con formato complejo, tablas o imágenes.
-    
-    Args:
-        file_path: Ruta al archivo PDF o imagen
-    
-    Returns:
-        dict con estructura: {"curso": str|None, "items": [...]}
-    """
-    if not client:
-        raise RuntimeError("OpenAI API key not configured")
-    
-    ext = file_path.suffix.lower()
-    
-    # Preparar las imágenes según el tipo de archivo
-    if ext == ".pdf":
-        base64_images = _pdf_to_images_base64(file_path)
-        if not base64_images:
-            # Fallback: extraer solo texto
-            from app.extractors import extract_text
-            raw_text = extract_text(file_path)
-            return call_llm_full_extraction(raw_text)
-    elif ext in [".png", ".jpg", ".jpeg"]:
-        base64_images = [_encode_image_to_base64(file_path)]
-    else:
-        # Para otros formatos, usar extracción de texto
-        from app.extractors import extract_text
-        raw_text = extract_text(file_path)
-        return call_llm_full_extraction(raw_text)
-    
+_VISION_SYSTEM_PROMPT = "Eres un experto extractor de listas de útiles escolares. Analiza cuidadosamente las imágenes y responde SOLO en JSON válido."
+
+
+def _vision_request(image_urls: list[str]) -> dict:
+    """Argumentos de chat.completions.create para extracción con visión."""
     # Construir mensajes con imágenes
     content = [
         {
@@ -294,54 +684,65 @@ def call_llm_with_vision(file_path: Path) -> dict:
             "text": PROMPT_TEMPLATE.format(content="Analiza las imágenes y extrae los útiles escolares.")
         }
     ]
-    
-    # Agregar imágenes al prompt (máximo 3 para no exceder límites)
-    for img_base64 in base64_images[:3]:
+
+    # Agregar imágenes al prompt (ya acotadas a VISION_MAX_PAGES al renderizar)
+    for url in image_urls:
         content.append({
             "type": "image_url",
             "image_url": {
-                "url": f"data:image/png;base64,{img_base64}",
+                "url": url,
                 "detail": "high"  # Alta calidad para mejor OCR
             }
         })
+
+    return dict(
+        model=get_model(use_vision=True),
+        messages=[
+            {"role": "system", "content": _VISION_SYSTEM_PROMPT},
+            {"role": "user", "content": content},
+        ],
+        temperature=0.2,
+        max_tokens=4096
+    )
+
+
+def _vision_images(file_path: Path, pages: Optional[list[int]] = None):
+    """
+    Imágenes (data URLs) a enviar, o None si hay que caer a extracción de texto
+    (formato sin imágenes o PDF que no se pudo convertir).
+    """
+    ext = file_path.suffix.lower()
+    if ext == ".pdf":
+        return _pdf_to_images(file_path, pages) or None
+    if ext in [".png", ".jpg", ".jpeg"]:
+        from app.page_render import encode_image_file
+        return [encode_image_file(file_path)]
+    return None
+
+
+def call_llm_with_vision(file_path: Path) -> dict:
+    """
+    Usa GPT-4 Vision para extraer items directamente de un PDF/imagen.
+    Mucho mejor para PDFs con formato complejo, tablas o imágenes.
     
-    try:
-        # Groq tiene un formato ligeramente diferente para imágenes
-        messages = [
-            {
-                "role": "system", 
-                "content": "Eres un experto extractor de listas de útiles escolares. Analiza cuidadosamente las imágenes y responde SOLO en JSON válido."
-            },
-            {
-                "role": "user",
-                "content": content
-            }
-        ]
-        
-        response = client.chat.completions.create(
-            model=get_model(use_vision=True),
-            messages=messages,
-            temperature=0.2,
-            max_tokens=4096
-        )
-        
-        raw = response.choices[0].message.content
-        
-        # Extraer JSON
-        json_str = _extract_json(raw)
-        result = json.loads(json_str)
-        
-        # Post-procesamiento
-        if "items" in result:
-            result["items"] = validate_llm_items(result["items"])
-        
-        if "curso" not in result:
-            result["curso"] = None
-        if "items" not in result:
-            result["items"] = []
-        
-        return result
+    Args:
+        file_path: Ruta al archivo PDF o imagen
     
+    Returns:
+        dict con estructura: {"curso": str|None, "items": [...]}
+    """
+    if not get_client():
+        raise RuntimeError("OpenAI API key not configured")
+
+    image_urls = _vision_images(file_path)
+    if image_urls is None:
+        # Fallback: extraer solo texto
+        from app.extractors import extract_text
+        return call_llm_full_extraction(extract_text(file_path))
+
+    try:
+        response = get_client().chat.completions.create(**_vision_request(image_urls))
+        return _parse_response(response, ensure_shape=True)
     except Exception as e:
         print(f"❌ Error en call_llm_with_vision: {e}")
         return {
@@ -351,20 +752,47 @@ def call_llm_with_vision(file_path: Path) -> dict:
         }
 
 
-def call_llm_full_extraction(raw_text: str) -> dict:
+async def acall_llm_with_vision(file_path: Path, pages: Optional[list[int]] = None) -> dict:
     """
-    Usa IA (OpenAI) para extraer TODOS los items del texto completo.
-    No usa el parser de reglas, solo IA.
-    
-    Retorna un dict con estructura similar a parse_with_rules:
-    {
-        "curso": str | None,
-        "items": [{"detalle": str, "cantidad": int, ...}]
-    }
+    Versión async de call_llm_with_vision; el render del PDF corre en un thread.
+    pages: solo esas páginas (0-based) se renderizan y envían.
     """
-    if not client:
+    if not get_router().backends:
         raise RuntimeError("OpenAI API key not configured")
-    
+
+    image_urls = await asyncio.to_thread(_vision_images, file_path, pages)
+    if image_urls is None:
+        from app.extractors import extract_text
+        raw_text = await asyncio.to_thread(extract_text, file_path)
+        return await acall_llm_full_extraction(raw_text)
+
+    try:
+        response = await _acreate(use_vision=True, **_vision_request(image_urls))
+        return _parse_response(response, ensure_shape=True)
+    except Exception as e:
+        print(f"❌ Error en acall_llm_with_vision: {e}")
+        return {
+            "curso": None,
+            "items": [],
+            "error": str(e)
+        }
+
+
+def _full_extraction_request(raw_text: str) -> dict:
+    """Argumentos de chat.completions.create para extracción del texto completo."""
+    prompt = PROMPT_TEMPLATE.format(content=raw_text)  # ya acotado por chunk_text
+    return dict(
+        model=get_model(use_vision=False),
+        messages=[
+            {"role": "system", "content": "Eres un extractor experto de listas de útiles escolares. Responde SOLO en JSON válido. Sin texto extra."},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.2,
+        response_format={"type": "json_object"} if LLM_PROVIDER == "openai" else None
+    )
+
+
+def _short_text_error(raw_text: str):
     # Validación de entrada
     if not raw_text or len(raw_text.strip()) < 10:
         return {
@@ -372,38 +800,71 @@ def call_llm_full_extraction(raw_text: str) -> dict:
             "items": [],
             "error": "Texto vacío o muy corto"
         }
-    
-    prompt = PROMPT_TEMPLATE.format(content=raw_text[:15000])  # Limitar tamaño para evitar errores
+    return None
+
 
+def _dedupe_key(item: dict) -> tuple:
+    detalle = re.sub(r"\s+", " ", (item.get("detalle") or "").strip().lower())
+    asignatura = (item.get("asignatura") or "").strip().upper()
+    return asignatura, detalle, item.get("cantidad")
+
+
+class _ChunkMerger:
+    """
+    Merge incremental de items por chunk, en el orden del documento.
+    - Items sin asignatura heredan la del borde del chunk (o la del item anterior).
+    - Se eliminan duplicados exactos (misma asignatura, detalle y cantidad).
+    """
+
+    def __init__(self):
+        self.seen = set()
+        self.current_subject = None
+
+    def start_chunk(self, chunk: TextChunk) -> None:
+        self.current_subject = chunk.subject
+
+    def add(self, item) -> Optional[dict]:
+        if not isinstance(item, dict):
+            return None
+        if item.get("asignatura"):
+            self.current_subject = item["asignatura"]
+        else:
+            item["asignatura"] = self.current_subject
+        key = _dedupe_key(item)
+        if key in self.seen:
+            return None
+        self.seen.add(key)
+        return item
+
+
+def _merge_chunk_results(chunks: list[TextChunk], results: list[dict]) -> dict:
+    """Une los resultados por chunk (ver _ChunkMerger)."""
+    merged = {"curso": None, "items": []}
+    merger = _ChunkMerger()
+    errors = []
+    for chunk, result in zip(chunks, results):
+        if "error" in result:
+            errors.append(result["error"])
+        if merged["curso"] is None and result.get("curso"):
+            merged["curso"] = result["curso"]
+
+        merger.start_chunk(chunk)
+        for item in result.get("items") or []:
+            item = merger.add(item)
+            if item is not None:
+                merged["items"].append(item)
+
+    if errors and len(errors) == len(results):
+        merged["error"] = errors[0]
+    elif errors:
+        merged["chunk_errors"] = len(errors)
+    return merged
+
+
+def _extract_chunk(text: str) -> dict:
     try:
-        response = client.chat.completions.create(
-            model=get_model(use_vision=False),
-            messages=[
-                {"role": "system", "content": "Eres un extractor experto de listas de útiles escolares. Responde SOLO en JSON válido. Sin texto extra."},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.2,
-            response_format={"type": "json_object"} if LLM_PROVIDER == "openai" else None
-        )
-
-        raw = response.choices[0].message.content
-
-        # Extraer JSON
-        json_str = _extract_json(raw)
-        result = json.loads(json_str)
-        
-        # Post-procesamiento: validar y filtrar items inválidos
-        if "items" in result:
-            result["items"] = validate_llm_items(result["items"])
-        
-        # Asegurar estructura mínima
-        if "curso" not in result:
-            result["curso"] = None
-        if "items" not in result:
-            result["items"] = []
-        
-        return result
-    
+        response = get_client().chat.completions.create(**_full_extraction_request(text))
+        return _parse_response(response, ensure_shape=True)
     except Exception as e:
         print(f"❌ Error en call_llm_full_extraction: {e}")
         # Si falla, retornar estructura vacía
@@ -412,3 +873,120 @@ def call_llm_full_extraction(raw_text: str) -> dict:
             "items": [],
             "error": str(e)
         }
+
+
+async def _aextract_chunk(text: str, semaphore: asyncio.Semaphore) -> dict:
+    async with semaphore:
+        try:
+            response = await _acreate(**_full_extraction_request(text))
+            return _parse_response(response, ensure_shape=True)
+        except Exception as e:
+            print(f"❌ Error en acall_llm_full_extraction: {e}")
+            return {
+                "curso": None,
+                "items": [],
+                "error": str(e)
+            }
+
+
+def call_llm_full_extraction(raw_text: str) -> dict:
+    """
+    Usa IA (OpenAI) para extraer TODOS los items del texto completo.
+    No usa el parser de reglas, solo IA. El texto se divide en chunks por
+    sección (ver chunk_text) en vez de truncarse.
+    
+    Retorna un dict con estructura similar a parse_with_rules:
+    {
+        "curso": str | None,
+        "items": [{"detalle": str, "cantidad": int, ...}]
+    }
+    """
+    if not get_client():
+        raise RuntimeError("OpenAI API key not configured")
+
+    error = _short_text_error(raw_text)
+    if error:
+        return error
+
+    chunks = chunk_text(raw_text, LLM_CHUNK_CHARS)
+    return _merge_chunk_results(chunks, [_extract_chunk(c.text) for c in chunks])
+
+
+async def acall_llm_full_extraction(raw_text: str) -> dict:
+    """
+    Versión async de call_llm_full_extraction: los chunks se extraen en
+    paralelo (máximo LLM_CHUNK_CONCURRENCY a la vez), así la latencia es la
+    del chunk más lento y no la del documento completo.
+    """
+    if not get_router().backends:
+        raise RuntimeError("OpenAI API key not configured")
+
+    error = _short_text_error(raw_text)
+    if error:
+        return error
+
+    chunks = chunk_text(raw_text, LLM_CHUNK_CHARS)
+    semaphore = asyncio.Semaphore(LLM_CHUNK_CONCURRENCY)
+    results = await asyncio.gather(*(_aextract_chunk(c.text, semaphore) for c in chunks))
+    return _merge_chunk_results(chunks, list(results))
+
+
+async def astream_llm_full_extraction(raw_text: str, meta: Optional[dict] = None) -> AsyncIterator[dict]:
+    """
+    Versión streaming de acall_llm_full_extraction. Los chunks se piden en
+    paralelo (hasta LLM_CHUNK_CONCURRENCY); los items se entregan en orden de
+    documento: los del chunk 1 apenas se generan, los de chunks siguientes en
+    cuanto el anterior termina (o de inmediato si ya llegaron).
+    Si un chunk falla se sigue con el resto; meta recibe curso/error/chunk_errors
+    igual que el resultado de acall_llm_full_extraction.
+    """
+    if not get_router().backends:
+        raise RuntimeError("OpenAI API key not configured")
+    meta = meta if meta is not None else {}
+    meta["curso"] = None
+    error = _short_text_error(raw_text)
+    if error:
+        meta["error"] = error["error"]
+        return
+
+    chunks = chunk_text(raw_text, LLM_CHUNK_CHARS)
+    semaphore = asyncio.Semaphore(LLM_CHUNK_CONCURRENCY)
+    queues = [asyncio.Queue() for _ in chunks]
+    _DONE = object()
+
+    chunk_meta = [{} for _ in chunks]
+    errors = []
+
+    async def produce(chunk: TextChunk, queue: asyncio.Queue, info: dict):
+        try:
+            async with semaphore:
+                async for item in astream_items(_full_extraction_request(chunk.text), meta=info):
+                    queue.put_nowait(item)
+        except Exception as e:
+            print(f"❌ Error en astream_llm_full_extraction: {e}")
+            errors.append(str(e))
+        finally:
+            queue.put_nowait(_DONE)
+
+    tasks = [asyncio.ensure_future(produce(*args)) for args in zip(chunks, queues, chunk_meta)]
+    merger = _ChunkMerger()
+    try:
+        for chunk, queue, info in zip(chunks, queues, chunk_meta):
+            merger.start_chunk(chunk)
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    break
+                item = merger.add(item)
+                if item is not None:
+                    yield item
+            if meta["curso"] is None and info.get("curso"):
+                meta["curso"] = info["curso"]
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if errors and len(errors) == len(chunks):
+        meta["error"] = errors[0]
+    elif errors:
+        meta["chunk_errors"] = len(errors)
@@ -0,0 +1,284 @@
+"""
+Cache por línea de los resultados del LLM para líneas dudosas.
+
+Las mismas líneas ("Témpera 12 colores", "Block de dibujo médium 99 1/8")
+se repiten en miles de listas: se guarda línea normalizada → items extraídos
+(LRU en memoria + tabla llm_line_cache) y al LLM solo van las líneas nunca vistas.
+"""
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+
+from app.database import LLMLineCache, SessionLocal
+from app.llm_batcher import fix_batcher
+from app.llm_client import call_llm_fix, validate_llm_items
+from app.line_classifier import classify_lines
+from app.parse_registry import PARSER_VERSION
+
+LINE_CACHE_SIZE = int(os.getenv("LLM_LINE_CACHE_SIZE", "5000"))
+
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_line(line: str) -> str:
+    """Clave de cache: minúsculas y espacios colapsados."""
+    return _SPACES_RE.sub(" ", (line or "").strip().lower())
+
+
+def _line_hash(key: str) -> str:
+    return hashlib.sha256(f"{PARSER_VERSION}\n{key}".encode("utf-8")).hexdigest()
+
+
+class _LineLRU:
+    """LRU acotado y thread-safe (los endpoints corren en threads del pool)."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            items = self._data.get(key)
+            if items is not None:
+                self._data.move_to_end(key)
+            return items
+
+    def put(self, key: str, items: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._data[key] = items
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_memory = _LineLRU(LINE_CACHE_SIZE)
+
+
+def clear_memory_cache() -> None:
+    _memory.clear()
+
+
+def _load_from_db(keys: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """Sesión corta solo para la lectura (bloqueante: desde async va al threadpool)."""
+    hashes = {_line_hash(k): k for k in keys}
+    db = SessionLocal()
+    try:
+        rows = db.query(LLMLineCache).filter(LLMLineCache.line_hash.in_(list(hashes))).all()
+        found = {}
+        for row in rows:
+            row.hits = (row.hits or 0) + 1
+            found[hashes[row.line_hash]] = row.items or []
+        if rows:
+            db.commit()
+        return found
+    finally:
+        db.close()
+
+
+def _save_to_db(results: Dict[str, List[Dict[str, Any]]]) -> None:
+    """Inserta las líneas nuevas en un solo commit (sesión corta, después del LLM)."""
+    if not results:
+        return
+    db = SessionLocal()
+    try:
+        for _ in range(2):
+            hashes = {_line_hash(k): k for k in results}
+            existing = {
+                h for (h,) in db.query(LLMLineCache.line_hash).filter(LLMLineCache.line_hash.in_(list(hashes)))
+            }
+            db.add_all([
+                LLMLineCache(line_hash=h, normalized_line=k, items=results[k], parser_version=PARSER_VERSION)
+                for h, k in hashes.items() if h not in existing
+            ])
+            try:
+                db.commit()
+                return
+            except IntegrityError:
+                # Otra request guardó alguna de las mismas líneas entremedio: se reintenta sin ellas
+                db.rollback()
+    finally:
+        db.close()
+
+
+def _assign_to_lines(items: List[Dict[str, Any]], keys: List[str]):
+    """
+    Asocia cada item devuelto por el LLM a la línea de la que salió (vía
+    item_original, solo coincidencia exacta normalizada: "lápiz" no es de
+    "lápiz grafito n°2"). Los que no se pueden asociar van aparte y no se cachean.
+    """
+    by_line: Dict[str, List[Dict[str, Any]]] = {k: [] for k in keys}
+    unassigned: List[Dict[str, Any]] = []
+    for it in items:
+        if not isinstance(it, dict):
+            continue
+        orig = normalize_line(it.get("item_original") or it.get("detalle") or "")
+        if orig in by_line:
+            by_line[orig].append(it)
+        else:
+            unassigned.append(it)
+    return by_line, unassigned
+
+
+def _lookup(dub_lines: List[str]):
+    """Resuelve desde memoria/DB; retorna (keys, resueltos, misses únicos en orden)."""
+    keys = [normalize_line(line) for line in dub_lines]
+
+    resolved: Dict[str, List[Dict[str, Any]]] = {}
+    pending = []
+    for key in dict.fromkeys(keys):
+        items = _memory.get(key)
+        if items is None:
+            pending.append(key)
+        else:
+            resolved[key] = items
+
+    if pending:
+        from_db = _load_from_db(pending)
+        for key, items in from_db.items():
+            _memory.put(key, items)
+        resolved.update(from_db)
+
+    misses = [k for k in pending if k not in resolved]
+    return keys, resolved, misses
+
+
+def _miss_lines(dub_lines: List[str], keys: List[str], misses: List[str]) -> List[str]:
+    """Texto original (primera aparición) de cada línea no cacheada."""
+    originals: Dict[str, str] = {}
+    for line, key in zip(dub_lines, keys):
+        originals.setdefault(key, line)
+    return [originals[k] for k in misses]
+
+
+def _classify_locally(dub_lines: List[str], keys: List[str], misses: List[str], resolved):
+    """
+    Las líneas que el clasificador local resuelve con confianza no van al LLM.
+    No se guardan en llm_line_cache: esa tabla es el set de entrenamiento.
+    Retorna (misses restantes, claves resueltas localmente).
+    """
+    if not misses:
+        return misses, []
+    lines = _miss_lines(dub_lines, keys, misses)
+    local, _ = classify_lines(lines)
+    if not local:
+        return misses, []
+    remaining, local_keys = [], []
+    for key, line in zip(misses, lines):
+        if line in local:
+            resolved[key] = validate_llm_items(local[line])
+            local_keys.append(key)
+        else:
+            remaining.append(key)
+    return remaining, local_keys
+
+
+def _assign(fixed: dict, misses: List[str], resolved: Dict[str, List[Dict[str, Any]]]):
+    """
+    Reparte la respuesta del LLM entre las líneas y las deja en memoria.
+    Retorna (items sin línea, líneas a persistir en llm_line_cache).
+
+    Una línea sin items solo es un descarte real si todos los items de la
+    respuesta quedaron asignados; si hay items sin línea (el LLM reescribió
+    item_original) pueden ser de ella, y cachearla vacía la dejaría sin items
+    para siempre (y como falso ejemplo de descarte en el set de entrenamiento).
+    """
+    raw_items = fixed.get("items") if isinstance(fixed, dict) else []
+    by_line, unassigned = _assign_to_lines(raw_items or [], misses)
+    cacheable = {k: items for k, items in by_line.items() if items or not unassigned}
+    for key, items in cacheable.items():
+        _memory.put(key, items)
+    resolved.update(by_line)
+    return unassigned, cacheable
+
+
+def _merge(dub_lines, keys, resolved, misses, unassigned, local_keys=()) -> dict:
+    # Merge en el orden original; item_original refleja la línea de este documento
+    merged: List[Dict[str, Any]] = []
+    for line, key in zip(dub_lines, keys):
+        for it in resolved.get(key, []):
+            merged.append({**it, "item_original": line})
+    merged.extend(unassigned)
+
+    return {
+        "curso": None,
+        "items": merged,
+        "cache_hits": sum(1 for k in keys if k not in misses and k not in local_keys),
+        "cache_misses": len(misses),
+        "local_classified": len(local_keys),
+    }
+
+
+def call_llm_fix_cached(dub_lines: List[str]) -> dict:
+    """
+    Igual que call_llm_fix, pero solo las líneas que no están en cache
+    llegan al prompt. Los items se devuelven en el orden original de las líneas.
+    """
+    unassigned: List[Dict[str, Any]] = []
+    keys, resolved, misses = _lookup(dub_lines)
+    misses, local_keys = _classify_locally(dub_lines, keys, misses, resolved)
+    # Solo las líneas nunca vistas (una vez cada una) van al LLM
+    if misses:
+        fixed = call_llm_fix(_miss_lines(dub_lines, keys, misses))
+        unassigned, cacheable = _assign(fixed, misses, resolved)
+        _save_to_db(cacheable)
+    return _merge(dub_lines, keys, resolved, misses, unassigned, local_keys)
+
+
+async def acall_llm_fix_cached(dub_lines: List[str]) -> dict:
+    """
+    Versión async de call_llm_fix_cached. Los misses pasan por el micro-batcher,
+    que los junta con los de otras requests concurrentes en una sola llamada.
+    Ninguna conexión a la DB queda tomada mientras se espera al LLM.
+    """
+    unassigned: List[Dict[str, Any]] = []
+    keys, resolved, misses = await run_in_threadpool(_lookup, dub_lines)
+    misses, local_keys = _classify_locally(dub_lines, keys, misses, resolved)
+    if misses:
+        fixed = await fix_batcher.submit(_miss_lines(dub_lines, keys, misses))
+        unassigned, cacheable = _assign(fixed, misses, resolved)
+        await run_in_threadpool(_save_to_db, cacheable)
+    return _merge(dub_lines, keys, resolved, misses, unassigned, local_keys)
+
+
+async def astream_llm_fix_cached(dub_lines: List[str], stats: Optional[dict] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Igual que acall_llm_fix_cached pero entrega los items en orden apenas están
+    listos: las líneas resueltas por cache/clasificador antes de la primera
+    línea pendiente salen de inmediato (sin esperar al LLM). Si se pasa stats,
+    recibe cache_hits/cache_misses/local_classified.
+    """
+    keys, resolved, misses = await run_in_threadpool(_lookup, dub_lines)
+    misses, local_keys = _classify_locally(dub_lines, keys, misses, resolved)
+    if stats is not None:
+        merged = _merge(dub_lines, keys, resolved, misses, [], local_keys)
+        stats.update({k: merged[k] for k in ("cache_hits", "cache_misses", "local_classified")})
+
+    pending = set(misses)
+    pos = 0
+    while pos < len(dub_lines) and keys[pos] not in pending:
+        for it in resolved.get(keys[pos], []):
+            yield {**it, "item_original": dub_lines[pos]}
+        pos += 1
+    if not misses:
+        return
+
+    fixed = await fix_batcher.submit(_miss_lines(dub_lines, keys, misses))
+    unassigned, cacheable = _assign(fixed, misses, resolved)
+    await run_in_threadpool(_save_to_db, cacheable)
+
+    for line, key in zip(dub_lines[pos:], keys[pos:]):
+        for it in resolved.get(key, []):
+            yield {**it, "item_original": line}
+    for it in unassigned:
+        yield it
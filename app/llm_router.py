@@ -0,0 +1,200 @@
+"""
+Ruteo de llamadas entre varios backends LLM compatibles con OpenAI.
+
+Cada backend lleva latencias y errores recientes; cada llamada va al backend
+sano más rápido y, si está habilitado, se lanza una segunda request "hedged"
+a otro backend cuando la primera supera su p90 de latencia (gana la que
+responda primero; la otra se cancela o, si también terminó, se cierra).
+
+Un backend marcado como no sano por errores recibe, pasado
+LLM_BACKEND_PROBE_SECONDS, una llamada de prueba (half-open) con failover al
+mejor sano; si responde bien, vuelve a estar sano.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+LLM_BACKEND_MAX_ERROR_RATE = float(os.getenv("LLM_BACKEND_MAX_ERROR_RATE", "0.5"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "5"))
+LLM_BACKEND_PROBE_SECONDS = float(os.getenv("LLM_BACKEND_PROBE_SECONDS", "30"))
+
+
+def _percentile(values, q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+@dataclass
+class LLMBackend:
+    name: str
+    client: Any  # AsyncOpenAI (o compatible)
+    model: str
+    vision_model: str
+    json_mode: bool = False  # soporta response_format json_object
+    scheduler: Any = None  # LLMScheduler con el presupuesto RPM/TPM del backend
+    latencies: deque = field(default_factory=lambda: deque(maxlen=50))
+    outcomes: deque = field(default_factory=lambda: deque(maxlen=20))  # True = error
+    last_probe: float = field(default_factory=time.monotonic)  # el cooldown corre desde aquí
+
+    def record(self, latency: float, error: bool) -> None:
+        if not error:
+            self.latencies.append(latency)
+            if self.failing():
+                self.outcomes.clear()  # respondió bien estando caído (prueba half-open): vuelve a estar sano
+        elif not self.failing():
+            self.last_probe = time.monotonic()  # si este error lo deja caído, el cooldown parte ahora
+        self.outcomes.append(error)
+
+    @property
+    def error_rate(self) -> float:
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def failing(self) -> bool:
+        return len(self.outcomes) >= 3 and self.error_rate >= LLM_BACKEND_MAX_ERROR_RATE
+
+    def probe_due(self, now: float) -> bool:
+        """Caído por errores (no por 429) y sin prueba en los últimos LLM_BACKEND_PROBE_SECONDS."""
+        return self.failing() and now - self.last_probe >= LLM_BACKEND_PROBE_SECONDS
+
+    def latency(self, q: float) -> Optional[float]:
+        return _percentile(self.latencies, q)
+
+    def healthy(self) -> bool:
+        if self.scheduler is not None and self.scheduler.budget.blocked_until > time.monotonic():
+            return False  # en backoff por 429
+        return not self.failing()
+
+    def snapshot(self) -> dict:
+        return {
+            "name": self.name,
+            "model": self.model,
+            "healthy": self.healthy(),
+            "error_rate": round(self.error_rate, 3),
+            "p50_s": self.latency(0.5),
+            "p90_s": self.latency(0.9),
+            "samples": len(self.latencies),
+        }
+
+
+class LLMRouter:
+    def __init__(self, backends: List[LLMBackend], hedge: bool = False):
+        self.backends = backends
+        self.hedge = hedge
+        self.stats = {"calls": 0, "failovers": 0, "hedged": 0, "hedge_wins": 0, "probes": 0}
+
+    def ranked(self) -> List[LLMBackend]:
+        """Sanos primero, por p50 (sin muestras = 0, así se exploran); luego el resto por tasa de error."""
+        healthy = [b for b in self.backends if b.healthy()]
+        unhealthy = [b for b in self.backends if not b.healthy()]
+        healthy.sort(key=lambda b: b.latency(0.5) or 0.0)
+        unhealthy.sort(key=lambda b: b.error_rate)
+        return healthy + unhealthy
+
+    def _with_probe(self, ranked: List[LLMBackend]) -> List[LLMBackend]:
+        """Si un backend caído cumplió el cooldown, va primero (una llamada) con el mejor sano de respaldo."""
+        if not ranked or not ranked[0].healthy():
+            return ranked
+        now = time.monotonic()
+        probe = next((b for b in ranked if b.probe_due(now)), None)
+        if probe is None:
+            return ranked
+        probe.last_probe = now
+        self.stats["probes"] += 1
+        return [probe] + [b for b in ranked if b is not probe]
+
+    async def _timed(self, backend: LLMBackend, attempt: Callable[[LLMBackend], Awaitable[T]]) -> T:
+        start = time.monotonic()
+        try:
+            result = await attempt(backend)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            backend.record(time.monotonic() - start, error=True)
+            raise
+        backend.record(time.monotonic() - start, error=False)
+        return result
+
+    @staticmethod
+    async def _discard(task: asyncio.Future) -> None:
+        """Cierra el resultado de una request perdedora que igual terminó (stream abierto = conexión tomada)."""
+        if task.cancelled() or task.exception() is not None:
+            return
+        close = getattr(task.result(), "close", None)
+        if close is not None:
+            try:
+                result = close()
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception:
+                pass
+
+    async def call(self, attempt: Callable[[LLMBackend], Awaitable[T]]) -> T:
+        """Ejecuta attempt(backend) en el mejor backend (con hedge y failover)."""
+        if not self.backends:
+            raise RuntimeError("LLM no configurado. Configure GROQ_API_KEY o OPENAI_API_KEY")
+        self.stats["calls"] += 1
+        ranked = self._with_probe(self.ranked())
+        primary = ranked[0]
+        secondary = ranked[1] if len(ranked) > 1 else None
+
+        hedge_after = None
+        if (
+            self.hedge and secondary is not None and primary.healthy()
+            and len(primary.latencies) >= LLM_HEDGE_MIN_SAMPLES
+        ):
+            hedge_after = primary.latency(0.9)
+
+        if hedge_after is None:
+            try:
+                return await self._timed(primary, attempt)
+            except Exception:
+                if secondary is None:
+                    raise
+                self.stats["failovers"] += 1
+                return await self._timed(secondary, attempt)
+
+        first = asyncio.ensure_future(self._timed(primary, attempt))
+        pending = {first}
+        error: Optional[BaseException] = None
+        winner: Optional[asyncio.Future] = None
+        # Todo el camino con hedge va en el try: si el llamador se cancela
+        # (desconexión, deadline) las requests en curso se cortan y se cierran
+        try:
+            done, pending = await asyncio.wait(pending, timeout=hedge_after)
+            if done:
+                try:
+                    return first.result()
+                except Exception:
+                    self.stats["failovers"] += 1
+                    return await self._timed(secondary, attempt)
+
+            self.stats["hedged"] += 1
+            second = asyncio.ensure_future(self._timed(secondary, attempt))
+            pending = {first, second}
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Si ambas terminaron en la misma ronda, gana la primaria y la otra se cierra
+                for task in sorted(done, key=lambda t: t is second):
+                    if winner is None and task.exception() is None:
+                        winner = task
+                    elif task.exception() is None:
+                        await self._discard(task)
+                    else:
+                        error = task.exception()
+            if winner is None:
+                raise error
+            if winner is second:
+                self.stats["hedge_wins"] += 1
+            return winner.result()
+        finally:
+            for task in pending:
+                task.cancel()
+                # Puede haber terminado antes de ver la cancelación: su resultado también se cierra
+                task.add_done_callback(lambda t: asyncio.ensure_future(self._discard(t)))
@@ -3,37 +3,56 @@ from uuid import uuid4
 import re
 import traceback
 import os
-from typing import Any, Dict, List, Optional
+import asyncio
+import contextvars
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from dotenv import load_dotenv
 from datetime import datetime
 # Cargar variables de entorno
 load_dotenv()
 
 from fastapi import FastAPI, UploadFile, File, HTTPException, Body, Request, APIRouter, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, RedirectResponse
+from starlette.background import BackgroundTask
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
 # Imports locales de app/
-from app.extractors import extract_text
-from app.rules_parser import split_lines, parse_with_rules, find_dubious_lines
-from app.llm_client import call_llm_fix, call_llm_full_extraction, call_llm_with_vision
+from app.extractors import extract_text, iter_pages
+from app.rules_parser import split_lines, parse_with_rules, find_dubious_lines, RulesParseStream
+from app.llm_client import (
+    PRIORITY_DEMO, PRIORITY_FREE, PRIORITY_PAID,
+    acall_llm_with_vision, astream_llm_full_extraction, log_llm_config, set_llm_priority,
+)
+from app.llm_line_cache import acall_llm_fix_cached, astream_llm_fix_cached
+from app.doc_triage import ROUTE_RULES, ROUTE_VISION, triage_document
 from app.schemas import ParsedList, ParsedItem, ProviderSuggestionCreate, ProviderSuggestionUpdate, ProviderSuggestionResponse
 
-from app.quoting.dimeiggs_quote import quote_dimeiggs
-from app.quoting.multi_provider import quote_multi_providers
+# Cotizadores (requests, playwright, Crypto) y resend se importan al usarse,
+# para que el arranque no los pague (ver scripts/check_import_time.py)
 
 # Autenticación
 from app.database import get_db, init_db, User, SessionLocal, ProviderSuggestion, Plan, Subscription
 from app.settings import get_setting_bool
-from app.auth import get_current_user, get_current_user_optional, create_access_token, get_or_create_user
+from app.entitlements import ALL_PROVIDERS, get_entitlements, invalidate_entitlements
+from app.parse_registry import document_hash, flush_hits, get_parsed_document, save_parsed_document
+from app.jobs import (
+    STAGE_PARSING, STAGE_QUOTING, QuoteProgress,
+    get_job, job_to_dict, recover_jobs, register_job_runner, start_job_workers, submit_job,
+)
+from app.quote_stream import QuoteEventStream, sse_event
+from app.cancellation import ClientDisconnected, abandon, count, is_cancelled, run_cancellable, start_cancellable
+from app.admission import acquire as acquire_admission, admission
+from app.provider_queue import TIER_FREE, set_provider_tier, tier_for
+from app.responses import CompressionMiddleware, FastJSONResponse, compact_item, compact_payload
+from app.auth import Principal, get_current_user, get_current_user_optional, create_access_token, get_or_create_user
 from app.oauth_providers import get_google_user_info, get_twitter_user_info, get_github_user_info
 
-# Resend para envío de correos
-import resend
-
 
 # ============ MODELOS PYDANTIC ============
 
@@ -52,7 +71,7 @@ class CheckoutRequest(BaseModel):
     plan_id: int
 
 
-app = FastAPI(title="Parser Útiles (Reglas + IA + Cotización)")
+app = FastAPI(title="Parser Útiles (Reglas + IA + Cotización)", default_response_class=FastJSONResponse)
 
 # Crear router con prefijo /api
 api_router = APIRouter(prefix="/api")
@@ -65,6 +84,9 @@ async def startup_event():
         print("🔧 Initializing database...")
         init_db()
         print("✅ Database initialized successfully")
+        log_llm_config()
+        start_job_workers()
+        recover_jobs()
         print(f"🌐 Server ready to accept connections")
         print(f"💚 Health endpoint available at /health")
     except Exception as e:
@@ -72,6 +94,12 @@ async def startup_event():
         raise
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Guarda los hits del registro de parseos que quedaron en memoria."""
+    await run_in_threadpool(_with_session, flush_hits)
+
+
 @app.get("/")
 async def root():
     """Endpoint raíz"""
@@ -83,18 +111,24 @@ async def root():
 async def health():
     """Health check endpoint para Railway/Render - Responde con 200 OK"""
     print("💚 Health check called")
-    return JSONResponse(
+    return FastJSONResponse(
         status_code=200,
         content={"status": "healthy", "service": "cotizador-utiles"}
     )
 
 
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected_handler(request: Request, exc: ClientDisconnected):
+    # Nadie va a leer la respuesta; 499 = cliente cerró la conexión (convención nginx)
+    return Response(status_code=499)
+
+
 @app.exception_handler(Exception)
 async def unhandled_exception_handler(request: Request, exc: Exception):
     if isinstance(exc, HTTPException):
         raise exc
     tb = traceback.format_exc()
-    return JSONResponse(
+    return FastJSONResponse(
         status_code=500,
         content={
             "detail": str(exc),
@@ -125,6 +159,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# brotli / gzip sobre COMPRESSION_MIN_BYTES (las listas de 60 items pesan cientos de KB)
+app.add_middleware(CompressionMiddleware)
+
 UPLOAD_DIR = Path("./uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
@@ -150,8 +187,8 @@ def _looks_like_book(item: Dict[str, Any]) -> bool:
     return ("lectura" in text) or ("lecturas complementarias" in text) or (" - " in item.get("item_original", ""))
 
 
-def normalize_items(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    out: List[Dict[str, Any]] = []
+def iter_normalize_items(items: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Etapa streaming de normalize_items (hereda asignatura item a item)."""
     current_subject: Optional[str] = None
 
     def _trim_after_slash(text: Optional[str]) -> Optional[str]:
@@ -202,9 +239,31 @@ def normalize_items(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         else:
             it.setdefault("tipo", "util")
 
-        out.append(it)
+        yield it
 
-    return out
+
+def normalize_items(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return list(iter_normalize_items(items))
+
+
+def incremental_normalizer() -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Normaliza items de a uno a medida que llegan, con un único iter_normalize_items
+    (conserva la asignatura heredada): O(1) por item en vez de re-normalizar el prefijo.
+    """
+    inbox: deque = deque()
+
+    def source() -> Iterator[Dict[str, Any]]:
+        while True:
+            yield inbox.popleft()
+
+    stream = iter_normalize_items(source())
+
+    def normalize(item: Dict[str, Any]) -> Dict[str, Any]:
+        inbox.append(item)
+        return next(stream)  # iter_normalize_items produce exactamente un item por entrada
+
+    return normalize
 
 
 def should_quote_item(it: ParsedItem) -> bool:
@@ -226,12 +285,21 @@ def _quote_single_item(
     providers: List[str],
     limit_per_provider: int = 5,
     max_results: int = 8,
+    on_provider_done=None,
 ) -> Dict[str, Any]:
     """
     Cotiza un item individual en múltiples proveedores.
     Se ejecuta en paralelo vía ThreadPoolExecutor.
+    on_provider_done: callback (proveedor, hits, error) por proveedor terminado.
     """
+    from app.quoting.multi_provider import quote_multi_providers
     qty = int(item_dict.get("cantidad") or 1)
+
+    # El cliente se desconectó mientras el item esperaba en la cola del executor
+    if is_cancelled():
+        count("items_skipped")
+        item_dict["quote"] = {"status": "cancelled", "reason": "Cliente desconectado"}
+        return item_dict
     
     if item_dict.get("tipo") == "lectura":
         item_dict["quote"] = {"status": "skip", "reason": "lectura/libro"}
@@ -249,6 +317,7 @@ def _quote_single_item(
             providers=providers,
             limit_per_provider=limit_per_provider,
             max_results=max_results,
+            on_provider_done=on_provider_done,
         )
         
         item_dict["quote"] = q
@@ -271,10 +340,348 @@ def _quote_single_item(
     return item_dict
 
 
+def _submit_quote(
+    loop: asyncio.AbstractEventLoop,
+    executor: ThreadPoolExecutor,
+    index: int,
+    item: Dict[str, Any],
+    providers: List[str],
+    progress: Optional[QuoteProgress] = None,
+    **kwargs,
+) -> asyncio.Future:
+    """
+    Encola la cotización de un item (en el contexto del request, para que el
+    thread vea su token de cancelación); con progress, reporta proveedores e
+    item terminados.
+    """
+    run = contextvars.copy_context().run
+    if progress is None:
+        return loop.run_in_executor(executor, partial(run, _quote_single_item, dict(item), providers, **kwargs))
+
+    progress.item_queued(index, len(providers))
+    future = loop.run_in_executor(executor, partial(
+        run, _quote_single_item, dict(item), providers,
+        on_provider_done=partial(progress.provider_done, index), **kwargs,
+    ))
+
+    def done(f: asyncio.Future) -> None:
+        if not f.cancelled() and f.exception() is None:
+            progress.item_quoted(index, f.result())
+
+    future.add_done_callback(done)
+    return future
+
+
+def _llm_priority_for(user: Optional[Principal]) -> int:
+    """Prioridad en la cola del LLM: plan pagado primero, demo (sin login) al final."""
+    if user is None:
+        return PRIORITY_DEMO
+    return PRIORITY_PAID if get_entitlements(user.id).is_paid else PRIORITY_FREE
+
+
+def _set_llm_priority_for(user: Optional[Principal]) -> None:
+    set_llm_priority(_llm_priority_for(user))
+
+
+def _provider_tier_for(user: Optional[Principal]) -> int:
+    """Nivel en la cola de proveedores: Pro, Basic, Free y demo, en ese orden."""
+    return tier_for(get_entitlements(user.id if user else None))
+
+
+def _run_rules(path: Path):
+    """Extracción + reglas (bloqueante: se ejecuta en el threadpool)."""
+    stream = RulesParseStream(iter_pages(path))
+    return stream, list(stream)
+
+
+async def _parse_rules_ai(path: Path) -> Dict[str, Any]:
+    """
+    Reglas (streaming) + IA solo para líneas dudosas + normalización.
+    Retorna items validados y la metadata que exponen los endpoints.
+    """
+    stream, rule_items = await run_in_threadpool(_run_rules, path)
+    parsed = {"curso": None, "items": rule_items}
+
+    dub_lines = find_dubious_lines(parsed)
+    fixed_items: List[Dict[str, Any]] = []
+    llm_error = None
+    if dub_lines:
+        try:
+            fixed = await acall_llm_fix_cached(dub_lines)
+            # Manejo robusto: acall_llm_fix_cached devuelve dict
+            raw_items = fixed.get("items") if isinstance(fixed, dict) else []
+            fixed_items = [x for x in (raw_items or []) if isinstance(x, dict)]
+        except Exception as e:
+            llm_error = str(e)
+            fixed_items = []
+
+    ok_items = [it for it in parsed["items"] if it.get("cantidad") is not None and it.get("detalle")]
+    merged = normalize_items(ok_items + fixed_items)
+
+    return {
+        "raw_text_preview": stream.preview,
+        "lines_count": stream.lines_count,
+        "dubious_sent_to_ai": len(dub_lines),
+        "curso": None,
+        "items": [ParsedItem(**x).model_dump() for x in merged],
+        "llm_error": llm_error,
+    }
+
+
+def _with_session(fn, *args):
+    """fn(db, *args) con una sesión corta; desde async se llama vía run_in_threadpool."""
+    db = SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+
+async def _parse_upload_cached(content: bytes, ext: str) -> Dict[str, Any]:
+    """
+    Consulta el registro por hash antes de escribir/extraer/llamar al LLM.
+    Solo se registran resultados sin error del LLM (evita fijar un parseo incompleto).
+    El registro usa sesiones cortas: ninguna conexión queda tomada durante el LLM.
+    """
+    content_hash = document_hash(content)
+    cached = await run_in_threadpool(_with_session, get_parsed_document, content_hash)
+    if cached is not None:
+        cached["llm_error"] = None
+        return cached
+
+    path = UPLOAD_DIR / f"{uuid4().hex}{ext}"
+    path.write_bytes(content)
+
+    result = await _parse_rules_ai(path)
+    if result["llm_error"] is None:
+        await run_in_threadpool(_with_session, save_parsed_document, content_hash, result)
+    return result
+
+
+async def _parse_and_quote_overlapped(
+    content: bytes,
+    ext: str,
+    providers: List[str],
+    max_quoted: Optional[int] = None,
+    progress: Optional[QuoteProgress] = None,
+) -> Dict[str, Any]:
+    """
+    Parseo (reglas + IA) y cotización solapados: los ok_items de las reglas se
+    cotizan apenas salen mientras el LLM arregla las líneas dudosas, y los items
+    arreglados se cotizan a medida que llegan. La latencia total queda en
+    max(LLM, cotización) en vez de la suma.
+
+    Retorna el mismo dict que _parse_upload_cached más "quoted_items": los
+    primeros max_quoted items ya cotizados, en el orden original.
+    Con progress (jobs en segundo plano) se reporta el avance por etapa.
+    """
+    loop = asyncio.get_running_loop()
+    limit = max_quoted if max_quoted is not None else float("inf")
+    if progress is not None:
+        progress.set_stage(STAGE_PARSING)
+
+    # Sin `with`: si se cancela (cliente desconectado) no se bloquea el loop
+    # esperando threads; los que siguen corriendo miran el token y terminan solos
+    executor = ThreadPoolExecutor(max_workers=4)
+    try:
+        tasks: List[asyncio.Future] = []
+
+        def quote(items: List[Dict[str, Any]]) -> None:
+            if progress is not None:
+                progress.add_parsed(len(items))
+            for item in items:
+                if len(tasks) >= limit:
+                    return
+                tasks.append(_submit_quote(loop, executor, len(tasks), item, providers, progress))
+
+        content_hash = document_hash(content)
+        result = await run_in_threadpool(_with_session, get_parsed_document, content_hash)
+        if result is not None:
+            result["llm_error"] = None
+            quote(result["items"])
+        else:
+            path = UPLOAD_DIR / f"{uuid4().hex}{ext}"
+            path.write_bytes(content)
+
+            stream, rule_items = await run_in_threadpool(_run_rules, path)
+            dub_lines = find_dubious_lines({"curso": None, "items": rule_items})
+            ok_items = [it for it in rule_items if it.get("cantidad") is not None and it.get("detalle")]
+            normalize = incremental_normalizer()
+            items = [ParsedItem(**normalize(x)).model_dump() for x in ok_items]
+            quote(items)
+
+            # La normalización es estable por prefijo (solo hereda asignatura hacia
+            # adelante): cada item arreglado se normaliza a continuación de los anteriores.
+            llm_error = None
+            if dub_lines:
+                try:
+                    async for fixed in astream_llm_fix_cached(dub_lines):
+                        new = [ParsedItem(**normalize(fixed)).model_dump()]
+                        items.extend(new)
+                        quote(new)
+                except Exception as e:
+                    llm_error = str(e)
+
+            result = {
+                "raw_text_preview": stream.preview,
+                "lines_count": stream.lines_count,
+                "dubious_sent_to_ai": len(dub_lines),
+                "curso": None,
+                "items": items,
+                "llm_error": llm_error,
+            }
+            if llm_error is None:
+                await run_in_threadpool(_with_session, save_parsed_document, content_hash, result)
+
+        if progress is not None:
+            progress.set_total(len(tasks))
+            progress.set_stage(STAGE_QUOTING)
+        result["quoted_items"] = list(await asyncio.gather(*tasks))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return result
+
+
+def _normalize_batch_items(items: List[Any]) -> List[Dict[str, Any]]:
+    """Items del payload de cotización en lote → {detalle, cantidad, item_original}."""
+    normalized_items: List[Dict[str, Any]] = []
+    for it in items:
+        if not isinstance(it, dict):
+            continue
+        detalle = (it.get("detalle") or it.get("item_original") or "").strip()
+        if not detalle:
+            continue
+        cantidad = it.get("cantidad") or it.get("quantity") or 1
+        try:
+            cantidad = int(cantidad)
+        except Exception:
+            cantidad = 1
+        normalized_items.append({
+            "detalle": detalle,
+            "cantidad": cantidad,
+            "item_original": it.get("item_original") or detalle,
+        })
+    return normalized_items
+
+
+async def _quote_items(
+    normalized_items: List[Dict[str, Any]],
+    providers: List[str],
+    limit_per_provider: int = 5,
+    progress: Optional[QuoteProgress] = None,
+) -> List[Dict[str, Any]]:
+    """Cotiza items en paralelo (sin bloquear el loop); resultados en el orden original."""
+    loop = asyncio.get_running_loop()
+    if progress is not None:
+        progress.set_total(len(normalized_items))
+        progress.set_stage(STAGE_QUOTING)
+
+    max_workers = max(1, min(6, len(normalized_items)))
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = [
+            _submit_quote(loop, executor, idx, item, providers, progress, limit_per_provider=limit_per_provider)
+            for idx, item in enumerate(normalized_items)
+        ]
+        outcomes = await asyncio.gather(*futures, return_exceptions=True)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)  # ver _parse_and_quote_overlapped
+
+    results: List[Dict[str, Any]] = []
+    for item, outcome in zip(normalized_items, outcomes):
+        if isinstance(outcome, Exception):
+            outcome = {
+                "detalle": item.get("detalle"),
+                "cantidad": item.get("cantidad"),
+                "item_original": item.get("item_original"),
+                "quote": {
+                    "status": "error",
+                    "reason": f"Error: {str(outcome)[:100]}",
+                },
+            }
+        results.append(outcome)
+    return results
+
+
+def _batch_response(
+    results: List[Dict[str, Any]],
+    providers: List[str],
+    is_demo_mode: bool,
+    providers_limited_by_plan: bool,
+) -> Dict[str, Any]:
+    response = {
+        "items": results,
+        "providers": providers,
+        "is_demo_mode": is_demo_mode,
+    }
+
+    if is_demo_mode:
+        response["demo_message"] = "Modo prueba: máximo 2 proveedores. Regístrate para acceso completo."
+    if providers_limited_by_plan:
+        response["was_limited"] = True
+        response["limited_message"] = f"Se limitó a {len(providers)} proveedores según tu plan. Actualiza tu plan para acceder a más."
+    return response
+
+
+def _summarize_quotes(final_items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Totales de una lista de items cotizados."""
+    subtotal = 0.0
+    priced = 0
+    missing = 0
+    total_qty = 0
+
+    for it in final_items:
+        qty = int(it.get("cantidad") or 1)
+        total_qty += qty
+
+        q = it.get("quote", {})
+        
+        if q.get("status") in ("ok", "partial") and q.get("line_total"):
+            subtotal += q["line_total"]
+            priced += 1
+        else:
+            missing += 1
+
+    return {
+        "items_total": len(final_items),
+        "items_priced": priced,
+        "items_missing": missing,
+        "total_items_qty": total_qty,
+        "subtotal": int(round(subtotal)),
+        "currency": "CLP",
+    }
+
+
+def _parse_quote_response(result: Dict[str, Any], provider_list: List[str], is_demo_mode: bool) -> Dict[str, Any]:
+    """Respuesta de parseo + cotización multi-proveedor (items cotizados + resumen)."""
+    llm_error = result["llm_error"]
+    original_item_count = len(result["items"])
+    final_items = result["quoted_items"]
+
+    resume = _summarize_quotes(final_items)
+    resume["providers_used"] = provider_list
+    resume["is_demo_mode"] = is_demo_mode
+    
+    # Agregar mensaje de demo si aplica
+    if is_demo_mode:
+        resume["demo_message"] = "Modo prueba: máximo 5 productos y 2 proveedores. Regístrate para acceso completo."
+        resume["demo_items_limit_applied"] = original_item_count > 5
+        resume["total_items_found"] = original_item_count
+
+    return {
+        "raw_text_preview": result["raw_text_preview"],
+        "lines_count": result["lines_count"],
+        "dubious_sent_to_ai": result["dubious_sent_to_ai"],
+        "resume": resume,
+        "items": final_items,
+        "llm_error": llm_error,
+    }
+
+
 # ============ ENDPOINTS DE AUTENTICACIÓN ============
 
 @api_router.get("/auth/me")
-async def get_me(current_user: User = Depends(get_current_user)):
+async def get_me(current_user: Principal = Depends(get_current_user)):
     """Obtiene información del usuario actual"""
     return {
         "id": current_user.id,
@@ -484,7 +891,7 @@ async def github_callback(code: str, db: Session = Depends(get_db)):
         frontend_url = "http://localhost:5173"
         return RedirectResponse(url=f"{frontend_url}/auth/callback?token={token}")
     except Exception as e:
-        return JSONResponse(
+        return FastJSONResponse(
             status_code=400,
             content={"error": str(e)}
         )
@@ -526,7 +933,7 @@ async def twitter_callback(code: str, db: Session = Depends(get_db)):
         frontend_url = "http://localhost:5173"
         return RedirectResponse(url=f"{frontend_url}/auth/callback?token={token}")
     except Exception as e:
-        return JSONResponse(
+        return FastJSONResponse(
             status_code=400,
             content={"error": str(e)}
         )
@@ -543,13 +950,12 @@ async def parse_only_rules(file: UploadFile = File(...)):
     path = UPLOAD_DIR / f"{uuid4().hex}{ext}"
     path.write_bytes(await file.read())
 
-    raw = extract_text(path)
-    lines = split_lines(raw)
-    parsed = parse_with_rules(lines)
+    stream = RulesParseStream(iter_pages(path))
+    parsed = {"curso": None, "items": list(stream)}
 
-    return JSONResponse({
-        "raw_text_preview": raw[:1500],
-        "lines_count": len(lines),
+    return FastJSONResponse({
+        "raw_text_preview": stream.preview,
+        "lines_count": stream.lines_count,
         "items": parsed["items"],
     })
 
@@ -560,6 +966,7 @@ async def parse_rules_plus_ai(
     quote: bool = True,         # <-- parámetro: si quieres cotizar
     quote_limit: int = 8,       # <-- hits max por búsqueda
 ):
+    from app.quoting.dimeiggs_quote import quote_dimeiggs
     ext = Path(file.filename).suffix.lower()
     if ext not in (".pdf", ".docx", ".xlsx", ".xls"):
         raise HTTPException(400, "Formato no soportado.")
@@ -567,19 +974,18 @@ async def parse_rules_plus_ai(
     path = UPLOAD_DIR / f"{uuid4().hex}{ext}"
     path.write_bytes(await file.read())
 
-    raw = extract_text(path)
-    lines = split_lines(raw)
-
-    # 1) reglas
-    parsed = parse_with_rules(lines)
+    # 1) reglas (streaming página a página)
+    stream = RulesParseStream(iter_pages(path))
+    parsed = {"curso": None, "items": list(stream)}
 
     # 2) mandar solo lo dudoso a IA
     dub_lines = find_dubious_lines(parsed)
     fixed_items: List[Dict[str, Any]] = []
     if dub_lines:
         try:
-            fixed = call_llm_fix(dub_lines)  # ParsedList validado con Pydantic
-            fixed_items = [it.model_dump() for it in fixed.items]
+            fixed = await acall_llm_fix_cached(dub_lines)
+            # acall_llm_fix_cached devuelve dict (no ParsedList)
+            fixed_items = [x for x in (fixed.get("items") or []) if isinstance(x, dict)]
         except Exception:
             # Si falla IA, no rompas el endpoint: sigue solo con reglas
             fixed_items = []
@@ -595,8 +1001,8 @@ async def parse_rules_plus_ai(
 
     # 4) salida final validada
     final = ParsedList(
-        raw_text_preview=raw[:1500],
-        lines_count=len(lines),
+        raw_text_preview=stream.preview,
+        lines_count=stream.lines_count,
         curso=None,
         items=[ParsedItem(**x) for x in merged],
     )
@@ -628,9 +1034,9 @@ async def parse_rules_plus_ai(
     found = sum(1 for x in quotes_dimeiggs if x.get("quote", {}).get("found") is True)
     from collections import Counter
     status_counts = Counter(x["quote"]["status"] for x in quotes_dimeiggs)
-    return JSONResponse({
-        "raw_text_preview": raw[:1500],
-        "lines_count": len(lines),
+    return FastJSONResponse({
+        "raw_text_preview": stream.preview,
+        "lines_count": stream.lines_count,
         "dubious_sent_to_ai": len(dub_lines),
         "items": [it.model_dump() for it in final.items],
         "quotes_dimeiggs": quotes_dimeiggs,
@@ -648,24 +1054,27 @@ async def parse_rules_plus_ai(
 async def parse_with_ai_only(
     file: UploadFile = File(...),
     use_vision: bool = True,  # Nuevo parámetro para usar visión
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     """
     Usa IA (LLM) para extraer TODOS los items del archivo.
-    No usa el parser de reglas, solo inteligencia artificial.
+    Un triage previo (app/doc_triage.py) elige el camino más barato que sirve:
+    reglas solas si el documento tiene buena capa de texto y el parser la
+    entiende, LLM de texto si no, y visión solo para páginas escaneadas.
     Ideal para archivos con formatos complejos o mal estructurados.
     
     Parámetros:
-    - use_vision: Si True (por defecto), usa GPT-4 Vision para PDFs (mejor precisión)
+    - use_vision: Si True (por defecto), permite GPT-4 Vision cuando el triage lo pide
                   Si False, usa solo extracción de texto + GPT-4o-mini
     
     Retorna:
     {
         "raw_text_preview": str,
-        "extraction_method": "ai_only" | "vision",
+        "extraction_method": "rules" | "ai_only" | "vision" | "mixed" | "rules_ai" | "rules_fallback",
         "items": [...],
         "curso": str | null,
-        "error": str | null
+        "error": str | null,
+        "triage": {...}
     }
     """
     ext = Path(file.filename).suffix.lower()
@@ -675,23 +1084,59 @@ async def parse_with_ai_only(
     path = UPLOAD_DIR / f"{uuid4().hex}{ext}"
     path.write_bytes(await file.read())
 
-    # Intentar usar visión primero si está habilitado y es PDF
+    _set_llm_priority_for(current_user)
+
     extraction_method = "ai_only"
     ai_result = None
 
+    # Triage: muestrea las primeras páginas y elige reglas / LLM de texto / visión
+    triage = await run_in_threadpool(triage_document, path)
+    print(f"🧭 Triage {file.filename}: {triage.route} ({triage.reason})")
+
     # Groq no soporta visión real; evita llamadas que fallan sin JSON
     if use_vision and ext == ".pdf" and os.getenv("LLM_PROVIDER", "groq").lower() != "openai":
         use_vision = False
 
-    if use_vision and ext == ".pdf":
+    # Sin visión, las páginas escaneadas no se pueden leer: el resto sigue el camino de su texto
+    route = triage.route
+    if route == ROUTE_VISION and not use_vision and triage.text_route:
+        route = triage.text_route
+
+    text_result = None
+    if use_vision and route == ROUTE_VISION:
+        # Documento mixto: las páginas escaneadas van a visión y, en paralelo, las
+        # con capa de texto a reglas + IA (las escaneadas no aportan texto: sin duplicados)
+        mixed = len(triage.scanned_pages) < (triage.pages_total or triage.pages_sampled)
+        pages = triage.scanned_pages if mixed else None
+        text_task = asyncio.ensure_future(_parse_rules_ai(path)) if mixed else None
         try:
-            print(f"🔍 Intentando extracción con GPT-4 Vision para {file.filename}...")
-            ai_result = call_llm_with_vision(path)
-            extraction_method = "vision"
-            print(f"✅ Extracción con visión exitosa: {len(ai_result.get('items', []))} items encontrados")
-        except Exception as e:
-            print(f"⚠️  Visión falló, usando extracción de texto: {e}")
-            ai_result = None
+            try:
+                print(f"🔍 Intentando extracción con GPT-4 Vision para {file.filename}...")
+                ai_result = await acall_llm_with_vision(path, pages=pages)
+                extraction_method = "vision"
+                print(f"✅ Extracción con visión exitosa: {len(ai_result.get('items', []))} items encontrados")
+            except Exception as e:
+                print(f"⚠️  Visión falló, usando extracción de texto: {e}")
+                ai_result = None
+            if text_task is not None:
+                try:
+                    text_result = await text_task
+                except Exception as e:
+                    print(f"⚠️  Reglas + IA de las páginas con texto fallaron: {e}")
+        finally:
+            if text_task is not None and not text_task.done():
+                text_task.cancel()
+
+        if text_result is not None and text_result["items"]:
+            vision_items = (ai_result or {}).get("items") or []
+            ai_result = dict(ai_result or {"curso": None}, items=text_result["items"] + vision_items)
+            extraction_method = "mixed" if vision_items else "rules_ai"
+    elif route == ROUTE_RULES:
+        # Capa de texto buena y el parser la entiende: sin LLM
+        _, rule_items = await run_in_threadpool(_run_rules, path)
+        ok_items = [it for it in rule_items if it.get("cantidad") is not None and it.get("detalle")]
+        ai_result = {"curso": None, "items": ok_items}
+        extraction_method = "rules"
     
     # Si visión falló o no está disponible, usar extracción de texto
     if ai_result is None or not ai_result.get("items"):
@@ -706,7 +1151,11 @@ async def parse_with_ai_only(
         # Usar IA para extraer todos los items
         try:
             print(f"🤖 Extrayendo con modelo de texto: {file.filename}...")
-            ai_result = call_llm_full_extraction(raw)
+            # Streaming: los items se van recibiendo mientras el modelo genera el resto
+            meta: Dict[str, Any] = {}
+            streamed = [it async for it in astream_llm_full_extraction(raw, meta=meta)]
+            ai_result = dict(meta, items=streamed)
+            extraction_method = "ai_only"
             print(f"✅ Extracción con texto exitosa: {len(ai_result.get('items', []))} items encontrados")
         except Exception as e:
             raise HTTPException(500, f"Error al procesar con IA: {str(e)}")
@@ -724,7 +1173,9 @@ async def parse_with_ai_only(
     
     # Preview del texto (solo si no usamos visión)
     raw_preview = ""
-    if extraction_method == "ai_only":
+    if text_result is not None and extraction_method in ("mixed", "rules_ai"):
+        raw_preview = text_result["raw_text_preview"]
+    elif extraction_method in ("ai_only", "rules"):
         try:
             raw = extract_text(path)
             raw_preview = raw[:1500]
@@ -741,12 +1192,13 @@ async def parse_with_ai_only(
     except Exception as e:
         raise HTTPException(500, f"Error al validar items: {str(e)}")
 
-    return JSONResponse({
+    return FastJSONResponse({
         "raw_text_preview": raw_preview,
         "extraction_method": extraction_method,
         "items": [it.model_dump() for it in validated_items],
         "curso": ai_result.get("curso"),
         "error": ai_result.get("error"),
+        "triage": triage.to_dict(),
         "summary": {
             "total_items": len(validated_items),
             "items_with_quantity": sum(1 for it in validated_items if it.cantidad and it.cantidad > 0),
@@ -758,76 +1210,47 @@ async def parse_with_ai_only(
 @api_router.post("/parse-ai-items-only")
 async def parse_items_without_quote(
     file: UploadFile = File(...),
-    current_user: Optional[User] = Depends(get_current_user_optional),
+    current_user: Optional[Principal] = Depends(get_current_user_optional),
 ):
     """
     Parsea el archivo y devuelve items para que el usuario los edite/seleccione.
     NO hace cotización. El usuario decide qué cotizar después.
     Permite uso sin autenticación (modo demo/gratis).
+    Si el mismo documento ya fue parseado (registro por hash), se reutiliza.
     """
     ext = Path(file.filename).suffix.lower()
     if ext not in (".pdf", ".docx", ".xlsx", ".xls"):
         raise HTTPException(400, "Formato no soportado.")
 
-    path = UPLOAD_DIR / f"{uuid4().hex}{ext}"
-    path.write_bytes(await file.read())
-
-    raw = extract_text(path)
-    lines = split_lines(raw)
-
-    # 1) reglas
-    parsed = parse_with_rules(lines)
-
-    # 2) mandar solo lo dudoso a IA
-    dub_lines = find_dubious_lines(parsed)
-    fixed_items: List[Dict[str, Any]] = []
-    if dub_lines:
-        try:
-            fixed = call_llm_fix(dub_lines)
-            raw_items = fixed.get("items") if isinstance(fixed, dict) else []
-            fixed_items = [x for x in (raw_items or []) if isinstance(x, dict)]
-        except Exception:
-            fixed_items = []
-
-    # 3) merge: items buenos + fixes
-    ok_items: List[Dict[str, Any]] = []
-    for it in parsed["items"]:
-        if it.get("cantidad") is not None and it.get("detalle"):
-            ok_items.append(it)
-
-    merged = ok_items + fixed_items
-    merged = normalize_items(merged)
+    # reglas + IA para lo dudoso (o resultado registrado)
+    _set_llm_priority_for(current_user)
+    result = await _parse_upload_cached(await file.read(), ext)
 
-    # 4) salida final validada (SIN cotización)
+    # salida final validada (SIN cotización)
     # El frontend maneja el límite de selección en modo demo
-    final = ParsedList(
-        raw_text_preview=raw[:1500],
-        lines_count=len(lines),
-        curso=None,
-        items=[ParsedItem(**x) for x in merged],
-    )
-    
-    return JSONResponse({
-        "raw_text_preview": raw[:1500],
-        "lines_count": len(lines),
-        "dubious_sent_to_ai": len(dub_lines),
-        "items": [it.model_dump() for it in final.items],
-        "total_items_found": len(ok_items + fixed_items),
+    return FastJSONResponse({
+        "raw_text_preview": result["raw_text_preview"],
+        "lines_count": result["lines_count"],
+        "dubious_sent_to_ai": result["dubious_sent_to_ai"],
+        "items": result["items"],
+        "total_items_found": len(result["items"]),
     })
 
 
 @api_router.post("/quote/dimeiggs")
 async def quote_in_dimeiggs(payload: dict = Body(...)):
+    from app.quoting.dimeiggs_quote import quote_dimeiggs
     query = (payload.get("query") or "").strip()
     if not query:
         raise HTTPException(400, "Falta 'query'.")
 
     res = quote_dimeiggs(query, limit=8)
-    return JSONResponse(res)
+    return FastJSONResponse(res)
 
 
 @api_router.post("/parse-ai-quote/dimeiggs")
 async def parse_ai_and_quote_dimeiggs(file: UploadFile = File(...)):
+    from app.quoting.dimeiggs_quote import quote_dimeiggs
     ext = Path(file.filename).suffix.lower()
     if ext not in (".pdf", ".docx", ".xlsx", ".xls"):
         raise HTTPException(400, "Formato no soportado.")
@@ -835,17 +1258,15 @@ async def parse_ai_and_quote_dimeiggs(file: UploadFile = File(...)):
     path = UPLOAD_DIR / f"{uuid4().hex}{ext}"
     path.write_bytes(await file.read())
 
-    raw = extract_text(path)
-    lines = split_lines(raw)
-
-    parsed = parse_with_rules(lines)
+    stream = RulesParseStream(iter_pages(path))
+    parsed = {"curso": None, "items": list(stream)}
     dub_lines = find_dubious_lines(parsed)
 
     fixed_items = []
     llm_error = None
     if dub_lines:
         try:
-            fixed = call_llm_fix(dub_lines)
+            fixed = await acall_llm_fix_cached(dub_lines)
             raw_items = fixed.get("items") if isinstance(fixed, dict) else []
             fixed_items = [x for x in (raw_items or []) if isinstance(x, dict)]
         except Exception as e:
@@ -936,9 +1357,9 @@ async def parse_ai_and_quote_dimeiggs(file: UploadFile = File(...)):
         "currency": "CLP",
     }
 
-    return JSONResponse({
-        "raw_text_preview": raw[:1500],
-        "lines_count": len(lines),
+    return FastJSONResponse({
+        "raw_text_preview": stream.preview,
+        "lines_count": stream.lines_count,
         "dubious_sent_to_ai": len(dub_lines),
         "resume": resume,
         "items": final_items,
@@ -948,8 +1369,11 @@ async def parse_ai_and_quote_dimeiggs(file: UploadFile = File(...)):
 
 @api_router.post("/quote/multi-providers")
 async def quote_multi_endpoint(
+    request: Request,
     payload: dict = Body(...),
-    current_user: Optional[User] = Depends(get_current_user_optional),
+    compact: bool = False,
+    all_hits: bool = False,
+    current_user: Optional[Principal] = Depends(get_current_user_optional),
 ):
     """
     Busca un producto en múltiples proveedores (EN PARALELO - MÁS RÁPIDO).
@@ -963,10 +1387,14 @@ async def quote_multi_endpoint(
         "providers": ["dimeiggs", "libreria_nacional", "jamila", "coloranimal", "pronobel", "prisa", "lasecretaria"],  # opcional
         "limit_per_provider": 5,  # opcional, default 5
     }
+
+    Query params: compact=1 devuelve solo el mejor hit con campos básicos
+    (all_hits=1 para todos).
     
     Respuesta: Consolidada, ordenada por relevancia y precio.
     Tiempo aproximado: 1-3 segundos (depende de proveedores)
     """
+    from app.quoting.multi_provider import quote_multi_providers
     try:
         query = (payload.get("query") or "").strip()
         if not query:
@@ -975,64 +1403,27 @@ async def quote_multi_endpoint(
         providers = payload.get("providers")  # None = dimeiggs + libreria_nacional
         limit_per_provider = payload.get("limit_per_provider", 5)
 
-        # MODO DEMO: Limitar a 2 proveedores si no está autenticado
-        all_providers = [
-            "dimeiggs",
-            "libreria_nacional",
-            "jamila",
-            "coloranimal",
-            "pronobel",
-            "prisa",
-            "lasecretaria",
-        ]
-        providers_limited_by_plan = False
-        db = SessionLocal()
-        try:
-            plans_enabled = get_setting_bool(db, "plans_enabled", True)
-            is_demo_mode = current_user is None and plans_enabled
-
-            if not plans_enabled:
-                if not providers:
-                    providers = all_providers
-            elif is_demo_mode:
-                if providers:
-                    providers = providers[:2]
-                    providers_limited_by_plan = True
-                else:
-                    providers = ["dimeiggs", "libreria_nacional"]  # Default para demo: solo 2
-            else:
-                # Usuario autenticado: verificar límites y auto-limitar si es necesario
-                from app.payment import get_user_limits
-
-                limits = get_user_limits(current_user.id, db)
-                max_providers = limits["max_providers"]
-                if max_providers is None:
-                    if not providers:
-                        providers = all_providers
-                else:
-                    if providers and len(providers) > max_providers:
-                        print(f"[INFO] Usuario {current_user.id} solicitó {len(providers)} proveedores, limitado a {max_providers}")
-                        providers = providers[:max_providers]
-                        providers_limited_by_plan = True
-                    elif not providers:
-                        # Si no especificó proveedores, usar default según plan
-                        if max_providers >= 5:
-                            providers = ["dimeiggs", "libreria_nacional", "jamila", "coloranimal", "pronobel"][:max_providers]
-                        else:
-                            providers = ["dimeiggs", "libreria_nacional"][:max_providers]
-        finally:
-            db.close()
+        # Límites del plan (demo: 2 proveedores), resueltos una vez y cacheados
+        ent = get_entitlements(current_user.id if current_user else None)
+        is_demo_mode = ent.is_demo
+        providers, providers_limited_by_plan = ent.limit_providers(providers)
+        if providers_limited_by_plan and not is_demo_mode:
+            print(f"[INFO] Usuario {current_user.id} limitado a {ent.max_providers} proveedores")
+        set_provider_tier(tier_for(ent))
         
         print(f"[DEBUG] quote_multi_endpoint: user={current_user.id if current_user else 'demo'}, query={query}, providers={providers}, limited={providers_limited_by_plan}")
 
-        # Búsqueda paralela - mucho más rápida
+        # Búsqueda paralela - mucho más rápida (en el threadpool, con cupo: demo y
+        # usuarios con sesión tienen pools separados; sin cupo a tiempo → 429)
         print(f"[DEBUG] Iniciando búsqueda: {query} en {providers}")
-        result = quote_multi_providers(
-            query,
-            providers=providers,
-            limit_per_provider=limit_per_provider,
-            max_results=15,
-        )
+        async with admission(request, current_user):
+            result = await run_in_threadpool(
+                quote_multi_providers,
+                query,
+                providers=providers,
+                limit_per_provider=limit_per_provider,
+                max_results=15,
+            )
         print(f"[DEBUG] Búsqueda completada: {len(result.get('consolidated', []))} resultados")
         
         # Agregar info de modo demo y limitación a la respuesta
@@ -1044,7 +1435,7 @@ async def quote_multi_endpoint(
             result["was_limited"] = True
             result["limited_message"] = f"Se limitó a {len(providers)} proveedores según tu plan. Actualiza tu plan para acceder a más."
 
-        return JSONResponse(result)
+        return FastJSONResponse(compact_payload(result, all_hits) if compact else result)
     except HTTPException:
         raise
     except Exception as e:
@@ -1056,8 +1447,11 @@ async def quote_multi_endpoint(
 
 @api_router.post("/quote/multi-providers/batch")
 async def quote_multi_batch_endpoint(
+    request: Request,
     payload: dict = Body(...),
-    current_user: Optional[User] = Depends(get_current_user_optional),
+    compact: bool = False,
+    all_hits: bool = False,
+    current_user: Optional[Principal] = Depends(get_current_user_optional),
 ):
     """
     Cotiza múltiples items en una sola llamada.
@@ -1071,6 +1465,9 @@ async def quote_multi_batch_endpoint(
         "providers": ["dimeiggs", "libreria_nacional", ...],  # opcional
         "limit_per_provider": 5  # opcional
     }
+
+    Query params: compact=1 proyecta cada cotización (totales + mejor hit);
+    all_hits=1 agrega todos los hits en formato compacto.
     """
     try:
         items = payload.get("items") or []
@@ -1080,122 +1477,24 @@ async def quote_multi_batch_endpoint(
         providers = payload.get("providers")
         limit_per_provider = payload.get("limit_per_provider", 5)
 
-        all_providers = [
-            "dimeiggs",
-            "libreria_nacional",
-            "jamila",
-            "coloranimal",
-            "pronobel",
-            "prisa",
-            "lasecretaria",
-        ]
-        providers_limited_by_plan = False
-
-        db = SessionLocal()
-        try:
-            plans_enabled = get_setting_bool(db, "plans_enabled", True)
-            is_demo_mode = current_user is None and plans_enabled
-
-            if not plans_enabled:
-                if not providers:
-                    providers = all_providers
-            elif is_demo_mode:
-                if providers:
-                    providers = providers[:2]
-                    providers_limited_by_plan = True
-                else:
-                    providers = ["dimeiggs", "libreria_nacional"]
-            else:
-                from app.payment import get_user_limits
-
-                limits = get_user_limits(current_user.id, db)
-                max_providers = limits["max_providers"]
-                if max_providers is None:
-                    if not providers:
-                        providers = all_providers
-                else:
-                    if providers and len(providers) > max_providers:
-                        print(
-                            f"[INFO] Usuario {current_user.id} solicitó {len(providers)} proveedores, limitado a {max_providers}"
-                        )
-                        providers = providers[:max_providers]
-                        providers_limited_by_plan = True
-                    elif not providers:
-                        if max_providers >= 5:
-                            providers = [
-                                "dimeiggs",
-                                "libreria_nacional",
-                                "jamila",
-                                "coloranimal",
-                                "pronobel",
-                            ][:max_providers]
-                        else:
-                            providers = ["dimeiggs", "libreria_nacional"][:max_providers]
-        finally:
-            db.close()
-
-        normalized_items: List[Dict[str, Any]] = []
-        for it in items:
-            if not isinstance(it, dict):
-                continue
-            detalle = (it.get("detalle") or it.get("item_original") or "").strip()
-            if not detalle:
-                continue
-            cantidad = it.get("cantidad") or it.get("quantity") or 1
-            try:
-                cantidad = int(cantidad)
-            except Exception:
-                cantidad = 1
-            normalized_items.append({
-                "detalle": detalle,
-                "cantidad": cantidad,
-                "item_original": it.get("item_original") or detalle,
-            })
+        # Límites del plan (demo: 2 proveedores), resueltos una vez y cacheados
+        ent = get_entitlements(current_user.id if current_user else None)
+        is_demo_mode = ent.is_demo
+        providers, providers_limited_by_plan = ent.limit_providers(providers)
+        if providers_limited_by_plan and not is_demo_mode:
+            print(f"[INFO] Usuario {current_user.id} limitado a {ent.max_providers} proveedores")
+        set_provider_tier(tier_for(ent))
 
+        normalized_items = _normalize_batch_items(items)
         if not normalized_items:
             raise HTTPException(400, "No hay items válidos para cotizar.")
 
-        results: List[Dict[str, Any]] = [None] * len(normalized_items)
-        max_workers = min(6, len(normalized_items))
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {
-                executor.submit(
-                    _quote_single_item,
-                    item,
-                    providers,
-                    limit_per_provider,
-                ): idx
-                for idx, item in enumerate(normalized_items)
-            }
-            for future in futures:
-                idx = futures[future]
-                try:
-                    results[idx] = future.result()
-                except Exception as e:
-                    results[idx] = {
-                        "detalle": normalized_items[idx].get("detalle"),
-                        "cantidad": normalized_items[idx].get("cantidad"),
-                        "item_original": normalized_items[idx].get("item_original"),
-                        "quote": {
-                            "status": "error",
-                            "reason": f"Error: {str(e)[:100]}",
-                        },
-                    }
-
-        response = {
-            "items": results,
-            "providers": providers,
-            "is_demo_mode": is_demo_mode,
-        }
-
-        if is_demo_mode:
-            response["demo_message"] = "Modo prueba: máximo 2 proveedores. Regístrate para acceso completo."
-        if providers_limited_by_plan:
-            response["was_limited"] = True
-            response["limited_message"] = f"Se limitó a {len(providers)} proveedores según tu plan. Actualiza tu plan para acceder a más."
-
-        return JSONResponse(response)
-    except HTTPException:
+        # Si el cliente cierra el modal, se deja de cotizar lo pendiente
+        async with admission(request, current_user):
+            results = await run_cancellable(request, _quote_items(normalized_items, providers, limit_per_provider))
+        response = _batch_response(results, providers, is_demo_mode, providers_limited_by_plan)
+        return FastJSONResponse(compact_payload(response, all_hits) if compact else response)
+    except (HTTPException, ClientDisconnected):
         raise
     except Exception as e:
         print(f"[ERROR] Error inesperado en quote_multi_batch_endpoint: {e}")
@@ -1204,11 +1503,92 @@ async def quote_multi_batch_endpoint(
         raise HTTPException(500, f"Error en la búsqueda: {str(e)}")
 
 
+@api_router.post("/quote/multi-providers/batch/stream")
+async def quote_multi_batch_stream_endpoint(
+    request: Request,
+    payload: dict = Body(...),
+    compact: bool = False,
+    all_hits: bool = False,
+    current_user: Optional[Principal] = Depends(get_current_user_optional),
+):
+    """
+    Igual que /quote/multi-providers/batch, pero responde con Server-Sent
+    Events a medida que avanza (mismo payload):
+
+    - start:    {"items_total", "providers", "is_demo_mode"}
+    - provider: {"index", "provider", "hits", "error"} por proveedor terminado
+    - item:     {"index", "item", "items_quoted", ...} apenas se cotiza cada item
+    - summary:  la respuesta del endpoint síncrono sin "items" + totales
+    - error:    {"detail"} si la cotización falla
+
+    Con compact=1 los items de los eventos "item" van en formato compacto.
+    """
+    items = payload.get("items") or []
+    if not isinstance(items, list) or not items:
+        raise HTTPException(400, "Falta 'items' o está vacío.")
+
+    limit_per_provider = payload.get("limit_per_provider", 5)
+    ent = get_entitlements(current_user.id if current_user else None)
+    providers, providers_limited_by_plan = ent.limit_providers(payload.get("providers"))
+    set_provider_tier(tier_for(ent))
+
+    normalized_items = _normalize_batch_items(items)
+    if not normalized_items:
+        raise HTTPException(400, "No hay items válidos para cotizar.")
+
+    # El cupo se toma antes de responder (para poder devolver 429) y se libera al
+    # terminar el stream o, si nunca se itera, en la tarea de fondo
+    ticket = await acquire_admission(request, current_user)
+
+    async def events():
+        try:
+            stream = QuoteEventStream(item_view=partial(compact_item, all_hits=all_hits) if compact else None)
+            stream.add_parsed(len(normalized_items))
+            yield sse_event("start", {
+                "items_total": len(normalized_items),
+                "providers": providers,
+                "is_demo_mode": ent.is_demo,
+            })
+            task, token = start_cancellable(
+                _quote_items(normalized_items, providers, limit_per_provider, progress=stream)
+            )
+            try:
+                async for event in stream.events_until(task):
+                    yield event
+            finally:
+                # Starlette cancela el generador si el cliente se desconecta
+                if not task.done():
+                    count("requests_cancelled")
+                    abandon(task, token)
+            try:
+                results = task.result()
+            except Exception as e:
+                print(f"[ERROR] Error inesperado en quote_multi_batch_stream_endpoint: {e}")
+                yield sse_event("error", {"detail": f"Error en la búsqueda: {str(e)}"})
+                return
+            summary = _batch_response(results, providers, ent.is_demo, providers_limited_by_plan)
+            del summary["items"]
+            summary.update(_summarize_quotes(results))
+            yield sse_event("summary", summary)
+        finally:
+            ticket.release()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},  # sin buffer en proxies
+        background=BackgroundTask(ticket.release),
+    )
+
+
 @api_router.post("/parse-ai-quote/multi-providers")
 async def parse_ai_and_quote_multi_providers(
+    request: Request,
     file: UploadFile = File(...),
     providers: str = "dimeiggs,libreria_nacional,jamila,coloranimal,pronobel,prisa,lasecretaria",  # CSV list
-    current_user: Optional[User] = Depends(get_current_user_optional),
+    compact: bool = False,
+    all_hits: bool = False,
+    current_user: Optional[Principal] = Depends(get_current_user_optional),
 ):
     """
     Parse + AI fix + cotización multi-proveedor en una llamada.
@@ -1218,111 +1598,302 @@ async def parse_ai_and_quote_multi_providers(
     
     Query params:
     - providers: CSV de proveedores (e.g., "dimeiggs,libreria_nacional,jamila,coloranimal,pronobel,prisa,lasecretaria")
+    - compact: sin raw_text_preview y solo el mejor hit por item (all_hits=1 para todos)
     """
     ext = Path(file.filename).suffix.lower()
     if ext not in (".pdf", ".docx", ".xlsx", ".xls"):
         raise HTTPException(400, "Formato no soportado.")
 
-    path = UPLOAD_DIR / f"{uuid4().hex}{ext}"
-    path.write_bytes(await file.read())
-
-    raw = extract_text(path)
-    lines = split_lines(raw)
-
-    parsed = parse_with_rules(lines)
-    dub_lines = find_dubious_lines(parsed)
+    _set_llm_priority_for(current_user)
+    set_provider_tier(_provider_tier_for(current_user))
 
-    fixed_items = []
-    llm_error = None
-    if dub_lines:
-        try:
-            fixed = call_llm_fix(dub_lines)
-            # Manejo robusto: call_llm_fix devuelve dict
-            fixed_items = fixed.get("items", []) if isinstance(fixed, dict) else []
-        except Exception as e:
-            llm_error = str(e)
-            fixed_items = []
-
-    ok_items = [it for it in parsed["items"] if it.get("cantidad") is not None and it.get("detalle")]
-    merged = normalize_items(ok_items + fixed_items)
-    
-    # MODO DEMO: Limitar a 5 productos si no está autenticado
-    db = SessionLocal()
-    try:
-        plans_enabled = get_setting_bool(db, "plans_enabled", True)
-    finally:
-        db.close()
-
-    is_demo_mode = current_user is None and plans_enabled
-    original_item_count = len(merged)
-    if is_demo_mode and len(merged) > 5:
-        merged = merged[:5]
-    
-    final_items = [ParsedItem(**x).model_dump() for x in merged]
+    # MODO DEMO: Limitar a 5 productos y 2 proveedores si no está autenticado
+    is_demo_mode = get_entitlements(current_user.id if current_user else None).is_demo
 
     # Parse providers
     provider_list = [p.strip().lower() for p in providers.split(",") if p.strip()]
     if not provider_list:
-        provider_list = ["dimeiggs", "libreria_nacional", "jamila", "coloranimal", "pronobel", "prisa", "lasecretaria"]
-    
-    # MODO DEMO: Limitar a 2 proveedores si no está autenticado
+        provider_list = list(ALL_PROVIDERS)
     if is_demo_mode:
         provider_list = provider_list[:2]
 
-    # ---- COTIZACIÓN MULTI-PROVEEDOR EN PARALELO ----
-    # Usa ThreadPoolExecutor para cotizar múltiples items simultáneamente
-    with ThreadPoolExecutor(max_workers=min(4, len(final_items))) as executor:
-        # Submit todas las tareas de cotización
-        futures = [
-            executor.submit(_quote_single_item, item, provider_list)
-            for item in final_items
-        ]
-        # Recolecta resultados a medida que terminan
-        final_items = [future.result() for future in futures]
+    # ---- PARSEO + COTIZACIÓN MULTI-PROVEEDOR SOLAPADOS ----
+    # reglas + IA para lo dudoso (o resultado registrado por hash); cada item
+    # se cotiza apenas está listo, sin esperar al LLM
+    # (si el cliente se desconecta se cancelan el LLM y lo que falte cotizar)
+    content = await file.read()
+    async with admission(request, current_user):
+        result = await run_cancellable(request, _parse_and_quote_overlapped(
+            content, ext, provider_list,
+            max_quoted=5 if is_demo_mode else None,
+        ))
+
+    response = _parse_quote_response(result, provider_list, is_demo_mode)
+    return FastJSONResponse(compact_payload(response, all_hits) if compact else response)
+
+
+# ============ JOBS EN SEGUNDO PLANO (parseo + cotización con progreso) ============
+
+@register_job_runner("parse_quote")
+async def _run_parse_quote_job(params: Dict[str, Any], progress: QuoteProgress) -> Dict[str, Any]:
+    path = Path(params["path"])
+    if not path.exists():
+        raise FileNotFoundError("El archivo del job ya no está disponible; vuelve a subirlo.")
+    set_llm_priority(params.get("priority", PRIORITY_FREE))
+    set_provider_tier(params.get("tier", TIER_FREE))
+    result = await _parse_and_quote_overlapped(
+        path.read_bytes(), params["ext"], params["providers"],
+        max_quoted=params.get("max_quoted"), progress=progress,
+    )
+    return _parse_quote_response(result, params["providers"], params["is_demo_mode"])
 
-    # Calcula resumen
-    subtotal = 0.0
-    priced = 0
-    missing = 0
-    total_qty = 0
 
-    for it in final_items:
-        qty = int(it.get("cantidad") or 1)
-        total_qty += qty
+@register_job_runner("batch_quote")
+async def _run_batch_quote_job(params: Dict[str, Any], progress: QuoteProgress) -> Dict[str, Any]:
+    set_provider_tier(params.get("tier", TIER_FREE))
+    progress.add_parsed(len(params["items"]))
+    results = await _quote_items(
+        params["items"], params["providers"], params.get("limit_per_provider", 5), progress=progress,
+    )
+    return _batch_response(results, params["providers"], params["is_demo_mode"], params.get("was_limited", False))
 
-        q = it.get("quote", {})
-        
-        if q.get("status") in ("ok", "partial") and q.get("line_total"):
-            subtotal += q["line_total"]
-            priced += 1
-        else:
-            missing += 1
 
-    resume = {
-        "items_total": len(final_items),
-        "items_priced": priced,
-        "items_missing": missing,
-        "total_items_qty": total_qty,
-        "subtotal": int(round(subtotal)),
-        "currency": "CLP",
-        "providers_used": provider_list,
-        "is_demo_mode": is_demo_mode,
-    }
-    
-    # Agregar mensaje de demo si aplica
+def _job_accepted(job_id: str) -> FastJSONResponse:
+    return FastJSONResponse(
+        status_code=202,
+        content={"job_id": job_id, "status": "queued", "status_url": f"/api/jobs/{job_id}"},
+    )
+
+
+@api_router.post("/jobs/parse-ai-quote/multi-providers")
+async def submit_parse_quote_job(
+    request: Request,
+    file: UploadFile = File(...),
+    providers: str = "dimeiggs,libreria_nacional,jamila,coloranimal,pronobel,prisa,lasecretaria",  # CSV list
+    current_user: Optional[Principal] = Depends(get_current_user_optional),
+):
+    """
+    Igual que /parse-ai-quote/multi-providers pero en segundo plano: responde
+    de inmediato con job_id; el avance y los items ya cotizados se consultan
+    en GET /api/jobs/{job_id}. Ocupa un cupo de admisión (con límite por IP
+    para demo) desde que se encola hasta que termina.
+    """
+    ext = Path(file.filename).suffix.lower()
+    if ext not in (".pdf", ".docx", ".xlsx", ".xls"):
+        raise HTTPException(400, "Formato no soportado.")
+
+    is_demo_mode = get_entitlements(current_user.id if current_user else None).is_demo
+    provider_list = [p.strip().lower() for p in providers.split(",") if p.strip()] or list(ALL_PROVIDERS)
     if is_demo_mode:
-        resume["demo_message"] = "Modo prueba: máximo 5 productos y 2 proveedores. Regístrate para acceso completo."
-        resume["demo_items_limit_applied"] = original_item_count > 5
-        resume["total_items_found"] = original_item_count
+        provider_list = provider_list[:2]
 
-    return JSONResponse({
-        "raw_text_preview": raw[:1500],
-        "lines_count": len(lines),
-        "dubious_sent_to_ai": len(dub_lines),
-        "resume": resume,
-        "items": final_items,
-        "llm_error": llm_error,
+    ticket = await acquire_admission(request, current_user)
+    path = UPLOAD_DIR / f"{uuid4().hex}{ext}"
+    try:
+        path.write_bytes(await file.read())
+    except BaseException:
+        ticket.release()
+        raise
+
+    job_id = await submit_job("parse_quote", {
+        "path": str(path),
+        "ext": ext,
+        "providers": provider_list,
+        "max_quoted": 5 if is_demo_mode else None,
+        "is_demo_mode": is_demo_mode,
+        "priority": _llm_priority_for(current_user),
+        "tier": _provider_tier_for(current_user),
+    }, user_id=current_user.id if current_user else None, on_finish=ticket.release)
+    return _job_accepted(job_id)
+
+
+@api_router.post("/jobs/quote/multi-providers/batch")
+async def submit_batch_quote_job(
+    request: Request,
+    payload: dict = Body(...),
+    current_user: Optional[Principal] = Depends(get_current_user_optional),
+):
+    """
+    Igual que /quote/multi-providers/batch pero en segundo plano (ver GET /api/jobs/{job_id}).
+    Ocupa un cupo de admisión desde que se encola hasta que termina.
+    """
+    items = payload.get("items") or []
+    if not isinstance(items, list) or not items:
+        raise HTTPException(400, "Falta 'items' o está vacío.")
+
+    ent = get_entitlements(current_user.id if current_user else None)
+    providers, providers_limited_by_plan = ent.limit_providers(payload.get("providers"))
+
+    normalized_items = _normalize_batch_items(items)
+    if not normalized_items:
+        raise HTTPException(400, "No hay items válidos para cotizar.")
+
+    ticket = await acquire_admission(request, current_user)
+    job_id = await submit_job("batch_quote", {
+        "items": normalized_items,
+        "providers": providers,
+        "limit_per_provider": payload.get("limit_per_provider", 5),
+        "is_demo_mode": ent.is_demo,
+        "was_limited": providers_limited_by_plan,
+        "tier": tier_for(ent),
+    }, user_id=current_user.id if current_user else None, on_finish=ticket.release)
+    return _job_accepted(job_id)
+
+
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", "20"))
+BULK_PARSE_CONCURRENCY = int(os.getenv("BULK_PARSE_CONCURRENCY", "4"))
+BULK_EXTENSIONS = (".pdf", ".docx", ".xlsx", ".xls")
+
+
+def _bulk_query_key(item: Dict[str, Any]) -> Optional[str]:
+    """Clave de deduplicación entre listas (None = el item no se busca en proveedores)."""
+    from app.quoting.multi_provider import normalize_text
+    if item.get("tipo") == "lectura":
+        return None
+    detalle = (item.get("detalle") or "").strip()
+    return normalize_text(detalle) or None
+
+
+def _fan_out_quote(item: Dict[str, Any], quote: Dict[str, Any]) -> Dict[str, Any]:
+    """Copia la cotización de la consulta única al item, con el total según su cantidad."""
+    quote = dict(quote)
+    if quote.get("unit_price"):
+        quote["line_total"] = quote["unit_price"] * int(item.get("cantidad") or 1)
+    return dict(item, quote=quote)
+
+
+@register_job_runner("bulk_parse_quote")
+async def _run_bulk_parse_quote_job(params: Dict[str, Any], progress: QuoteProgress) -> Dict[str, Any]:
+    """
+    Cotización de todo un colegio: parsea las listas en paralelo, cotiza cada
+    consulta normalizada una sola vez y reparte los precios a cada lista.
+    """
+    set_llm_priority(params.get("priority", PRIORITY_FREE))
+    set_provider_tier(params.get("tier", TIER_FREE))
+    providers = params["providers"]
+    progress.set_stage(STAGE_PARSING)
+
+    semaphore = asyncio.Semaphore(BULK_PARSE_CONCURRENCY)
+
+    async def parse(entry: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            path = Path(entry["path"])
+            if not path.exists():
+                raise FileNotFoundError(f"{entry['filename']}: el archivo ya no está disponible; vuelve a subirlo.")
+            parsed = await _parse_upload_cached(path.read_bytes(), entry["ext"])
+        progress.add_parsed(len(parsed["items"]))
+        return parsed
+
+    # Una lista que falla (archivo perdido, parseo con error) no tira el trabajo de las demás;
+    # cada parseo usa sus propias sesiones cortas (ver _parse_upload_cached)
+    outcomes = await asyncio.gather(*(parse(entry) for entry in params["files"]), return_exceptions=True)
+    parsed_lists = [None if isinstance(o, Exception) else o for o in outcomes]
+
+    # Una consulta por detalle normalizado (cantidad 1: el total se calcula por item)
+    unique: Dict[str, Dict[str, Any]] = {}
+    for parsed in filter(None, parsed_lists):
+        for item in parsed["items"]:
+            key = _bulk_query_key(item)
+            if key is not None and key not in unique:
+                unique[key] = {"detalle": item["detalle"], "cantidad": 1, "item_original": item["detalle"]}
+
+    keys = list(unique)
+    quoted = await _quote_items([unique[k] for k in keys], providers, progress=progress) if keys else []
+    quote_by_key = {key: it["quote"] for key, it in zip(keys, quoted)}
+
+    lists = []
+    all_items: List[Dict[str, Any]] = []
+    for entry, parsed, outcome in zip(params["files"], parsed_lists, outcomes):
+        if parsed is None:
+            print(f"⚠️  Cotización masiva: falló {entry['filename']}: {outcome}")
+            lists.append({"filename": entry["filename"], "error": str(outcome), "items": []})
+            continue
+        final_items = []
+        for item in parsed["items"]:
+            key = _bulk_query_key(item)
+            if key is None:  # mismos estados que _quote_single_item, sin buscar
+                if item.get("tipo") == "lectura":
+                    skip = {"status": "skip", "reason": "lectura/libro"}
+                else:
+                    skip = {"status": "not_found", "reason": "Sin detalle"}
+                final_items.append(dict(item, quote=skip))
+            else:
+                final_items.append(_fan_out_quote(item, quote_by_key[key]))
+        all_items.extend(final_items)
+        response = _parse_quote_response(dict(parsed, quoted_items=final_items), providers, False)
+        response["filename"] = entry["filename"]
+        lists.append(response)
+
+    summary = _summarize_quotes(all_items)
+    summary.update({
+        "lists": len(lists),
+        "lists_failed": sum(1 for parsed in parsed_lists if parsed is None),
+        "unique_queries": len(keys),
+        "quotes_saved": sum(1 for it in all_items if _bulk_query_key(it) is not None) - len(keys),
+        "providers_used": providers,
     })
+    return {"lists": lists, "summary": summary}
+
+
+@api_router.post("/jobs/parse-ai-quote/bulk")
+async def submit_bulk_parse_quote_job(
+    files: List[UploadFile] = File(...),
+    providers: Optional[str] = None,  # CSV; por defecto, los del plan
+    current_user: Principal = Depends(get_current_user),
+):
+    """
+    Cotización de varias listas a la vez (p.ej. un PDF por curso). Las consultas
+    repetidas entre listas se cotizan una sola vez. Responde con job_id;
+    GET /api/jobs/{job_id} entrega al terminar {"lists": [...], "summary": {...}}:
+    una respuesta por lista (igual a /parse-ai-quote/multi-providers) y el total combinado.
+    """
+    if not files:
+        raise HTTPException(400, "No se recibieron archivos.")
+    if len(files) > BULK_MAX_FILES:
+        raise HTTPException(400, f"Máximo {BULK_MAX_FILES} archivos por cotización.")
+    for f in files:
+        if Path(f.filename).suffix.lower() not in BULK_EXTENSIONS:
+            raise HTTPException(400, f"Formato no soportado: {f.filename}")
+
+    requested = [p.strip().lower() for p in (providers or "").split(",") if p.strip()] or None
+    provider_list, _ = get_entitlements(current_user.id).limit_providers(requested)
+
+    entries = []
+    for f in files:
+        ext = Path(f.filename).suffix.lower()
+        path = UPLOAD_DIR / f"{uuid4().hex}{ext}"
+        path.write_bytes(await f.read())
+        entries.append({"path": str(path), "ext": ext, "filename": f.filename})
+
+    job_id = await submit_job("bulk_parse_quote", {
+        "files": entries,
+        "providers": provider_list,
+        "priority": _llm_priority_for(current_user),
+        "tier": _provider_tier_for(current_user),
+    }, user_id=current_user.id)
+    return _job_accepted(job_id)
+
+
+@api_router.get("/jobs/{job_id}")
+async def get_job_status(
+    job_id: str,
+    compact: bool = False,
+    all_hits: bool = False,
+    current_user: Optional[Principal] = Depends(get_current_user_optional),
+    db: Session = Depends(get_db),
+):
+    """
+    Estado de un job: status (queued | running | done | error), etapa,
+    contadores (items parseados/cotizados, proveedores pendientes) y los items
+    ya cotizados; al terminar, "result" trae la misma respuesta del endpoint síncrono.
+    Acepta compact / all_hits igual que los endpoints síncronos.
+    """
+    job = get_job(db, job_id)
+    # Los jobs con usuario solo los ve su dueño; los de demo, quien tenga el id
+    if job is None or (job.user_id is not None and (current_user is None or current_user.id != job.user_id)):
+        raise HTTPException(404, "Job no encontrado")
+    data = job_to_dict(job)
+    return FastJSONResponse(compact_payload(data, all_hits) if compact else data)
 
 # Endpoint para construir URLs de carrito inteligentes
 @api_router.post("/cart-urls")
@@ -1413,7 +1984,7 @@ async def get_plans(db: Session = Depends(get_db)):
 
 @api_router.get("/user/subscription")
 async def get_subscription(
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """Obtiene suscripción actual del usuario"""
@@ -1424,15 +1995,15 @@ async def get_subscription(
 
 @api_router.get("/user/limits")
 async def get_user_plan_limits(
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """Obtiene los límites del plan del usuario"""
-    from app.payment import get_user_limits, get_user_subscription
     from app.database import SavedQuote
     from datetime import datetime
 
-    if not get_setting_bool(db, "plans_enabled", True):
+    ent = get_entitlements(current_user.id)
+    if not ent.plans_enabled:
         return {
             "plan": "unlimited",
             "limits": {
@@ -1447,8 +2018,7 @@ async def get_user_plan_limits(
             },
         }
     
-    limits = get_user_limits(current_user.id, db)
-    subscription = get_user_subscription(current_user.id, db)
+    limits = ent.limits
     
     # Contar cotizaciones del mes actual
     now = datetime.utcnow()
@@ -1465,7 +2035,7 @@ async def get_user_plan_limits(
     ).count()
     
     return {
-        "plan": subscription.get("plan_name", "free") if subscription else "free",
+        "plan": ent.plan_name,
         "limits": {
             "max_items": limits["max_items"],
             "max_providers": limits["max_providers"],
@@ -1484,7 +2054,7 @@ async def get_user_plan_limits(
 @api_router.post("/suggestions")
 async def create_suggestion(
     suggestion: ProviderSuggestionCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """Crear una sugerencia de nuevo proveedor"""
@@ -1503,7 +2073,7 @@ async def create_suggestion(
 
 @api_router.get("/suggestions")
 async def get_user_suggestions(
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """Obtener sugerencias del usuario"""
@@ -1515,7 +2085,7 @@ async def get_user_suggestions(
 
 @api_router.get("/suggestions/admin/all")
 async def get_all_suggestions(
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """Obtener todas las sugerencias (solo admins)"""
@@ -1530,7 +2100,7 @@ async def get_all_suggestions(
 async def update_suggestion(
     suggestion_id: int,
     update: ProviderSuggestionUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """Actualizar estado de una sugerencia (solo admins)"""
@@ -1554,7 +2124,7 @@ async def update_suggestion(
 @api_router.post("/payment/checkout")
 async def create_checkout(
     request: CheckoutRequest,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """
@@ -1597,7 +2167,7 @@ async def create_checkout(
 
 @api_router.get("/payment/status")
 async def check_payment_status(
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """
@@ -1650,7 +2220,7 @@ async def payment_webhook(body: dict = Body(...), db: Session = Depends(get_db))
 async def get_user_quotes(
     skip: int = 0,
     limit: int = 50,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """Obtiene historial de cotizaciones del usuario"""
@@ -1690,7 +2260,7 @@ async def get_user_quotes(
 @api_router.get("/user/quotes/{quote_id}")
 async def get_quote_detail(
     quote_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """Obtiene detalle de una cotización guardada"""
@@ -1727,21 +2297,20 @@ async def save_quote(
     items: list = Body(...),
     results: dict = Body(None),
     notes: str = Body(None),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """Guarda una cotización - Auto-limita según plan del usuario"""
     from app.database import SavedQuote
-    from app.payment import get_user_limits
     
     # Validar que haya al menos 1 item
     if not items:
         raise HTTPException(400, "La cotización debe tener al menos 1 item")
     
-    plans_enabled = get_setting_bool(db, "plans_enabled", True)
-    if plans_enabled:
+    ent = get_entitlements(current_user.id)
+    if ent.plans_enabled:
         # Obtener límites del usuario
-        limits = get_user_limits(current_user.id, db)
+        limits = ent.limits
         max_items = limits["max_items"]
 
         # Auto-limitar items si es necesario
@@ -1827,7 +2396,7 @@ async def update_quote(
     status: str = Body(None),
     purchased_items: dict = Body(None),
     selected_provider: str = Body(None),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """Actualiza una cotización guardada"""
@@ -1863,7 +2432,7 @@ async def update_quote(
 @api_router.delete("/user/quotes/{quote_id}")
 async def delete_quote(
     quote_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """Elimina una cotización"""
@@ -1890,7 +2459,7 @@ async def mark_items_purchased(
     provider: str = Body(...),
     price: float = Body(0),
     quantity: int = Body(1),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """Marca un item como comprado en una cotización"""
@@ -1930,7 +2499,7 @@ async def mark_items_purchased(
 async def unmark_item_purchased(
     quote_id: int,
     item_name: str = Body(..., embed=True),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """Desmarca un item como comprado en una cotización"""
@@ -1968,7 +2537,7 @@ class ChangePlanRequest(BaseModel):
 async def change_user_plan(
     user_id: int,
     request: ChangePlanRequest,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """
@@ -2005,6 +2574,7 @@ async def change_user_plan(
     
     db.commit()
     db.refresh(subscription)
+    invalidate_entitlements(user_id)
     
     return {
         "message": f"Plan de usuario {user.email} actualizado a {plan.name}",
@@ -2032,6 +2602,8 @@ async def send_contact_email(request: ContactRequest):
     """
     Envía un correo de contacto a felipedelfierro@gmail.com usando Resend
     """
+    import resend
+
     try:
         resend_api_key = os.getenv("RESEND_API_KEY")
         if not resend_api_key:
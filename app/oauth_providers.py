@@ -1,4 +1,3 @@
-import httpx
 import os
 from typing import Optional
 from pydantic import BaseModel
@@ -26,6 +25,8 @@ class OAuthUserInfo(BaseModel):
 
 async def get_google_user_info(code: str) -> OAuthUserInfo:
     """Obtiene información del usuario de Google OAuth"""
+    import httpx
+
     async with httpx.AsyncClient() as client:
         # Intercambiar código por token
         print(f"[DEBUG] Intentando intercambiar código...")
@@ -72,6 +73,8 @@ async def get_google_user_info(code: str) -> OAuthUserInfo:
 
 async def get_twitter_user_info(code: str) -> OAuthUserInfo:
     """Obtiene información del usuario de Twitter/X OAuth"""
+    import httpx
+
     async with httpx.AsyncClient() as client:
         # Intercambiar código por token
         token_response = await client.post(
@@ -108,6 +111,8 @@ async def get_twitter_user_info(code: str) -> OAuthUserInfo:
 
 async def get_github_user_info(code: str) -> OAuthUserInfo:
     """Obtiene información del usuario de GitHub OAuth"""
+    import httpx
+
     async with httpx.AsyncClient() as client:
         # Intercambiar código por token
         token_response = await client.post(
@@ -0,0 +1,111 @@
+"""
+Render liviano de páginas para visión.
+
+Solo se renderizan las páginas que se van a enviar, en paralelo, a la
+resolución efectiva del modelo (con detail="high" OpenAI reescala a 768 px
+el lado corto, así que más píxeles solo agregan CPU y payload), recortadas
+al contenido y comprimidas como JPEG/WebP.
+"""
+import base64
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+from PIL import Image, ImageOps
+
+VISION_MAX_PAGES = int(os.getenv("VISION_MAX_PAGES", "3"))
+VISION_SHORT_SIDE = int(os.getenv("VISION_SHORT_SIDE", "768"))
+VISION_LONG_SIDE = int(os.getenv("VISION_LONG_SIDE", "2048"))
+VISION_MAX_DPI = int(os.getenv("VISION_MAX_DPI", "150"))
+VISION_IMAGE_FORMAT = os.getenv("VISION_IMAGE_FORMAT", "jpeg").lower()  # jpeg | webp
+VISION_IMAGE_QUALITY = int(os.getenv("VISION_IMAGE_QUALITY", "80"))
+VISION_CROP = os.getenv("VISION_CROP", "1") == "1"
+VISION_RENDER_WORKERS = int(os.getenv("VISION_RENDER_WORKERS", "3"))
+
+_CROP_THRESHOLD = 245  # gris por sobre esto = fondo
+_CROP_MARGIN = 12
+
+
+def crop_to_content(img: Image.Image) -> Image.Image:
+    """Recorta márgenes en blanco (con un pequeño borde)."""
+    gray = img.convert("L")
+    mask = gray.point(lambda v: 255 if v < _CROP_THRESHOLD else 0)
+    bbox = mask.getbbox()
+    if not bbox:
+        return img
+    left, top, right, bottom = bbox
+    return img.crop((
+        max(0, left - _CROP_MARGIN),
+        max(0, top - _CROP_MARGIN),
+        min(img.width, right + _CROP_MARGIN),
+        min(img.height, bottom + _CROP_MARGIN),
+    ))
+
+
+def fit_to_model(img: Image.Image) -> Image.Image:
+    """Reduce (nunca amplía) a lado corto VISION_SHORT_SIDE y largo ≤ VISION_LONG_SIDE."""
+    scale = min(VISION_SHORT_SIDE / min(img.size), VISION_LONG_SIDE / max(img.size), 1.0)
+    if scale >= 1.0:
+        return img
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    return img.resize(size, Image.LANCZOS)
+
+
+def encode_image(img: Image.Image, crop: bool = VISION_CROP) -> str:
+    """Imagen lista para enviar como data URL (recorte + escala + compresión)."""
+    img = ImageOps.exif_transpose(img)
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    if crop:
+        img = crop_to_content(img)
+    img = fit_to_model(img)
+
+    fmt = "webp" if VISION_IMAGE_FORMAT == "webp" else "jpeg"
+    buf = io.BytesIO()
+    img.save(buf, format=fmt.upper(), quality=VISION_IMAGE_QUALITY, optimize=fmt == "jpeg")
+    return f"data:image/{fmt};base64,{base64.b64encode(buf.getvalue()).decode('ascii')}"
+
+
+def _page_dpi(width_pt: float, height_pt: float) -> int:
+    """DPI que da la resolución efectiva del modelo para una página de ese tamaño."""
+    short_in = min(width_pt, height_pt) / 72
+    long_in = max(width_pt, height_pt) / 72
+    dpi = min(VISION_SHORT_SIDE / short_in, VISION_LONG_SIDE / long_in)
+    return max(36, min(VISION_MAX_DPI, int(dpi) + 1))
+
+
+def _render_page(pdf_path: Path, page_index: int, dpi: int) -> Image.Image:
+    from pdf2image import convert_from_path
+
+    return convert_from_path(str(pdf_path), dpi=dpi, first_page=page_index + 1, last_page=page_index + 1)[0]
+
+
+def render_pdf_pages(pdf_path: Path, pages: Optional[List[int]] = None) -> List[str]:
+    """
+    Data URLs de las páginas a enviar (0-based; por defecto las primeras
+    VISION_MAX_PAGES). Requiere pdf2image y poppler instalados.
+    """
+    import pdfplumber
+
+    with pdfplumber.open(str(pdf_path)) as pdf:
+        total = len(pdf.pages)
+        pages = [p for p in (pages if pages else range(total)) if 0 <= p < total][:VISION_MAX_PAGES]
+        dpis = [_page_dpi(float(pdf.pages[p].width), float(pdf.pages[p].height)) for p in pages]
+
+    if not pages:
+        return []
+
+    def render(args):
+        page_index, dpi = args
+        return encode_image(_render_page(pdf_path, page_index, dpi))
+
+    with ThreadPoolExecutor(max_workers=min(VISION_RENDER_WORKERS, len(pages))) as executor:
+        return list(executor.map(render, zip(pages, dpis)))
+
+
+def encode_image_file(image_path: Path) -> str:
+    """Data URL de una imagen subida (mismo recorte/escala/compresión que las páginas)."""
+    with Image.open(image_path) as img:
+        return encode_image(img)
@@ -0,0 +1,122 @@
+"""
+Registro persistente de resultados de parseo por hash de documento.
+
+La misma lista de útiles (PDF) la suben todas las familias de un curso;
+el resultado final (items normalizados + metadata) se guarda una vez y las
+siguientes subidas lo reutilizan sin extraer texto ni llamar al LLM.
+
+Las lecturas no escriben: los hits se acumulan en memoria y se guardan cada
+PARSE_HITS_FLUSH_SECONDS (un documento popular no pasa a ser una fila
+caliente que se bloquea en cada subida).
+"""
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.database import ParsedDocument
+
+# Subir este valor cuando cambie el parser de reglas, la normalización o el
+# prompt del LLM: las entradas con otra versión se ignoran y se reemplazan.
+PARSER_VERSION = "2026.10.1"
+
+PARSE_HITS_FLUSH_SECONDS = float(os.getenv("PARSE_HITS_FLUSH_SECONDS", "30"))
+
+_pending_hits: Dict[Tuple[str, str], List[Any]] = {}  # (hash, método) -> [hits, último uso]
+_hits_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def document_hash(content: bytes) -> str:
+    """Hash sha256 del contenido del archivo (independiente del nombre)."""
+    return hashlib.sha256(content).hexdigest()
+
+
+def get_parsed_document(db: Session, content_hash: str, method: str = "rules_ai") -> Optional[Dict[str, Any]]:
+    """
+    Busca un resultado vigente para el documento.
+    Retorna None si no existe o si fue generado con otra PARSER_VERSION.
+    """
+    entry = db.query(ParsedDocument).filter(
+        ParsedDocument.content_hash == content_hash,
+        ParsedDocument.method == method,
+    ).first()
+    if not entry or entry.parser_version != PARSER_VERSION:
+        return None
+
+    _record_hit(content_hash, method)
+    if time.monotonic() - _last_flush >= PARSE_HITS_FLUSH_SECONDS:
+        flush_hits(db)
+
+    return {
+        "items": entry.items or [],
+        "curso": entry.curso,
+        "raw_text_preview": entry.raw_text_preview or "",
+        "lines_count": entry.lines_count or 0,
+        "dubious_sent_to_ai": entry.dubious_sent_to_ai or 0,
+    }
+
+
+def _record_hit(content_hash: str, method: str) -> None:
+    with _hits_lock:
+        pending = _pending_hits.setdefault((content_hash, method), [0, None])
+        pending[0] += 1
+        pending[1] = datetime.utcnow()
+
+
+def flush_hits(db: Session) -> int:
+    """Suma a la DB los hits acumulados en memoria (un UPDATE por documento). Retorna cuántos documentos."""
+    global _last_flush
+    with _hits_lock:
+        pending = dict(_pending_hits)
+        _pending_hits.clear()
+        _last_flush = time.monotonic()
+    if not pending:
+        return 0
+    try:
+        for (content_hash, method), (hits, last_used_at) in pending.items():
+            db.query(ParsedDocument).filter(
+                ParsedDocument.content_hash == content_hash,
+                ParsedDocument.method == method,
+            ).update({
+                ParsedDocument.hits: func.coalesce(ParsedDocument.hits, 0) + hits,
+                ParsedDocument.last_used_at: last_used_at,
+            }, synchronize_session=False)
+        db.commit()
+    except SQLAlchemyError as e:
+        # Son solo estadísticas: se pierden en vez de reintentar sobre la fila caliente
+        db.rollback()
+        print(f"⚠️  No se pudieron guardar los hits de parseo: {e}")
+        return 0
+    return len(pending)
+
+
+def save_parsed_document(db: Session, content_hash: str, result: Dict[str, Any], method: str = "rules_ai") -> None:
+    """Guarda (o reemplaza si es de otra versión) el resultado de parseo del documento."""
+    entry = db.query(ParsedDocument).filter(
+        ParsedDocument.content_hash == content_hash,
+        ParsedDocument.method == method,
+    ).first()
+    if not entry:
+        entry = ParsedDocument(content_hash=content_hash, method=method)
+        db.add(entry)
+
+    entry.parser_version = PARSER_VERSION
+    entry.items = result.get("items") or []
+    entry.curso = result.get("curso")
+    entry.raw_text_preview = result.get("raw_text_preview")
+    entry.lines_count = result.get("lines_count") or 0
+    entry.dubious_sent_to_ai = result.get("dubious_sent_to_ai") or 0
+    entry.created_at = datetime.utcnow()
+    entry.last_used_at = entry.created_at
+    try:
+        db.commit()
+    except IntegrityError:
+        # Otra subida concurrente del mismo documento ganó la carrera
+        db.rollback()
@@ -9,6 +9,7 @@ from typing import Optional, Dict, Any
 from sqlalchemy.orm import Session
 from app.database import Payment, Subscription, Plan, PaymentStatus, SubscriptionStatus
 from app.settings import get_setting_bool
+from app.entitlements import invalidate_entitlements
 
 # Mercado Pago SDK
 try:
@@ -257,6 +258,7 @@ def process_webhook(data: dict, db: Session) -> bool:
             payment.status = PaymentStatus.pending
         
         db.commit()
+        invalidate_entitlements(payment.user_id)
         print(f"✅ Webhook procesado exitosamente")
         return True
     
@@ -0,0 +1,217 @@
+"""
+Cola compartida de llamadas a proveedores, con prioridad por plan.
+
+Antes cada cotización abría su propio ThreadPoolExecutor y todas competían en
+FIFO por la red y los sitios de los proveedores: un batch demo grande frenaba
+igual a un usuario Pro. Ahora las llamadas a cada proveedor pasan por su propio
+carril (pool de workers con su límite) que atiende primero Pro, luego Basic,
+Free y demo. Un proveedor lento (Prisa con Playwright, hasta 60 s) solo hace
+esperar a las llamadas a ese mismo proveedor.
+
+Para que los niveles bajos no se mueran de hambre bajo carga, la prioridad
+envejece: cada PROVIDER_AGING_SECONDS de espera la tarea sube un nivel.
+Se miden espera en cola y duración de la llamada por nivel (/admin/metrics).
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+TIER_PRO = 0
+TIER_BASIC = 1
+TIER_FREE = 2
+TIER_DEMO = 3
+TIER_NAMES = ("pro", "basic", "free", "demo")
+
+PROVIDER_WORKERS = int(os.getenv("PROVIDER_WORKERS", "16"))  # por proveedor
+PROVIDER_PLAYWRIGHT_WORKERS = int(os.getenv("PROVIDER_PLAYWRIGHT_WORKERS", "4"))  # un navegador por worker
+PLAYWRIGHT_PROVIDERS = {"prisa"}
+PROVIDER_AGING_SECONDS = float(os.getenv("PROVIDER_AGING_SECONDS", "2"))
+_LATENCY_SAMPLES = 512
+
+_provider_tier: ContextVar[int] = ContextVar("provider_tier", default=TIER_FREE)
+
+
+def tier_for(ent) -> int:
+    """Nivel de prioridad según los entitlements (plan) del usuario."""
+    if ent.is_demo:
+        return TIER_DEMO
+    if ent.plan_name in TIER_NAMES:
+        return TIER_NAMES.index(ent.plan_name)
+    return TIER_BASIC if ent.is_paid else TIER_FREE
+
+
+def set_provider_tier(tier: int) -> None:
+    """Prioridad de las llamadas a proveedores hechas desde el contexto actual (request/job)."""
+    _provider_tier.set(tier)
+
+
+def get_provider_tier() -> int:
+    return _provider_tier.get()
+
+
+def _p95(samples: Deque[float]) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class _Task:
+    __slots__ = ("fn", "future", "tier", "enqueued")
+
+    def __init__(self, fn: Callable[[], Any], tier: int):
+        self.fn = fn
+        self.future: Future = Future()
+        self.tier = tier
+        self.enqueued = time.monotonic()
+
+
+class _TierStats:
+    def __init__(self):
+        self.submitted = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.promoted = 0  # atendidas antes que un nivel más alto gracias al envejecimiento
+        self.wait: Deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+        self.run: Deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+
+    def snapshot(self, queued_now: int) -> Dict[str, float]:
+        def ms(samples: Deque[float], p95: bool) -> float:
+            if p95:
+                return round(_p95(samples) * 1000, 1)
+            return round(sum(samples) / len(samples) * 1000, 1) if samples else 0.0
+
+        return {
+            "queued_now": queued_now,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "promoted": self.promoted,
+            "wait_avg_ms": ms(self.wait, False),
+            "wait_p95_ms": ms(self.wait, True),
+            "run_avg_ms": ms(self.run, False),
+            "run_p95_ms": ms(self.run, True),
+        }
+
+
+class ProviderScheduler:
+    """Pool de hasta `workers` threads con una cola FIFO por nivel; los threads se crean a medida que hay trabajo."""
+
+    def __init__(
+        self, workers: int = PROVIDER_WORKERS, aging_seconds: float = PROVIDER_AGING_SECONDS, name: str = "provider"
+    ):
+        self.name = name
+        self.workers = max(1, workers)
+        self.aging_seconds = aging_seconds
+        self.busy = 0
+        self._idle = 0
+        self._queues: List[Deque[_Task]] = [deque() for _ in TIER_NAMES]
+        self._stats = [_TierStats() for _ in TIER_NAMES]
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+
+    def submit(self, fn: Callable[[], Any], tier: Optional[int] = None) -> Future:
+        """Encola fn con el nivel dado (o el del contexto actual) y devuelve su Future."""
+        task = _Task(fn, get_provider_tier() if tier is None else tier)
+        with self._cond:
+            self._queues[task.tier].append(task)
+            self._stats[task.tier].submitted += 1
+            if self._idle < sum(len(q) for q in self._queues) and len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._worker, name=f"{self.name}-{len(self._threads)}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._cond.notify()
+        return task.future
+
+    def _next(self) -> _Task:
+        """Cabeza de la cola con mejor prioridad efectiva (nivel - niveles ganados esperando)."""
+        now = time.monotonic()
+        best = None
+        for tier, queue in enumerate(self._queues):
+            if not queue:
+                continue
+            head = queue[0]
+            effective = tier - (now - head.enqueued) / self.aging_seconds
+            if best is None or (effective, head.enqueued) < best[0]:
+                best = ((effective, head.enqueued), tier)
+        tier = best[1]
+        if any(self._queues[t] for t in range(tier)):
+            self._stats[tier].promoted += 1
+        return self._queues[tier].popleft()
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                while not any(self._queues):
+                    self._idle += 1
+                    self._cond.wait()
+                    self._idle -= 1
+                task = self._next()
+                stats = self._stats[task.tier]
+                if not task.future.set_running_or_notify_cancel():
+                    stats.cancelled += 1  # el request se canceló mientras esperaba
+                    continue
+                stats.wait.append(time.monotonic() - task.enqueued)
+                self.busy += 1
+
+            start = time.monotonic()
+            try:
+                result = task.fn()
+            except BaseException as e:
+                task.future.set_exception(e)
+            else:
+                task.future.set_result(result)
+
+            with self._cond:
+                self.busy -= 1
+                stats.completed += 1
+                stats.run.append(time.monotonic() - start)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            tiers = {
+                name: self._stats[tier].snapshot(len(self._queues[tier]))
+                for tier, name in enumerate(TIER_NAMES)
+            }
+            return {"workers": self.workers, "busy": self.busy, "aging_seconds": self.aging_seconds, "tiers": tiers}
+
+
+class ProviderLanes:
+    """
+    Un ProviderScheduler por proveedor: la prioridad por plan ordena la espera
+    dentro de cada proveedor, sin un tope común para todo el proceso.
+    """
+
+    def __init__(
+        self,
+        workers: int = PROVIDER_WORKERS,
+        playwright_workers: int = PROVIDER_PLAYWRIGHT_WORKERS,
+        aging_seconds: float = PROVIDER_AGING_SECONDS,
+    ):
+        self.workers = workers
+        self.playwright_workers = playwright_workers
+        self.aging_seconds = aging_seconds
+        self._lanes: Dict[str, ProviderScheduler] = {}
+        self._lock = threading.Lock()
+
+    def lane(self, provider: str) -> ProviderScheduler:
+        with self._lock:
+            if provider not in self._lanes:
+                workers = self.playwright_workers if provider in PLAYWRIGHT_PROVIDERS else self.workers
+                self._lanes[provider] = ProviderScheduler(workers, self.aging_seconds, name=f"provider-{provider}")
+            return self._lanes[provider]
+
+    def submit(self, provider: str, fn: Callable[[], Any], tier: Optional[int] = None) -> Future:
+        return self.lane(provider).submit(fn, tier)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            lanes = dict(self._lanes)
+        return {name: lane.snapshot() for name, lane in sorted(lanes.items())}
+
+
+provider_lanes = ProviderLanes()
@@ -11,6 +11,8 @@ import re
 import unicodedata
 from Crypto.Cipher import AES
 
+from app.cancellation import count, is_cancelled
+
 
 
 BLACKLIST_TITLE_PARTS = {
@@ -298,12 +300,22 @@ class PrisaClient:
 
         hits: List[Dict[str, Any]] = []
 
+        # Lanzar Chromium es lo más caro: no hacerlo si el cliente ya se fue
+        if is_cancelled():
+            count("playwright_skipped")
+            return []
+
         with sync_playwright() as p:
             browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
-            page.goto(search_url, wait_until="networkidle", timeout=60000)
-            data = page.evaluate(js)
-            browser.close()
+            try:
+                page = browser.new_page()
+                page.goto(search_url, wait_until="networkidle", timeout=60000)
+                if is_cancelled():
+                    count("playwright_skipped")
+                    return []
+                data = page.evaluate(js)
+            finally:
+                browser.close()
 
         for row in data:
             if len(hits) >= limit:
@@ -0,0 +1,51 @@
+"""
+Eventos SSE para cotización progresiva.
+
+QuoteEventStream es un QuoteProgress que, además de contar, publica cada
+proveedor terminado y cada item cotizado en una cola del loop; el endpoint
+los reenvía como Server-Sent Events a medida que llegan, en vez de esperar
+al item más lento.
+"""
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+from app.jobs import QuoteProgress
+from app.responses import dumps
+
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {dumps(data).decode()}\n\n"
+
+
+class QuoteEventStream(QuoteProgress):
+    """Crear dentro del loop: los callbacks de los threads se pasan a la cola vía call_soon_threadsafe."""
+
+    def __init__(self, item_view: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None):
+        super().__init__()
+        self._item_view = item_view  # p. ej. compact_item en modo compacto
+        self._loop = asyncio.get_running_loop()
+        self._events: asyncio.Queue = asyncio.Queue()
+
+    def _emit(self, event: str, data: Dict[str, Any]) -> None:
+        self._loop.call_soon_threadsafe(self._events.put_nowait, sse_event(event, data))
+
+    def provider_done(self, index: int, provider: str, hits: int, error: Optional[str]) -> None:
+        super().provider_done(index, provider, hits, error)
+        self._emit("provider", {"index": index, "provider": provider, "hits": hits, "error": error})
+
+    def item_quoted(self, index: int, item: Dict[str, Any]) -> None:
+        super().item_quoted(index, item)
+        view = self._item_view(item) if self._item_view else item
+        self._emit("item", {"index": index, "item": view, **self.counters()})
+
+    async def events_until(self, task: asyncio.Future) -> AsyncIterator[str]:
+        """Eventos publicados mientras corre task (y los que quedaron en cola al terminar)."""
+        while not task.done():
+            get = asyncio.ensure_future(self._events.get())
+            done, _ = await asyncio.wait({get, task}, return_when=asyncio.FIRST_COMPLETED)
+            if get in done:
+                yield get.result()
+            else:
+                get.cancel()
+        while not self._events.empty():
+            yield self._events.get_nowait()
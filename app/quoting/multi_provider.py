@@ -5,7 +5,7 @@ y devuelve hits consolidados, ordenados por precio y relevancia.
 """
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import requests
 from app.providers.dimeiggs_catalog import DimeiggsCatalogClient
 from app.quoting.libreria_nacional_quote import quote_libreria_nacional
@@ -15,9 +15,14 @@ from app.quoting.coloranimal_quote import quote_coloranimal
 from app.quoting.pronobel_quote import quote_pronobel
 from app.quoting.prisa_quote import quote_prisa
 from app.quoting.lasecretaria_quote import quote_lasecretaria
+import contextvars
 import re
 import unicodedata
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, wait
+from functools import partial
+
+from app.cancellation import CANCEL_POLL_SECONDS, count, current_cancel_token
+from app.provider_queue import provider_lanes
 
 
 STOPWORDS = {
@@ -27,8 +32,11 @@ STOPWORDS = {
 }
 
 
-def _normalize_text(s: str) -> str:
-    """Normaliza texto para búsqueda: minúsculas, sin acentos, espacios limpios."""
+def normalize_text(s: str) -> str:
+    """
+    Normaliza texto para búsqueda: minúsculas, sin acentos, espacios limpios.
+    También sirve como clave de consulta (p.ej. deduplicar items entre listas).
+    """
     s = s.lower().strip()
     # Quita acentos
     s = "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
@@ -44,8 +52,8 @@ def _token_overlap(query: str, title: str, min_ratio: float = 0.5) -> float:
     Calcula qué porcentaje de tokens de la query aparecen en el título.
     Retorna score entre 0.0 (sin coincidencia) y 1.0 (coincidencia perfecta).
     """
-    q_norm = _normalize_text(query)
-    t_norm = _normalize_text(title)
+    q_norm = normalize_text(query)
+    t_norm = normalize_text(title)
 
     q_tokens = {w for w in q_norm.split() if w not in STOPWORDS and len(w) > 2}
     t_tokens = {w for w in t_norm.split() if w not in STOPWORDS and len(w) > 2}
@@ -265,6 +273,7 @@ def quote_multi_providers(
     providers: List[str] = None,
     limit_per_provider: int = 5,
     max_results: int = 10,
+    on_provider_done: Optional[Callable[[str, int, Optional[str]], None]] = None,
 ) -> Dict[str, Any]:
     """
     Busca un producto en múltiples proveedores EN PARALELO (más rápido).
@@ -277,6 +286,8 @@ def quote_multi_providers(
                    Si None, usa todos los funcionales.
         limit_per_provider: Máximo de resultados por proveedor.
         max_results: Máximo de resultados consolidados a devolver.
+        on_provider_done: Callback opcional (proveedor, n° de hits, error) a medida
+                   que termina cada proveedor (progreso de jobs / streaming).
 
     Returns:
         Dict con estructura:
@@ -322,31 +333,54 @@ def quote_multi_providers(
         "lasecretaria": lambda: _quote_lasecretaria(query, limit_per_provider),
     }
 
-    # Ejecuta búsquedas EN PARALELO usando ThreadPoolExecutor
-    # Usar max_workers = número de proveedores para máximo paralelismo
-    max_workers = min(len(providers), 10)  # Máx 10 threads para evitar overhead
-    
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit todas las tareas
-        futures = {}
+    # Ejecuta búsquedas EN PARALELO, cada una en el carril de su proveedor, que
+    # atiende primero a los planes más altos (nivel tomado del contexto del request)
+    # Si el cliente se desconecta se deja de esperar (y de lanzar) proveedores
+    cancel = current_cancel_token()
+
+    futures = {}
+    try:
+        # Submit todas las tareas (cada una con el contexto del request: token de cancelación)
         for provider in providers:
             if provider in provider_funcs:
-                futures[provider] = executor.submit(provider_funcs[provider])
-
-        # Recolecta resultados a medida que terminan (as_completed = más rápido)
-        for future in as_completed(futures.values()):
-            try:
-                prov_name, hits, error = future.result(timeout=15)  # Timeout más agresivo
-                if error:
-                    providers_failed.append((prov_name, error))
-                else:
-                    all_hits.extend(hits)
-            except Exception as e:
-                # Encontrar qué proveedor fue
-                for prov, fut in futures.items():
-                    if fut is future:
-                        providers_failed.append((prov, str(e)))
-                        break
+                futures[provider] = provider_lanes.submit(
+                    provider, partial(contextvars.copy_context().run, provider_funcs[provider])
+                )
+
+        # Recolecta resultados a medida que terminan
+        pending = set(futures.values())
+        while pending:
+            done, pending = wait(pending, timeout=CANCEL_POLL_SECONDS if cancel else None, return_when=FIRST_COMPLETED)
+            if pending and cancel is not None and cancel.cancelled:
+                count("provider_calls_skipped", len(pending))
+                return {
+                    "query": query,
+                    "status": "cancelled",
+                    "providers_queried": providers_queried,
+                    "providers_failed": providers_failed,
+                    "hits": [],
+                    "error": "Cancelado: el cliente se desconectó",
+                }
+            for future in done:
+                try:
+                    prov_name, hits, error = future.result(timeout=15)  # Timeout más agresivo
+                    if error:
+                        providers_failed.append((prov_name, error))
+                    else:
+                        all_hits.extend(hits)
+                except Exception as e:
+                    # Encontrar qué proveedor fue
+                    for prov, fut in futures.items():
+                        if fut is future:
+                            prov_name, hits, error = prov, [], str(e)
+                            providers_failed.append((prov, error))
+                            break
+                if on_provider_done is not None:
+                    on_provider_done(prov_name, 0 if error else len(hits), error)
+    finally:
+        # Sin esperar a los proveedores abandonados (los que siguen en cola se descartan)
+        for future in futures.values():
+            future.cancel()
 
     # Ordena por: relevancia (descendente) y precio (ascendente)
     # Prioriza coincidencia > precio
@@ -0,0 +1,135 @@
+"""
+Serialización y tamaño de las respuestas JSON.
+
+- FastJSONResponse: JSONResponse serializado con orjson (varias veces más
+  rápido que json en respuestas de parseo + cotización con cientos de hits).
+- CompressionMiddleware: brotli si el cliente lo acepta (y está instalado),
+  si no gzip; solo sobre COMPRESSION_MIN_BYTES y nunca para SSE.
+- compact_payload: modo compacto (?compact=1) con quotes proyectadas y solo
+  el mejor hit por item, salvo que se pidan todos (?all_hits=1).
+"""
+import os
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+import orjson
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, IdentityResponder
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))  # 11 es demasiado lento para respuestas en línea
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+
+COMPACT_HIT_FIELDS = ("title", "url", "price", "provider", "available")
+COMPACT_QUOTE_FIELDS = ("status", "reason", "error", "unit_price", "line_total")
+
+
+def _default(obj: Any) -> Any:
+    """Tipos que orjson no serializa solo (Numeric de SQLAlchemy, sets)."""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+# ============ COMPRESIÓN ============
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, quality: int):
+        super().__init__(app, minimum_size)
+        import brotli
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        body = self.compressor.process(body)
+        if more_body:
+            return body + self.compressor.flush()
+        return body + self.compressor.finish()
+
+
+def _brotli_available() -> bool:
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """GZipMiddleware de Starlette + brotli (opcional) cuando el cliente envía br en Accept-Encoding."""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = COMPRESSION_MIN_BYTES,
+        compresslevel: int = GZIP_LEVEL,
+        brotli_quality: int = BROTLI_QUALITY,
+    ) -> None:
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel)
+        self.brotli_quality = brotli_quality
+        self.brotli = _brotli_available()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and self.brotli and "br" in Headers(scope=scope).get("Accept-Encoding", ""):
+            await BrotliResponder(self.app, self.minimum_size, self.brotli_quality)(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+# ============ MODO COMPACTO ============
+
+def compact_hit(hit: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: hit[k] for k in COMPACT_HIT_FIELDS if k in hit}
+
+
+def compact_item(item: Dict[str, Any], all_hits: bool = False) -> Dict[str, Any]:
+    """Item con la cotización proyectada: totales, mejor hit y n° de hits (todos solo con all_hits)."""
+    quote = item.get("quote")
+    if not isinstance(quote, dict):
+        return item
+    compact = {k: quote[k] for k in COMPACT_QUOTE_FIELDS if quote.get(k) is not None}
+    if quote.get("best_hit"):
+        compact["best_hit"] = compact_hit(quote["best_hit"])
+    hits = quote.get("hits") or []
+    if hits:
+        compact["hits_total"] = len(hits)
+        if all_hits:
+            compact["hits"] = [compact_hit(h) for h in hits]
+    return dict(item, quote=compact)
+
+
+def compact_payload(payload: Optional[Dict[str, Any]], all_hits: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Versión compacta de una respuesta de cotización (batch, parseo + cotización,
+    masiva por colegio o búsqueda simple): sin raw_text_preview, items con
+    compact_item y, en la búsqueda simple, solo el primer hit salvo all_hits.
+    """
+    if not isinstance(payload, dict):
+        return payload
+    payload = dict(payload)
+    payload.pop("raw_text_preview", None)
+    if isinstance(payload.get("items"), list):
+        payload["items"] = [compact_item(it, all_hits) for it in payload["items"]]
+    if isinstance(payload.get("lists"), list):
+        payload["lists"] = [compact_payload(entry, all_hits) for entry in payload["lists"]]
+    if isinstance(payload.get("hits"), list):
+        hits = payload["hits"]
+        payload["hits_total"] = len(hits)
+        payload["hits"] = [compact_hit(h) for h in (hits if all_hits else hits[:1])]
+    if isinstance(payload.get("result"), dict):
+        payload["result"] = compact_payload(payload["result"], all_hits)
+    return payload
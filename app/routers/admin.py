@@ -17,13 +17,17 @@ from app.database import (
     SavedQuote,
     PageVisit,
 )
-from app.auth import get_current_user
+from app.auth import Principal, get_current_user, invalidate_user
 from app.settings import get_setting_bool, set_setting_bool
+from app.entitlements import invalidate_entitlements
+from app import admission, cancellation
+from app.provider_queue import provider_lanes
+from app.responses import FastJSONResponse
 
-router = APIRouter(prefix="/admin", tags=["admin"])
+router = APIRouter(prefix="/admin", tags=["admin"], default_response_class=FastJSONResponse)
 
 
-async def verify_admin(current_user: User = Depends(get_current_user)) -> User:
+async def verify_admin(current_user: Principal = Depends(get_current_user)) -> Principal:
     """Verify that the current user is an admin."""
     if not current_user.is_admin:
         raise HTTPException(
@@ -39,7 +43,7 @@ async def verify_admin(current_user: User = Depends(get_current_user)) -> User:
 @router.get("/plans", response_model=List[dict])
 async def get_plans(
     db: Session = Depends(get_db),
-    _: User = Depends(verify_admin),
+    _: Principal = Depends(verify_admin),
 ):
     """Get all plans for management."""
     plans = db.query(Plan).all()
@@ -73,7 +77,7 @@ async def update_plan(
     plan_id: int,
     plan_data: PlanUpdateRequest,
     db: Session = Depends(get_db),
-    _: User = Depends(verify_admin),
+    _: Principal = Depends(verify_admin),
 ):
     """Update a plan's pricing and limits."""
     plan = db.query(Plan).filter(Plan.id == plan_id).first()
@@ -87,6 +91,7 @@ async def update_plan(
 
     db.commit()
     db.refresh(plan)
+    invalidate_entitlements()
 
     return {
         "id": plan.id,
@@ -106,7 +111,7 @@ async def update_plan(
 @router.get("/users", response_model=List[dict])
 async def get_users(
     db: Session = Depends(get_db),
-    _: User = Depends(verify_admin),
+    _: Principal = Depends(verify_admin),
 ):
     """Get all registered users with their current plan."""
     users = db.query(User).all()
@@ -143,7 +148,7 @@ async def get_users(
 async def delete_user(
     user_id: int,
     db: Session = Depends(get_db),
-    _: User = Depends(verify_admin),
+    _: Principal = Depends(verify_admin),
 ):
     """Delete a user and their data."""
     user = db.query(User).filter(User.id == user_id).first()
@@ -164,6 +169,8 @@ async def delete_user(
     # Delete user
     db.delete(user)
     db.commit()
+    invalidate_entitlements(user_id)
+    invalidate_user(user_id)
 
     return {"message": f"Usuario {user.email} eliminado"}
 
@@ -174,7 +181,7 @@ async def delete_user(
 @router.get("/settings/plans", response_model=dict)
 async def get_plans_settings(
     db: Session = Depends(get_db),
-    _: User = Depends(verify_admin),
+    _: Principal = Depends(verify_admin),
 ):
     """Get plan visibility settings."""
     return {"plans_enabled": get_setting_bool(db, "plans_enabled", True)}
@@ -184,7 +191,7 @@ async def get_plans_settings(
 async def update_plans_settings(
     settings: PlansSettingsUpdate,
     db: Session = Depends(get_db),
-    _: User = Depends(verify_admin),
+    _: Principal = Depends(verify_admin),
 ):
     """Update plan visibility settings."""
     return {"plans_enabled": set_setting_bool(db, "plans_enabled", settings.plans_enabled)}
@@ -196,7 +203,7 @@ async def update_plans_settings(
 @router.get("/analytics", response_model=dict)
 async def get_analytics(
     db: Session = Depends(get_db),
-    _: User = Depends(verify_admin),
+    _: Principal = Depends(verify_admin),
 ):
     """Get analytics data: users, subscriptions, visits, revenue."""
     
@@ -236,10 +243,28 @@ async def get_analytics(
     }
 
 
+@router.get("/metrics/cancellation", response_model=dict)
+async def get_cancellation_metrics(_: Principal = Depends(verify_admin)):
+    """Work avoided because clients disconnected (counters since process start)."""
+    return dict(cancellation.stats)
+
+
+@router.get("/metrics/admission", response_model=dict)
+async def get_admission_metrics(_: Principal = Depends(verify_admin)):
+    """Admission pools (demo vs authenticated): occupancy, queue and 429s by reason."""
+    return {pool.name: pool.snapshot() for pool in (admission.demo_pool, admission.user_pool)}
+
+
+@router.get("/metrics/provider-queue", response_model=dict)
+async def get_provider_queue_metrics(_: Principal = Depends(verify_admin)):
+    """Provider lanes (one per provider): per-tier (pro/basic/free/demo) queue wait and call latency."""
+    return provider_lanes.snapshot()
+
+
 @router.get("/dashboard")
 async def get_dashboard_summary(
     db: Session = Depends(get_db),
-    _: User = Depends(verify_admin),
+    _: Principal = Depends(verify_admin),
 ):
     """Get dashboard summary with key metrics."""
     
@@ -1,5 +1,7 @@
 import re
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterable, Iterator
+
+from app.keyword_matcher import KeywordMatcher
 
 KNOWN_SUBJECTS = {
     "LENGUAJE",
@@ -60,7 +62,20 @@ HEADER_PATTERNS = [
     r"^\d+º\s+BÁSICO",
     r"^ASIGNATURA\s+ARTÍCULO",
 ]
-import re
+# Los patrones asumen texto en mayúsculas y espacios colapsados; compilados
+# con IGNORECASE y \s+ se evalúan directamente sobre la línea
+_HEADER_RE = re.compile(
+    "|".join("(?:" + p.replace(" ", r"\s+") + ")" for p in HEADER_PATTERNS),
+    re.IGNORECASE,
+)
+_SPACES_RE = re.compile(r"\s+")
+_NUMBERING_RE = re.compile(r"^\(?\s*\d{1,3}\s*[\)\.\-:]\s*")
+_SUBJECT_PREFIX_RE = re.compile(r"^([A-ZÁÉÍÓÚÑ ]{3,})\s+(.+)$")
+
+_INVALID_MATCHER = KeywordMatcher(INVALID_KEYWORDS)
+_TIME_RE = re.compile(r"^\d{1,2}:\d{2}\s+(hrs|horas)")
+_WEEKDAY_RE = re.compile(r"(lunes|martes|miercoles|miércoles|jueves|viernes|sabado|sábado|domingo)", re.IGNORECASE)
+_TITLE_RE = re.compile(r"[A-ZÁÉÍÓÚÑ\s]{3,}")
 
 BAD_TITLES = {"PERSONAL", "DE ASEO", "PARA USO", "OCUPACIONAL"}
 
@@ -72,10 +87,9 @@ def is_valid_item(item: Dict[str, Any]) -> bool:
     detalle = (item.get("detalle") or "").strip().upper()
     original = (item.get("item_original") or "").strip().upper()
     
-    # Revisar si contiene palabras clave inválidas
-    for bad_keyword in INVALID_KEYWORDS:
-        if bad_keyword.upper() in detalle or bad_keyword.upper() in original:
-            return False
+    # Revisar si contiene palabras clave inválidas (una pasada, ver KeywordMatcher)
+    if _INVALID_MATCHER.contains_any(detalle, original):
+        return False
     
     # Debe tener al menos 2 caracteres y un mínimo de sentido
     if len(detalle) < 2:
@@ -91,31 +105,37 @@ def is_valid_item(item: Dict[str, Any]) -> bool:
         return False
     
     # Patrones que sugieren que es información, no un item
-    if re.search(r"^\d{1,2}:\d{2}\s+(hrs|horas)", detalle):
+    if _TIME_RE.search(detalle):
         return False
     
-    if re.search(r"(lunes|martes|miercoles|miércoles|jueves|viernes|sabado|sábado|domingo)", detalle, re.IGNORECASE):
+    if _WEEKDAY_RE.search(detalle):
         return False
     
     return True
 
-def drop_title_rows(items):
-    cleaned = []
+def _is_title_row(it: Dict[str, Any]) -> bool:
+    det = (it.get("detalle") or "").strip().upper()
+    if det in BAD_TITLES:
+        return True
+    # líneas vacías
+    if not (it.get("detalle") or "").strip():
+        return True
+    # todo mayúsculas y sin cantidad => probablemente título
+    if it.get("cantidad") is None and _TITLE_RE.fullmatch(det):
+        return True
+    # Validar que sea un item válido
+    if not is_valid_item(it):
+        return True
+    return False
+
+def iter_drop_title_rows(items: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Etapa streaming de drop_title_rows: deja pasar solo items válidos."""
     for it in items:
-        det = (it.get("detalle") or "").strip().upper()
-        if det in BAD_TITLES:
-            continue
-        # líneas vacías
-        if not (it.get("detalle") or "").strip():
-            continue
-        # todo mayúsculas y sin cantidad => probablemente título
-        if it.get("cantidad") is None and re.fullmatch(r"[A-ZÁÉÍÓÚÑ\s]{3,}", det):
-            continue
-        # Validar que sea un item válido
-        if not is_valid_item(it):
-            continue
-        cleaned.append(it)
-    return cleaned
+        if not _is_title_row(it):
+            yield it
+
+def drop_title_rows(items):
+    return list(iter_drop_title_rows(items))
 
 
 
@@ -123,8 +143,8 @@ def clean_line(line: str) -> str:
     line = line.strip()
     if not line:
         return ""
-    line = re.sub(r"^\(?\s*\d{1,3}\s*[\)\.\-:]\s*", "", line)
-    line = re.sub(r"\s+", " ", line)
+    line = _NUMBERING_RE.sub("", line)
+    line = _SPACES_RE.sub(" ", line)
     return line.strip()
 
 def split_comma_items(line: str) -> List[str]:
@@ -164,152 +184,195 @@ def split_comma_items(line: str) -> List[str]:
     
     return [line]
 
+def iter_lines(pages: Iterable[str]) -> Iterator[str]:
+    """
+    Etapa streaming: recibe el texto página a página (ver extractors.iter_pages)
+    y produce líneas limpias, ya divididas por items separados por comas.
+    Solo mantiene en memoria la página actual.
+    """
+    for page in pages:
+        for raw_ln in page.splitlines():
+            ln = clean_line(raw_ln)
+            if not ln:
+                continue
+            # dividir líneas con múltiples items (ej: "1 Cuaderno, 1 Diccionario")
+            yield from split_comma_items(ln)
+
 def split_lines(raw_text: str) -> List[str]:
     """
     Divide el texto en líneas limpias.
     Adicionalmente, divide líneas con múltiples items separados por comas.
     """
-    lines = [ln for ln in (clean_line(x) for x in raw_text.splitlines()) if ln]
-    
-    # Segunda pasada: dividir líneas con múltiples items (ej: "1 Cuaderno, 1 Diccionario")
-    expanded = []
-    for ln in lines:
-        sub_items = split_comma_items(ln)
-        expanded.extend(sub_items)
-    
-    return expanded
+    return list(iter_lines([raw_text]))
 
 def is_header(line: str) -> bool:
-    up = re.sub(r"\s+", " ", line.strip().upper())
-    return any(re.match(p, up) for p in HEADER_PATTERNS)
+    return _HEADER_RE.match(line.strip()) is not None
 
 def section_only(line: str) -> Optional[str]:
-    up = re.sub(r"\s+", " ", line.strip().upper())
+    up = _SPACES_RE.sub(" ", line.strip().upper())
     if up in SECTION_WORDS:
         return up
     return None
 
-def parse_item_line(line: str) -> Optional[Dict[str, Any]]:
-    original = line.strip()
-    if not original or is_header(original):
-        return None
+# ============================================================================
+# LEXER DE LÍNEAS DE ITEM
+# Clasifica en una pasada, sin búsquedas que recorran toda la línea:
+#   [cantidad] [unidad inicial] detalle [[unidad final] cantidad final]
+# La cabeza se reconoce con un patrón anclado al inicio y la cola con un
+# patrón anclado al inicio de la línea invertida (equivale a anclarlo al
+# final). Luego se resuelve qué estrategia aplica usando los spans.
+# ============================================================================
+
+# "unidade(s)" replica la alternativa histórica "unidades?" (no incluye "unidad")
+_UNIT_WORDS = (
+    "unidade", "unidades", "uds", "ud", "pack", "paquete", "paq", "cajas", "caja",
+    "sobres", "sobre", "bolsas", "bolsa", "pliegos", "pliego", "resmas", "resma",
+)
+_LEAD_UNIT_WORDS = tuple(u for u in _UNIT_WORDS if not u.startswith(("unid", "ud")))
+
+_ITEM_HEAD = re.compile(
+    r"^(?:(?P<qty>\d{1,3})\s+)?"
+    r"(?:(?P<lead_unit>" + "|".join(sorted(_LEAD_UNIT_WORDS, key=len, reverse=True)) + r")\s+)?",
+    re.IGNORECASE,
+)
+# Sobre la línea invertida: "... caja 12" → "21 ajac ..."
+_ITEM_TAIL_REVERSED = re.compile(
+    r"^\s*(?P<qty>\d{1,3})"
+    r"(?:\s+(?P<unit>" + "|".join(sorted((u[::-1] for u in _UNIT_WORDS), key=len, reverse=True)) + r")\b)?",
+    re.IGNORECASE,
+)
+
+# Unidad mencionada dentro del detalle ("3 Pinceles caja ..."), por prioridad
+_UNIT_HINTS = tuple(
+    (unit, re.compile(rf"\b{unit}(s)?\b", re.IGNORECASE))
+    for unit in ("resma", "caja", "sobre")
+)
+
+
+def _unit_hint(detail: str) -> Optional[str]:
+    low = detail.lower()
+    for unit, pattern in _UNIT_HINTS:
+        # filtro barato antes de la regex: casi ningún detalle las menciona
+        if unit in low and pattern.search(detail):
+            return unit
+    return None
+
+
+def lex_item_line(original: str) -> Optional[Dict[str, Any]]:
+    """
+    Clasifica cantidad, unidad y detalle de una línea ya limpia en una pasada.
+    Equivale a las 4 estrategias históricas:
+      1) "N Descripción" (con unidad final "... caja 5" o inicial "N Caja ...")
+      2) "Pack Separadores ... 1" (unidad al inicio, cantidad al final)
+      3) "... caja 10" (unidad + cantidad al final)
+      4) "... 10" (solo cantidad al final)
+    """
+    n = len(original)
+    head = _ITEM_HEAD.match(original)
+    qty_raw, lead_unit = head.group("qty", "lead_unit")
+
+    tail = _ITEM_TAIL_REVERSED.match(original[::-1])
+    tail_qty = tail_unit = None
+    tail_qty_start = tail_unit_start = n
+    if tail:
+        tail_qty_start = n - tail.end("qty")
+        tail_qty = original[tail_qty_start:n - tail.start("qty")]
+        if tail.group("unit"):
+            tail_unit_start = n - tail.end("unit")
+            tail_unit = original[tail_unit_start:n - tail.start("unit")]
 
-    qty = None
-    unit = None
-    detail = original
-    
-    # ========================================================================
     # ESTRATEGIA 1: Cantidad al inicio "N Descripción"
-    # ========================================================================
-    m_start = re.match(r"^(\d{1,3})\s+(.+)$", original)
-    if m_start:
-        qty = int(m_start.group(1))
-        detail = m_start.group(2).strip()
+    if qty_raw is not None:
+        rest_start = head.end("qty")
+        qty = int(qty_raw)
         unit = "unid"  # default
-        
-        # Buscar unidad en el detalle: "1 Carpeta caja 5" → unit=caja, qty=5
-        m_unit_end = re.search(r"\b(unidades?|uds?|ud|pack|paquete|paq|cajas?|caja|sobres?|sobre|bolsas?|bolsa|pliegos?|pliego|resmas?|resma)\s+(\d{1,3})\s*$",
-                               detail, flags=re.IGNORECASE)
-        if m_unit_end:
-            unit_raw = m_unit_end.group(1).lower()
-            qty = int(m_unit_end.group(2))
+        detail = original[rest_start:].strip()
+
+        if tail_unit is not None:
+            # "1 Carpeta caja 5" → unit=caja, qty=5
+            unit_raw = tail_unit.lower()
+            qty = int(tail_qty)
             unit = UNIT_MAP.get(unit_raw, unit_raw)
-            detail = detail[:m_unit_end.start()].strip()
+            detail = original[rest_start:tail_unit_start].strip()
+        elif lead_unit:
+            # Solo unidad sin cantidad: "1 Caja lápices"
+            unit = UNIT_MAP.get(lead_unit.lower(), None) or lead_unit.lower()
+            detail = original[head.end("lead_unit"):].strip()
         else:
-            # Buscar solo unidad sin cantidad: "1 Caja"
-            m_unit_only = re.match(r"^(pack|paquete|paq|cajas?|caja|sobres?|sobre|bolsas?|bolsa|pliegos?|pliego|resmas?|resma)\s+(.*)$",
-                                   detail, flags=re.IGNORECASE)
-            if m_unit_only:
-                unit = UNIT_MAP.get(m_unit_only.group(1).lower(), None) or m_unit_only.group(1).lower()
-                detail = m_unit_only.group(2).strip()
-            else:
-                # Detectar unidad en el texto: "3 Pinceles 2, 6 y 8" → unit basado en contexto
-                if re.search(r"\bresma(s)?\b", detail, re.IGNORECASE):
-                    unit = "resma"
-                elif re.search(r"\bcaja(s)?\b", detail, re.IGNORECASE):
-                    unit = "caja"
-                elif re.search(r"\bsobre(s)?\b", detail, re.IGNORECASE):
-                    unit = "sobre"
-        
+            # "3 Pinceles 2, 6 y 8" → unidad por contexto
+            unit = _unit_hint(detail) or unit
         return {
             "item_original": original,
             "detalle": detail,
             "cantidad": qty,
             "unidad": unit,
         }
-    
-    # ========================================================================
+
     # ESTRATEGIA 2: Unidad al inicio "Pack Separadores ... 1"
-    # ========================================================================
-    m_unit_start = re.match(r"^(pack|paquete|paq|cajas?|caja|sobres?|sobre|bolsas?|bolsa|pliegos?|pliego|resmas?|resma)\s+(.*)$",
-                            original, flags=re.IGNORECASE)
-    if m_unit_start:
-        unit = UNIT_MAP.get(m_unit_start.group(1).lower(), None) or m_unit_start.group(1).lower()
-        detail = m_unit_start.group(2).strip()
-        
-        # Buscar cantidad al final: "Pack Separadores 5"
-        m_qty = re.search(r"(\d{1,3})\s*$", detail)
-        if m_qty:
-            qty = int(m_qty.group(1))
-            detail = detail[:m_qty.start()].strip()
-        
+    if lead_unit:
         return {
             "item_original": original,
-            "detalle": detail,
-            "cantidad": qty,
-            "unidad": unit,
+            "detalle": original[head.end("lead_unit"):tail_qty_start].strip(),
+            "cantidad": int(tail_qty) if tail_qty is not None else None,
+            "unidad": UNIT_MAP.get(lead_unit.lower(), None) or lead_unit.lower(),
         }
-    
-    # ========================================================================
-    # ESTRATEGIA 3: Cantidad al final "... 10"
-    # ========================================================================
-    m_end = re.search(r"\b(unidades?|uds?|ud|pack|paquete|paq|cajas?|caja|sobres?|sobre|bolsas?|bolsa|pliegos?|pliego|resmas?|resma)\s+(\d{1,3})\s*$",
-                      original, flags=re.IGNORECASE)
-    if m_end:
-        unit_raw = m_end.group(1).lower()
-        qty = int(m_end.group(2))
-        unit = UNIT_MAP.get(unit_raw, unit_raw)
-        detail = original[:m_end.start()].strip()
-        
+
+    if tail_qty is None:
+        # No encontró patrón de cantidad
+        return None
+
+    # ESTRATEGIA 3: Unidad + cantidad al final "... caja 10"
+    if tail_unit is not None:
+        unit_raw = tail_unit.lower()
         return {
             "item_original": original,
-            "detalle": detail,
-            "cantidad": qty,
-            "unidad": unit,
+            "detalle": original[:tail_unit_start].strip(),
+            "cantidad": int(tail_qty),
+            "unidad": UNIT_MAP.get(unit_raw, unit_raw),
         }
-    
-    # ========================================================================
+
     # ESTRATEGIA 4: Solo cantidad al final "... 10"
-    # ========================================================================
-    m_qty_only = re.search(r"(\d{1,3})\s*$", original)
-    if m_qty_only:
-        qty = int(m_qty_only.group(1))
-        unit = "unid"
-        detail = original[:m_qty_only.start()].strip()
-        
-        return {
-            "item_original": original,
-            "detalle": detail,
-            "cantidad": qty,
-            "unidad": unit,
-        }
-    
-    # No encontró patrón de cantidad
-    return None
+    return {
+        "item_original": original,
+        "detalle": original[:tail_qty_start].strip(),
+        "cantidad": int(tail_qty),
+        "unidad": "unid",
+    }
 
-def merge_loose_continuations(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    merged = []
+
+def parse_item_line(line: str) -> Optional[Dict[str, Any]]:
+    original = line.strip()
+    if not original or is_header(original):
+        return None
+    return lex_item_line(original)
+
+def _is_loose_continuation(it: Dict[str, Any]) -> bool:
+    is_one_word = it["detalle"] and len(it["detalle"].split()) == 1
+    return bool(it["cantidad"] is None and it["unidad"] is None and is_one_word)
+
+def iter_merge_loose_continuations(items: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """
+    Etapa streaming de merge_loose_continuations.
+    Usa lookahead acotado a 1 item: el último item se retiene hasta saber
+    si el siguiente es una continuación suelta que hay que pegarle.
+    """
+    pending: Optional[Dict[str, Any]] = None
     for it in items:
-        is_one_word = it["detalle"] and len(it["detalle"].split()) == 1
-        if it["cantidad"] is None and it["unidad"] is None and is_one_word and merged:
-            merged[-1]["detalle"] = (merged[-1]["detalle"] + " " + it["detalle"]).strip()
-            merged[-1]["item_original"] = (merged[-1]["item_original"] + " " + it["item_original"]).strip()
-        else:
-            merged.append(it)
-    return merged
+        if pending is not None and _is_loose_continuation(it):
+            pending["detalle"] = (pending["detalle"] + " " + it["detalle"]).strip()
+            pending["item_original"] = (pending["item_original"] + " " + it["item_original"]).strip()
+            continue
+        if pending is not None:
+            yield pending
+        pending = it
+    if pending is not None:
+        yield pending
 
-def parse_with_rules(lines: List[str]) -> Dict[str, Any]:
-    items = []
+def merge_loose_continuations(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return list(iter_merge_loose_continuations(items))
+
+def iter_items_with_subject(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Etapa streaming: parsea cada línea y le asigna la asignatura vigente."""
     current_subject = None
 
     for ln in lines:
@@ -335,14 +398,24 @@ def parse_with_rules(lines: List[str]) -> Dict[str, Any]:
             continue
 
         it["asignatura"] = current_subject
-        items.append(it)
+        yield it
 
-    # post-procesos
-    items = merge_loose_continuations(items)
-    items = drop_title_rows(items)
+def iter_parse_with_rules(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Pipeline de reglas compuesto por generadores:
+    líneas → items con asignatura → merge de continuaciones → filtro de títulos.
+    Los primeros items quedan disponibles antes de terminar el documento.
+    """
+    items = iter_items_with_subject(lines)
+    items = iter_merge_loose_continuations(items)
+    return iter_drop_title_rows(items)
 
+def stream_parse_pages(pages: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Atajo: páginas de texto (extractors.iter_pages) → items parseados por reglas."""
+    return iter_parse_with_rules(iter_lines(pages))
 
-    return {"curso": None, "items": items}
+def parse_with_rules(lines: List[str]) -> Dict[str, Any]:
+    return {"curso": None, "items": list(iter_parse_with_rules(lines))}
 
 def find_dubious_lines(parsed: Dict[str, Any]) -> List[str]:
     # manda a IA solo lo dudoso
@@ -359,7 +432,7 @@ def split_subject_prefix(line: str):
     s = line.strip()
 
     # match: "ASIGNATURA <resto>"
-    m = re.match(r"^([A-ZÁÉÍÓÚÑ ]{3,})\s+(.+)$", s)
+    m = _SUBJECT_PREFIX_RE.match(s)
     if not m:
         return None, s
 
@@ -367,10 +440,44 @@ def split_subject_prefix(line: str):
     rest = m.group(2).strip()
 
     # Normaliza dobles espacios
-    maybe_subject = re.sub(r"\s+", " ", maybe_subject)
+    maybe_subject = _SPACES_RE.sub(" ", maybe_subject)
 
     # Si el prefijo es una asignatura conocida, la separamos
     if maybe_subject in KNOWN_SUBJECTS:
         return maybe_subject, rest
 
     return None, s
+
+
+class RulesParseStream:
+    """
+    Iterable de items parseados por reglas a partir de páginas de texto
+    (típicamente extractors.iter_pages). Mientras se consume registra el
+    preview del texto y el conteo de líneas, sin guardar el documento completo.
+    """
+
+    def __init__(self, pages: Iterable[str], preview_chars: int = 1500):
+        self._pages = pages
+        self.preview_chars = preview_chars
+        self.lines_count = 0
+        self._preview_parts: List[str] = []
+        self._preview_len = 0
+
+    @property
+    def preview(self) -> str:
+        return "\n".join(self._preview_parts)[:self.preview_chars]
+
+    def _iter_pages(self) -> Iterator[str]:
+        for page in self._pages:
+            if self._preview_len < self.preview_chars:
+                self._preview_parts.append(page)
+                self._preview_len += len(page) + 1
+            yield page
+
+    def _iter_lines(self) -> Iterator[str]:
+        for ln in iter_lines(self._iter_pages()):
+            self.lines_count += 1
+            yield ln
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter_parse_with_rules(self._iter_lines())
@@ -1,13 +1,81 @@
-from typing import Any
+"""
+Settings de la app (tabla app_settings) con cache en memoria.
+
+Todas las filas se cargan una vez y las lecturas salen de memoria. Cada
+escritura cambia una marca de versión guardada en la misma tabla
+(SETTINGS_VERSION_KEY); los demás workers la consultan como máximo cada
+SETTINGS_POLL_SECONDS y recargan si cambió.
+"""
+import os
+import threading
+import time
+import weakref
+from typing import Any, Dict, Optional
+from uuid import uuid4
 
 from app.database import AppSetting
 
+SETTINGS_POLL_SECONDS = float(os.getenv("SETTINGS_POLL_SECONDS", "5"))
+SETTINGS_VERSION_KEY = "_settings_version"
+
+
+class _SettingsCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values: Optional[Dict[str, Any]] = None
+        self.version: Any = None
+        self.checked_at = 0.0
+
+
+# Un cache por engine (en producción hay uno solo; los tests usan varios)
+_caches: "weakref.WeakKeyDictionary[Any, _SettingsCache]" = weakref.WeakKeyDictionary()
+_caches_lock = threading.Lock()
+stats = {"reads": 0, "reloads": 0, "polls": 0}
+
+
+def _cache_for(db) -> _SettingsCache:
+    bind = db.get_bind()
+    with _caches_lock:
+        cache = _caches.get(bind)
+        if cache is None:
+            cache = _caches[bind] = _SettingsCache()
+        return cache
+
+
+def _load(db, cache: _SettingsCache) -> None:
+    rows = db.query(AppSetting.key, AppSetting.value).all()
+    values = {key: value for key, value in rows}
+    cache.values = values
+    cache.version = values.get(SETTINGS_VERSION_KEY)
+    cache.checked_at = time.monotonic()
+    stats["reloads"] += 1
+
+
+def _ensure_fresh(db) -> Dict[str, Any]:
+    cache = _cache_for(db)
+    with cache.lock:
+        if cache.values is None:
+            _load(db, cache)
+        elif time.monotonic() - cache.checked_at >= SETTINGS_POLL_SECONDS:
+            stats["polls"] += 1
+            version = db.query(AppSetting.value).filter(AppSetting.key == SETTINGS_VERSION_KEY).scalar()
+            cache.checked_at = time.monotonic()
+            if version != cache.version:
+                _load(db, cache)
+                # Otro worker cambió settings: los límites cacheados pueden depender de ellos
+                from app.entitlements import invalidate_entitlements
+                invalidate_entitlements()
+        return cache.values
+
+
+def clear_settings_cache() -> None:
+    with _caches_lock:
+        _caches.clear()
+
 
 def get_setting_value(db, key: str, default: Any = None) -> Any:
-    setting = db.query(AppSetting).filter(AppSetting.key == key).first()
-    if not setting:
-        return default
-    return setting.value
+    stats["reads"] += 1
+    return _ensure_fresh(db).get(key, default)
 
 
 def get_setting_bool(db, key: str, default: bool = False) -> bool:
@@ -25,12 +93,29 @@ def get_setting_bool(db, key: str, default: bool = False) -> bool:
     return bool(default)
 
 
-def set_setting_bool(db, key: str, value: bool) -> bool:
+def _upsert(db, key: str, value: Any) -> None:
     setting = db.query(AppSetting).filter(AppSetting.key == key).first()
     if not setting:
-        setting = AppSetting(key=key, value=bool(value))
-        db.add(setting)
+        db.add(AppSetting(key=key, value=value))
     else:
-        setting.value = bool(value)
+        setting.value = value
+
+
+def set_setting_bool(db, key: str, value: bool) -> bool:
+    _upsert(db, key, bool(value))
+    version = uuid4().hex  # solo importa que cambie (sin carreras entre workers)
+    _upsert(db, SETTINGS_VERSION_KEY, version)
     db.commit()
+
+    # Write-through en este worker; los demás lo ven al consultar la versión
+    cache = _cache_for(db)
+    with cache.lock:
+        if cache.values is not None:
+            cache.values[key] = bool(value)
+            cache.values[SETTINGS_VERSION_KEY] = version
+            cache.version = version
+            cache.checked_at = time.monotonic()
+
+    from app.entitlements import invalidate_entitlements  # plans_enabled cambia los límites de todos
+    invalidate_entitlements()
     return bool(value)
@@ -0,0 +1,70 @@
+"""
+División del texto extraído en chunks acotados para extracción con LLM.
+
+Corta en bordes de sección/asignatura (las mismas que reconoce el parser de
+reglas) y cada chunk recuerda la asignatura vigente al empezar, para que los
+items no pierdan contexto cuando una sección queda partida entre chunks.
+"""
+from dataclasses import dataclass
+from typing import List, Optional
+
+from app.rules_parser import section_only, split_subject_prefix
+
+
+@dataclass
+class TextChunk:
+    text: str
+    subject: Optional[str] = None  # asignatura vigente al inicio del chunk
+
+
+def _line_subject(line: str) -> Optional[str]:
+    sec = section_only(line)
+    if sec:
+        return sec
+    subj, _ = split_subject_prefix(line)
+    return subj
+
+
+def chunk_text(raw_text: str, max_chars: int = 6000) -> List[TextChunk]:
+    """
+    Agrupa secciones completas hasta max_chars. Una sección más larga que
+    max_chars se corta en bordes de línea; el chunk siguiente arranca con
+    la asignatura repetida como primera línea.
+    """
+    chunks: List[TextChunk] = []
+    buf: List[str] = []
+    size = 0
+    chunk_subject: Optional[str] = None
+    current_subject: Optional[str] = None
+
+    def flush():
+        nonlocal buf, size
+        if buf:
+            chunks.append(TextChunk(text="\n".join(buf), subject=chunk_subject))
+        buf, size = [], 0
+
+    for line in (raw_text or "").splitlines():
+        line = line.rstrip()
+        if not line.strip():
+            continue
+
+        subject = _line_subject(line)
+        new_section = subject is not None and subject != current_subject
+
+        # Cortar por tamaño, o antes de una sección nueva si el chunk ya va por la mitad
+        if buf and (size + len(line) + 1 > max_chars or (new_section and size > max_chars // 2)):
+            flush()
+
+        if not buf:
+            chunk_subject = current_subject
+            if current_subject and subject is None:
+                # Sección partida: repetir la asignatura para el LLM
+                buf, size = [current_subject], len(current_subject) + 1
+
+        if subject:
+            current_subject = subject
+        buf.append(line)
+        size += len(line) + 1
+
+    flush()
+    return chunks
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Benchmark del parser de reglas sobre un corpus sintético grande de líneas
+de listas de útiles.
+
+Compara:
+- parse_item_line (lexer de una pasada) vs. las 4 estrategias regex históricas
+- KeywordMatcher vs. el loop histórico sobre INVALID_KEYWORDS con .upper()
+- el pipeline completo parse_with_rules(split_lines(...))
+
+Uso:
+    python scripts/bench_rules_parser.py [--lines 200000] [--seed 7]
+"""
+
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+from app.keyword_matcher import AHOCORASICK_AVAILABLE
+from app.rules_parser import (
+    HEADER_PATTERNS,
+    INVALID_KEYWORDS,
+    UNIT_MAP,
+    _INVALID_MATCHER,
+    parse_item_line,
+    parse_with_rules,
+    split_lines,
+)
+
+SUBJECTS = ["LENGUAJE", "MATEMÁTICA", "INGLÉS", "CIENCIAS", "SOCIALES", "ARTE Y", "MÚSICA", "DE ASEO"]
+HEADERS = ["LISTA DE ÚTILES 2025", "4º BÁSICO", "ASIGNATURA ARTÍCULO CANTIDAD"]
+PRODUCTS = [
+    "Cuaderno college 100 hojas", "Lápiz grafito N°2", "Témpera 12 colores", "Block de dibujo médium 99 1/8",
+    "Carpeta plastificada roja", "Goma de borrar", "Pegamento en barra 40 gr", "Plumón de pizarra azul",
+    "Tijera punta roma", "Regla 30 cm", "Cartulina de colores", "Papel lustre 16x16", "Diccionario Aristos",
+    "Pinceles 2, 6 y 8", "Plasticina 12 colores", "Estuche con cierre", "Forro plástico transparente",
+]
+UNITS = ["caja", "cajas", "pack", "paquete", "sobre", "bolsa", "pliegos", "resma", "unidades", "ud"]
+NOISE = [
+    "Horario de atención 08:00 hrs", "Pago en 3 cuotas sin interés", "Disponible en stock",
+    "Marcado con nombre", "Materiales según indicación del profesor", "Lunes 4 de marzo",
+]
+
+
+def make_line(rnd: random.Random) -> str:
+    product = rnd.choice(PRODUCTS)
+    kind = rnd.random()
+    if kind < 0.40:
+        return f"{rnd.randint(1, 12)} {product}"
+    if kind < 0.55:
+        return f"{rnd.randint(1, 4)} {product} {rnd.choice(UNITS)} {rnd.randint(1, 20)}"
+    if kind < 0.65:
+        return f"{rnd.choice(UNITS).capitalize()} {product} {rnd.randint(1, 5)}"
+    if kind < 0.75:
+        return f"{product} {rnd.randint(1, 10)}"
+    if kind < 0.85:
+        return f"{rnd.choice(SUBJECTS)} {product} {rnd.randint(1, 3)}"
+    if kind < 0.90:
+        return rnd.choice(SUBJECTS)
+    if kind < 0.92:
+        return rnd.choice(HEADERS)
+    return rnd.choice(NOISE)
+
+
+# ---------------------------------------------------------------------------
+# Implementaciones de referencia (versión anterior, solo para comparar)
+# ---------------------------------------------------------------------------
+
+_UNIT_END = r"\b(unidades?|uds?|ud|pack|paquete|paq|cajas?|caja|sobres?|sobre|bolsas?|bolsa|pliegos?|pliego|resmas?|resma)\s+(\d{1,3})\s*$"
+_UNIT_START = r"^(pack|paquete|paq|cajas?|caja|sobres?|sobre|bolsas?|bolsa|pliegos?|pliego|resmas?|resma)\s+(.*)$"
+
+
+def legacy_parse_item_line(original: str):
+    up = re.sub(r"\s+", " ", original.strip().upper())
+    if any(re.match(p, up) for p in HEADER_PATTERNS):
+        return None
+    m_start = re.match(r"^(\d{1,3})\s+(.+)$", original)
+    if m_start:
+        qty, detail, unit = int(m_start.group(1)), m_start.group(2).strip(), "unid"
+        m = re.search(_UNIT_END, detail, flags=re.IGNORECASE)
+        if m:
+            unit_raw = m.group(1).lower()
+            qty, unit, detail = int(m.group(2)), UNIT_MAP.get(unit_raw, unit_raw), detail[:m.start()].strip()
+        else:
+            m = re.match(_UNIT_START, detail, flags=re.IGNORECASE)
+            if m:
+                unit = UNIT_MAP.get(m.group(1).lower(), None) or m.group(1).lower()
+                detail = m.group(2).strip()
+            elif re.search(r"\bresma(s)?\b", detail, re.IGNORECASE):
+                unit = "resma"
+            elif re.search(r"\bcaja(s)?\b", detail, re.IGNORECASE):
+                unit = "caja"
+            elif re.search(r"\bsobre(s)?\b", detail, re.IGNORECASE):
+                unit = "sobre"
+        return {"item_original": original, "detalle": detail, "cantidad": qty, "unidad": unit}
+    m = re.match(_UNIT_START, original, flags=re.IGNORECASE)
+    if m:
+        unit = UNIT_MAP.get(m.group(1).lower(), None) or m.group(1).lower()
+        detail, qty = m.group(2).strip(), None
+        m_qty = re.search(r"(\d{1,3})\s*$", detail)
+        if m_qty:
+            qty, detail = int(m_qty.group(1)), detail[:m_qty.start()].strip()
+        return {"item_original": original, "detalle": detail, "cantidad": qty, "unidad": unit}
+    m = re.search(_UNIT_END, original, flags=re.IGNORECASE)
+    if m:
+        unit_raw = m.group(1).lower()
+        return {"item_original": original, "detalle": original[:m.start()].strip(),
+                "cantidad": int(m.group(2)), "unidad": UNIT_MAP.get(unit_raw, unit_raw)}
+    m = re.search(r"(\d{1,3})\s*$", original)
+    if m:
+        return {"item_original": original, "detalle": original[:m.start()].strip(),
+                "cantidad": int(m.group(1)), "unidad": "unid"}
+    return None
+
+
+def legacy_has_invalid_keyword(detalle: str, original: str) -> bool:
+    for bad_keyword in INVALID_KEYWORDS:
+        if bad_keyword.upper() in detalle or bad_keyword.upper() in original:
+            return True
+    return False
+
+
+def timed(label: str, fn, n: int) -> float:
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<38} {elapsed:8.3f} s   {elapsed / n * 1e6:7.2f} µs/línea")
+    return elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--lines", type=int, default=200_000)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+
+    rnd = random.Random(args.seed)
+    lines = [make_line(rnd) for _ in range(args.lines)]
+    upper = [ln.upper() for ln in lines]
+    n = len(lines)
+
+    print(f"📄 Corpus sintético: {n} líneas (pyahocorasick: {'sí' if AHOCORASICK_AVAILABLE else 'no'})")
+
+    mismatches = sum(1 for ln in lines if parse_item_line(ln) != legacy_parse_item_line(ln))
+    print(f"🔍 Diferencias lexer vs. referencia: {mismatches}")
+
+    print("\n⏱️  Parseo de líneas")
+    t_old = timed("4 estrategias regex (referencia)", lambda: [legacy_parse_item_line(ln) for ln in lines], n)
+    t_new = timed("lexer de una pasada", lambda: [parse_item_line(ln) for ln in lines], n)
+    print(f"  → speedup x{t_old / t_new:.2f}")
+
+    print("\n⏱️  Palabras clave inválidas")
+    t_old = timed("loop con .upper() (referencia)", lambda: [legacy_has_invalid_keyword(u, u) for u in upper], n)
+    t_new = timed("KeywordMatcher", lambda: [_INVALID_MATCHER.contains_any(u, u) for u in upper], n)
+    print(f"  → speedup x{t_old / t_new:.2f}")
+
+    print("\n⏱️  Pipeline completo")
+    raw_text = "\n".join(lines)
+    timed("parse_with_rules(split_lines(...))", lambda: parse_with_rules(split_lines(raw_text)), n)
+
+
+if __name__ == "__main__":
+    main()
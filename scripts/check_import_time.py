@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Chequeo de tiempo de import de app.main (arranque en frío en Railway).
+
+Corre `python -X importtime -c "import app.main"` en un proceso limpio, toma
+el mejor de N intentos y falla si supera el presupuesto o si se cargó alguna
+dependencia pesada que debería importarse recién al usarse.
+
+Uso:
+    python scripts/check_import_time.py [--budget-ms 1500] [--runs 3] [--top 15]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "1500"))
+
+# Solo se importan en el endpoint que las usa
+HEAVY_MODULES = (
+    "pandas", "pdfplumber", "docx", "openai", "resend", "mercadopago",
+    "Crypto", "playwright", "requests", "httpx", "PIL", "pdf2image",
+)
+
+
+def _run(code: str, importtime: bool = False) -> subprocess.CompletedProcess:
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    return subprocess.run(cmd, cwd=str(root_dir), capture_output=True, text=True, check=True)
+
+
+def heavy_modules_loaded(module: str = "app.main") -> list:
+    """Dependencias pesadas presentes en sys.modules tras importar el módulo."""
+    out = _run(
+        f"import sys, {module}; "
+        f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    ).stdout
+    return out.split()
+
+
+def measure(module: str = "app.main"):
+    """(ms acumulados del import, [(ms propios, módulo)]) de una corrida."""
+    stderr = _run(f"import {module}", importtime=True).stderr
+    total_ms = 0.0
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue  # encabezado
+        name = parts[2].strip()
+        rows.append((self_us / 1000, name))
+        if name == module:
+            total_ms = cumulative_us / 1000
+    rows.sort(reverse=True)
+    return total_ms, rows
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--module", default="app.main")
+    ap.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--top", type=int, default=15)
+    args = ap.parse_args()
+
+    results = [measure(args.module) for _ in range(args.runs)]
+    total_ms, rows = min(results, key=lambda r: r[0])
+
+    print(f"⏱️  import {args.module}: {total_ms:.0f} ms (mejor de {args.runs}, presupuesto {args.budget_ms:.0f} ms)")
+    for self_ms, name in rows[:args.top]:
+        print(f"   {self_ms:8.1f} ms  {name}")
+
+    ok = True
+    heavy = heavy_modules_loaded(args.module)
+    if heavy:
+        ok = False
+        print(f"❌ Dependencias pesadas importadas al arrancar: {', '.join(heavy)}")
+    if total_ms > args.budget_ms:
+        ok = False
+        print(f"❌ Import sobre el presupuesto: {total_ms:.0f} ms > {args.budget_ms:.0f} ms")
+    if ok:
+        print("✅ Import dentro del presupuesto")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
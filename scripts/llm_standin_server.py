@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Servidor local compatible con OpenAI (/v1/chat/completions) para tests y
+benchmarks del cliente LLM, sin gastar cuota de Groq/OpenAI.
+
+Responde con items extraídos por el parser de reglas a partir de las líneas
+del prompt (respetando los ids [L1], [L2]... del micro-batcher), con latencia
+y tasa de errores configurables. Con "stream": true responde en SSE
+(chat.completion.chunk), en fragmentos de STREAM_CHUNK_CHARS caracteres.
+
+Uso:
+    python scripts/llm_standin_server.py [--port 8089] [--latency 0.3] [--jitter 0.1] [--error-rate 0.05]
+    LLM_BACKENDS=local LOCAL_LLM_BASE_URL=http://127.0.0.1:8089/v1 python run.py
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+import time
+from pathlib import Path
+from uuid import uuid4
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.rules_parser import parse_item_line
+
+_CONTENT_RE = re.compile(r"<<<\n?(.*?)\n?>>>", re.DOTALL)
+_LINE_ID_RE = re.compile(r"^\[(L\d+)\]\s*(.*)$")
+STREAM_CHUNK_CHARS = 24
+
+
+def _prompt_text(messages) -> str:
+    for message in reversed(messages or []):
+        content = message.get("content")
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+        if message.get("role") == "user" and content:
+            return content
+    return ""
+
+
+def extract_items(prompt: str) -> list:
+    """Items "extraídos" con el parser de reglas (determinista)."""
+    m = _CONTENT_RE.search(prompt)
+    body = m.group(1) if m else prompt
+    items = []
+    for line in body.splitlines():
+        line_id = None
+        m_id = _LINE_ID_RE.match(line.strip())
+        if m_id:
+            line_id, line = m_id.group(1), m_id.group(2)
+        it = parse_item_line(line)
+        if not it or it.get("cantidad") is None:
+            continue
+        it["confianza"] = 0.9
+        if line_id:
+            it["line_id"] = line_id
+        items.append(it)
+    return items
+
+
+def _sse_chunks(content: str, model: str, token_delay: float):
+    """Eventos SSE estilo OpenAI con el contenido partido en fragmentos."""
+    chunk_id = f"chatcmpl-{uuid4().hex}"
+    created = int(time.time())
+
+    def event(delta: dict, finish_reason=None) -> str:
+        data = {
+            "id": chunk_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    async def gen():
+        yield event({"role": "assistant", "content": ""})
+        for i in range(0, len(content), STREAM_CHUNK_CHARS):
+            if token_delay:
+                await asyncio.sleep(token_delay)
+            yield event({"content": content[i:i + STREAM_CHUNK_CHARS]})
+        yield event({}, finish_reason="stop")
+        yield "data: [DONE]\n\n"
+
+    return gen()
+
+
+def create_app(latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, seed: int = 0,
+               token_delay: float = 0.0) -> FastAPI:
+    app = FastAPI(title="LLM stand-in (compatible con OpenAI)")
+    rnd = random.Random(seed)
+    app.state.requests = 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        app.state.requests += 1
+        payload = await request.json()
+        await asyncio.sleep(max(0.0, latency + rnd.uniform(-jitter, jitter)))
+
+        if rnd.random() < error_rate:
+            return JSONResponse(
+                {"error": {"message": "stand-in: rate limit", "type": "rate_limit_exceeded"}},
+                status_code=429,
+                headers={"retry-after": "0.5", "x-ratelimit-reset-requests": "500ms"},
+            )
+
+        prompt = _prompt_text(payload.get("messages"))
+        content = json.dumps({"curso": None, "items": extract_items(prompt)}, ensure_ascii=False)
+        if payload.get("stream"):
+            return StreamingResponse(
+                _sse_chunks(content, payload.get("model", "standin"), token_delay),
+                media_type="text/event-stream",
+            )
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        return {
+            "id": f"chatcmpl-{uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "standin"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--latency", type=float, default=0.3)
+    ap.add_argument("--jitter", type=float, default=0.1)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--token-delay", type=float, default=0.0, help="pausa entre fragmentos en streaming")
+    args = ap.parse_args()
+
+    print(f"🤖 LLM stand-in en http://{args.host}:{args.port}/v1 (latencia {args.latency}s ± {args.jitter}s)")
+    uvicorn.run(create_app(args.latency, args.jitter, args.error_rate, token_delay=args.token_delay), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
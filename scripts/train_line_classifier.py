@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Entrena offline el clasificador local de líneas dudosas con el historial
+del LLM guardado en llm_line_cache (línea normalizada → items; lista vacía =
+el LLM la descartó).
+
+Uso:
+    python scripts/train_line_classifier.py [--out models/line_classifier.json] [--min-samples 200]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+from app.database import LLMLineCache, SessionLocal
+from app.line_classifier import (
+    LINE_CLASSIFIER_ITEM_THRESHOLD,
+    LINE_CLASSIFIER_PATH,
+    LINE_CLASSIFIER_SKIP_THRESHOLD,
+    LineClassifier,
+)
+from app.parse_registry import PARSER_VERSION
+
+
+def load_history():
+    db = SessionLocal()
+    try:
+        rows = db.query(LLMLineCache.normalized_line, LLMLineCache.items).filter(
+            LLMLineCache.parser_version == PARSER_VERSION
+        ).all()
+    finally:
+        db.close()
+    return [(line, bool(items)) for line, items in rows if line]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--out", default=str(LINE_CLASSIFIER_PATH))
+    ap.add_argument("--min-samples", type=int, default=200)
+    ap.add_argument("--holdout", type=float, default=0.2)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+
+    data = load_history()
+    positives = sum(1 for _, label in data if label)
+    print(f"📚 Historial: {len(data)} líneas ({positives} items, {len(data) - positives} no-items)")
+    if len(data) < args.min_samples:
+        print(f"⚠️  Se necesitan al menos {args.min_samples} líneas para entrenar. No se generó modelo.")
+        return 1
+
+    random.Random(args.seed).shuffle(data)
+    cut = int(len(data) * (1 - args.holdout))
+    train, test = data[:cut], data[cut:]
+
+    model = LineClassifier().fit([l for l, _ in train], [y for _, y in train])
+
+    # Evaluación en holdout: cuántas líneas se resolverían sin LLM y con qué precisión
+    start = time.perf_counter()
+    probs = [model.predict_proba(line) for line, _ in test]
+    elapsed = time.perf_counter() - start
+    decided = correct = 0
+    for p, (_, label) in zip(probs, test):
+        if p >= LINE_CLASSIFIER_ITEM_THRESHOLD or p <= LINE_CLASSIFIER_SKIP_THRESHOLD:
+            decided += 1
+            correct += (p >= LINE_CLASSIFIER_ITEM_THRESHOLD) == label
+    if test:
+        print(f"🔍 Holdout: {len(test)} líneas, {decided / len(test):.0%} resueltas localmente, "
+              f"precisión {correct / max(decided, 1):.1%}, {elapsed / len(test) * 1e6:.1f} µs/línea")
+
+    # Modelo final con todo el historial
+    model = LineClassifier().fit([l for l, _ in data], [y for _, y in data])
+    model.save(Path(args.out))
+    print(f"✅ Modelo guardado en {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Pruebas del control de admisión demo / con sesión (app/admission.py).
+Ejecutar: python -m pytest tests/test_admission.py
+"""
+
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app import admission
+from app.admission import AdmissionPool
+
+
+def test_per_ip_limit_returns_429_with_retry_after():
+    pool = AdmissionPool("demo", capacity=4, max_queue=4, max_wait=1, per_ip=2)
+
+    async def scenario():
+        tickets = [await pool.acquire("1.1.1.1"), await pool.acquire("1.1.1.1")]
+        with pytest.raises(HTTPException) as exc:
+            await pool.acquire("1.1.1.1")
+        other = await pool.acquire("2.2.2.2")  # otra IP sigue entrando
+        for t in tickets + [other]:
+            t.release()
+        return exc.value
+
+    err = asyncio.run(scenario())
+    assert err.status_code == 429 and int(err.headers["Retry-After"]) >= 1
+    assert pool.stats["shed_per_ip"] == 1
+    assert pool.active == 0 and not pool._by_ip
+
+
+def test_queued_request_gets_released_slot():
+    pool = AdmissionPool("user", capacity=1, max_queue=4, max_wait=1, initial_hold=0.1)
+
+    async def scenario():
+        first = await pool.acquire("a")
+        waiting = asyncio.ensure_future(pool.acquire("b"))
+        await asyncio.sleep(0.02)
+        assert not waiting.done()
+        first.release()
+        second = await waiting
+        assert pool.active == 1
+        second.release()
+
+    asyncio.run(scenario())
+    assert pool.active == 0 and pool.stats["admitted"] == 2 and pool.stats["queued"] == 1
+
+
+def test_sheds_on_queue_timeout_and_expected_wait():
+    slow = AdmissionPool("demo", capacity=1, max_queue=4, max_wait=0.1, initial_hold=0.01)
+    busy = AdmissionPool("demo", capacity=1, max_queue=4, max_wait=1, initial_hold=10)
+
+    async def scenario():
+        holder = await slow.acquire("a")
+        with pytest.raises(HTTPException):
+            await slow.acquire("b")  # espera max_wait y se rechaza
+        holder.release()
+
+        holder = await busy.acquire("a")
+        start = time.monotonic()
+        with pytest.raises(HTTPException):
+            await busy.acquire("b")  # espera estimada 10 s > 1 s: rechazo inmediato
+        holder.release()
+        return time.monotonic() - start
+
+    fast_reject = asyncio.run(scenario())
+    assert slow.stats["shed_timeout"] == 1 and slow.active == 0 and not slow._by_ip
+    assert busy.stats["shed_expected_wait"] == 1 and fast_reject < 0.05
+
+
+def test_demo_load_does_not_take_user_capacity(monkeypatch):
+    monkeypatch.setattr(admission, "demo_pool", AdmissionPool("demo", capacity=1, max_queue=0, max_wait=1))
+    monkeypatch.setattr(admission, "user_pool", AdmissionPool("user", capacity=1, max_queue=0, max_wait=1))
+
+    class _Request:
+        headers = {"x-forwarded-for": "1.2.3.4, 9.9.9.9"}
+        client = None
+
+    async def scenario():
+        demo = await admission.acquire(_Request(), None)
+        with pytest.raises(HTTPException):
+            await admission.acquire(_Request(), None)
+        user = await admission.acquire(_Request(), object())  # con sesión: su propio pool
+        demo.release()
+        user.release()
+
+    asyncio.run(scenario())
+    assert admission.demo_pool.stats["shed_queue_full"] == 1
+    assert admission.user_pool.stats["admitted"] == 1
+
+
+def test_client_ip_ignores_spoofed_forwarded_hops(monkeypatch):
+    class _Request:
+        def __init__(self, forwarded):
+            self.headers = {"x-forwarded-for": forwarded}
+            self.client = type("C", (), {"host": "10.0.0.5"})()
+
+    # el proxy agrega la IP real al final; lo de la izquierda lo inventa el cliente
+    assert admission.client_ip(_Request("1.1.1.1, 9.9.9.9")) == "9.9.9.9"
+    assert admission.client_ip(_Request("2.2.2.2, 9.9.9.9")) == "9.9.9.9"
+    assert admission.client_ip(_Request("9.9.9.9")) == "9.9.9.9"
+
+    monkeypatch.setattr(admission, "TRUSTED_PROXY_HOPS", 2)  # CDN + proxy de Railway
+    assert admission.client_ip(_Request("1.1.1.1, 9.9.9.9, 172.16.0.1")) == "9.9.9.9"
+
+    monkeypatch.setattr(admission, "TRUSTED_PROXY_HOPS", 0)
+    assert admission.client_ip(_Request("9.9.9.9")) == "10.0.0.5"
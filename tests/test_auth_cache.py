@@ -0,0 +1,88 @@
+"""
+Pruebas del cache de usuarios autenticados (app/auth.py).
+Ejecutar: python -m pytest tests/test_auth_cache.py
+"""
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app import auth
+from app.auth import Principal, create_access_token, get_current_user, get_current_user_optional, invalidate_user
+from app.database import Base, User
+
+
+def _session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    queries = []
+    event.listen(engine, "before_cursor_execute", lambda *args: queries.append(args[2]))
+    db = sessionmaker(bind=engine)()
+    db.add_all([User(id=1, email="a@b.cl", name="Ana", is_active=True, is_admin=True)])
+    db.commit()
+    queries.clear()
+    return db, queries
+
+
+def _creds(user_id: int) -> HTTPAuthorizationCredentials:
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=create_access_token({"sub": str(user_id)}))
+
+
+def test_second_request_skips_db():
+    db, queries = _session()
+    invalidate_user()
+
+    user = asyncio.run(get_current_user(_creds(1), db))
+    assert isinstance(user, Principal)
+    assert user.id == 1 and user.is_admin and user.email == "a@b.cl"
+    n = len(queries)
+
+    again = asyncio.run(get_current_user(_creds(1), db))
+    assert again == user
+    assert len(queries) == n
+    assert asyncio.run(get_current_user_optional(_creds(1), db)) == user
+    assert len(queries) == n
+
+
+def test_invalidate_sees_deactivation():
+    db, _ = _session()
+    invalidate_user()
+    asyncio.run(get_current_user(_creds(1), db))
+
+    db.query(User).filter(User.id == 1).update({"is_active": False})
+    db.commit()
+    invalidate_user(1)
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(get_current_user(_creds(1), db))
+    assert exc.value.status_code == 403
+    assert asyncio.run(get_current_user_optional(_creds(1), db)) is None
+
+
+def test_deleted_user_is_rejected_after_invalidation():
+    db, _ = _session()
+    invalidate_user()
+    asyncio.run(get_current_user(_creds(1), db))
+
+    db.query(User).filter(User.id == 1).delete()
+    db.commit()
+    invalidate_user(1)
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(get_current_user(_creds(1), db))
+    assert exc.value.status_code == 401
+
+
+def test_cache_is_bounded(monkeypatch):
+    db, _ = _session()
+    db.add_all([User(id=i, email=f"u{i}@b.cl", is_active=True) for i in range(2, 6)])
+    db.commit()
+    monkeypatch.setattr(auth, "_user_cache", auth._UserCache(maxsize=3, ttl=30))
+
+    for user_id in range(1, 6):
+        asyncio.run(get_current_user(_creds(user_id), db))
+    assert list(auth._user_cache._data) == [3, 4, 5]
@@ -0,0 +1,126 @@
+"""
+Pruebas de la cotización masiva por colegio (job bulk_parse_quote en app/main.py).
+Ejecutar: python -m pytest tests/test_bulk_quote.py
+"""
+
+import asyncio
+import threading
+
+from app import main
+from app.jobs import QuoteProgress
+
+
+def _item(detalle, cantidad, tipo="util"):
+    return {"item_original": detalle, "detalle": detalle, "cantidad": cantidad, "tipo": tipo}
+
+
+LISTS = {
+    b"1A": [_item("Cuaderno college 100 hojas", 4), _item("Lápiz grafito", 2), _item("Papelucho", 1, "lectura")],
+    b"2A": [_item("cuaderno College  100 hojas", 5), _item("Témpera 12 colores", 1)],
+    b"3A": [_item("LAPIZ GRAFITO", 3), _item("Témpera 12 colores", 2)],
+}
+PRICES = {"cuaderno college 100 hojas": 1500, "lapiz grafito": 300, "tempera 12 colores": 2500}
+
+
+def test_dedupes_queries_across_lists(monkeypatch, tmp_path):
+    quoted = []
+    lock = threading.Lock()
+
+    async def fake_parse(content, ext):
+        return {
+            "items": [dict(it) for it in LISTS[content]],
+            "raw_text_preview": "",
+            "lines_count": len(LISTS[content]),
+            "dubious_sent_to_ai": 0,
+            "curso": None,
+            "llm_error": None,
+        }
+
+    def fake_quote(item, providers, limit_per_provider=5, max_results=8, on_provider_done=None):
+        key = main._bulk_query_key(item)
+        with lock:
+            quoted.append(key)
+        price = PRICES[key]
+        item["quote"] = {"status": "ok", "unit_price": price, "line_total": price * item["cantidad"]}
+        return item
+
+    monkeypatch.setattr(main, "_parse_upload_cached", fake_parse)
+    monkeypatch.setattr(main, "_quote_single_item", fake_quote)
+
+    files = []
+    for name, content in LISTS.items():
+        path = tmp_path / f"{name.decode()}.pdf"
+        path.write_bytes(name)
+        files.append({"path": str(path), "ext": ".pdf", "filename": path.name})
+
+    progress = QuoteProgress()
+    result = asyncio.run(main._run_bulk_parse_quote_job(
+        {"files": files, "providers": ["dimeiggs"]}, progress,
+    ))
+
+    # 6 items con búsqueda entre las 3 listas, pero solo 3 consultas distintas
+    assert sorted(quoted) == sorted(PRICES)
+    summary = result["summary"]
+    assert summary["lists"] == 3 and summary["unique_queries"] == 3 and summary["quotes_saved"] == 3
+
+    first, second, third = result["lists"]
+    assert first["filename"] == "1A.pdf"
+    assert [it["quote"].get("line_total") for it in first["items"]] == [6000, 600, None]
+    assert first["items"][2]["quote"]["status"] == "skip"
+    assert [it["quote"]["line_total"] for it in second["items"]] == [7500, 2500]
+    assert [it["quote"]["line_total"] for it in third["items"]] == [900, 5000]
+    assert first["resume"]["subtotal"] == 6600
+
+    assert summary["subtotal"] == 6600 + 10000 + 5900
+    assert summary["items_total"] == 7
+    assert progress.counters()["items_parsed"] == 7
+
+
+def _parsed(items):
+    return {"items": items, "raw_text_preview": "", "lines_count": len(items),
+            "dubious_sent_to_ai": 0, "curso": None, "llm_error": None}
+
+
+def test_lists_without_quotable_items(monkeypatch, tmp_path):
+    async def fake_parse(content, ext):
+        return _parsed([_item("Papelucho", 1, "lectura")] if content == b"1A" else [])
+
+    monkeypatch.setattr(main, "_parse_upload_cached", fake_parse)
+    files = []
+    for name in ("1A", "2A"):
+        path = tmp_path / f"{name}.pdf"
+        path.write_bytes(name.encode())
+        files.append({"path": str(path), "ext": ".pdf", "filename": path.name})
+
+    result = asyncio.run(main._run_bulk_parse_quote_job({"files": files, "providers": ["dimeiggs"]}, QuoteProgress()))
+    assert result["summary"]["unique_queries"] == 0 and result["summary"]["items_total"] == 1
+    assert result["lists"][0]["items"][0]["quote"]["status"] == "skip"
+
+
+def test_failed_list_does_not_fail_the_job(monkeypatch, tmp_path):
+    async def fake_parse(content, ext):
+        if content == b"ROTO":
+            raise ValueError("PDF dañado")
+        return _parsed([_item("Lápiz grafito", 2)])
+
+    def fake_quote(item, providers, limit_per_provider=5, max_results=8, on_provider_done=None):
+        item["quote"] = {"status": "ok", "unit_price": 300, "line_total": 300}
+        return item
+
+    monkeypatch.setattr(main, "_parse_upload_cached", fake_parse)
+    monkeypatch.setattr(main, "_quote_single_item", fake_quote)
+    ok, broken = tmp_path / "1A.pdf", tmp_path / "2A.pdf"
+    ok.write_bytes(b"1A")
+    broken.write_bytes(b"ROTO")
+    files = [
+        {"path": str(ok), "ext": ".pdf", "filename": "1A.pdf"},
+        {"path": str(broken), "ext": ".pdf", "filename": "2A.pdf"},
+        {"path": str(tmp_path / "borrado.pdf"), "ext": ".pdf", "filename": "borrado.pdf"},
+    ]
+
+    result = asyncio.run(main._run_bulk_parse_quote_job({"files": files, "providers": ["dimeiggs"]}, QuoteProgress()))
+    first, second, third = result["lists"]
+    assert first["items"][0]["quote"]["line_total"] == 600
+    assert second == {"filename": "2A.pdf", "error": "PDF dañado", "items": []}
+    assert third["error"].startswith("borrado.pdf") and not third["items"]
+    assert result["summary"]["lists_failed"] == 2 and result["summary"]["subtotal"] == 600
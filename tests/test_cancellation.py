@@ -0,0 +1,96 @@
+"""
+Pruebas de la cancelación por desconexión del cliente (app/cancellation.py).
+Ejecutar: python -m pytest tests/test_cancellation.py
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app import cancellation, main
+from app.cancellation import ClientDisconnected, run_cancellable
+from app.llm_batcher import LLMFixBatcher
+from app.quoting import multi_provider
+
+
+class _FakeRequest:
+    def __init__(self, disconnect_after: float):
+        self._at = time.monotonic() + disconnect_after
+
+    async def is_disconnected(self) -> bool:
+        return time.monotonic() >= self._at
+
+
+def test_disconnect_stops_pending_quotes(monkeypatch):
+    started = []
+    lock = threading.Lock()
+
+    def slow_provider(name):
+        def run(query, limit):
+            with lock:
+                started.append((name, query))
+            time.sleep(0.3)
+            return name, [], None
+        return run
+
+    monkeypatch.setattr(multi_provider, "_quote_dimeiggs", slow_provider("dimeiggs"))
+    monkeypatch.setattr(multi_provider, "_quote_jamila", slow_provider("jamila"))
+    before = dict(cancellation.stats)
+
+    items = [{"detalle": f"item {i}", "cantidad": 1, "item_original": f"item {i}"} for i in range(8)]
+
+    async def scenario():
+        start = time.monotonic()
+        with pytest.raises(ClientDisconnected):
+            await run_cancellable(
+                _FakeRequest(0.05),
+                main._quote_items(items, ["dimeiggs", "jamila"]),
+                poll=0.02,
+            )
+        return time.monotonic() - start
+
+    elapsed = asyncio.run(scenario())
+    time.sleep(0.5)  # los threads ya lanzados terminan; no deben empezar items nuevos
+
+    assert elapsed < 0.2  # no espera a los proveedores en curso
+    assert len(started) == 6 * 2  # solo los items que alcanzaron a tomar un thread
+    assert cancellation.stats["requests_cancelled"] == before["requests_cancelled"] + 1
+    assert cancellation.stats["provider_calls_skipped"] >= before["provider_calls_skipped"] + 1
+
+
+def test_no_disconnect_returns_result():
+    async def work():
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    assert asyncio.run(run_cancellable(_FakeRequest(10), work(), poll=0.01)) == "ok"
+
+
+def test_batcher_cancels_llm_call_without_waiters():
+    calls = {"started": 0, "cancelled": 0}
+
+    async def slow_fix(entries):
+        calls["started"] += 1
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            calls["cancelled"] += 1
+            raise
+        return {"items": []}
+
+    async def scenario():
+        batcher = LLMFixBatcher(window_ms=5, fix_fn=slow_fix)
+        waiters = [asyncio.ensure_future(batcher.submit([f"linea {i}"])) for i in range(2)]
+        await asyncio.sleep(0.05)
+        waiters[0].cancel()
+        await asyncio.sleep(0.01)
+        assert calls["cancelled"] == 0  # todavía hay alguien esperando
+        waiters[1].cancel()
+        await asyncio.sleep(0.01)
+
+    before = cancellation.stats["llm_calls_cancelled"]
+    asyncio.run(scenario())
+    assert calls == {"started": 1, "cancelled": 1}
+    assert cancellation.stats["llm_calls_cancelled"] == before + 1
@@ -0,0 +1,130 @@
+"""
+Pruebas del triage de documentos (reglas / reglas + IA / visión).
+Ejecutar: python -m pytest tests/test_doc_triage.py
+"""
+
+import asyncio
+import io
+import json
+
+from docx import Document
+from fastapi import UploadFile
+from PIL import Image
+
+from app import main
+from app.doc_triage import (
+    ROUTE_RULES, ROUTE_RULES_AI, ROUTE_VISION, TriageResult, decide_route, triage_document,
+)
+
+
+def _docx(path, lines):
+    doc = Document()
+    for line in lines:
+        doc.add_paragraph(line)
+    doc.save(str(path))
+    return path
+
+
+def _pdf(pages):
+    """PDF mínimo: cada página es texto (str, Helvetica) o None (solo una imagen: escaneada)."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+               "<< /Type /XObject /Subtype /Image /Width 1 /Height 1 /ColorSpace /DeviceGray "
+               "/BitsPerComponent 8 /Length 1 >>\nstream\n\x80\nendstream"]
+    kids = []
+    for text in pages:
+        if text is None:
+            content = "q 500 0 0 700 50 50 cm /Im1 Do Q"
+        else:
+            lines = " ".join(f"({line}) Tj 0 -14 Td" for line in text.splitlines())
+            content = f"BT /F1 11 Tf 50 750 Td {lines} ET"
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {len(objects)} 0 R "
+                       "/Resources << /Font << /F1 3 0 R >> /XObject << /Im1 4 0 R >> >> >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out, offsets = "%PDF-1.4\n", []
+    for n, body in enumerate(objects, 1):
+        offsets.append(len(out.encode("latin-1")))
+        out += f"{n} 0 obj\n{body}\nendobj\n"
+    xref = len(out.encode("latin-1"))
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n" + "".join(f"{o:010d} 00000 n \n" for o in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    return out.encode("latin-1")
+
+
+def test_clean_list_goes_to_rules(tmp_path):
+    path = _docx(tmp_path / "lista.docx", [
+        "LENGUAJE", "2 Cuadernos college 100 hojas", "1 Lápiz grafito", "3 Gomas de borrar", "1 Regla 30 cm",
+    ])
+    result = triage_document(path)
+    assert result.route == ROUTE_RULES and result.rules_items == 4
+
+
+def test_messy_list_goes_to_text_llm(tmp_path):
+    path = _docx(tmp_path / "lista.docx", [
+        "Estimados apoderados, para este año se solicitan los siguientes materiales",
+        "Cuaderno universitario cuadro grande",
+        "Lápices de colores largos",
+        "1 Pegamento en barra",
+    ])
+    assert triage_document(path).route == ROUTE_RULES_AI
+
+
+def test_scanned_pdf_goes_to_vision(tmp_path):
+    path = tmp_path / "escaneado.pdf"
+    pages = [Image.new("RGB", (200, 280), "white") for _ in range(2)]
+    pages[0].save(str(path), save_all=True, append_images=pages[1:])
+    result = triage_document(path)
+    assert result.route == ROUTE_VISION and result.scanned_pages == [0, 1]
+    assert triage_document(tmp_path / "foto.jpg").route == ROUTE_VISION
+
+
+def test_scanned_pages_after_the_sample_are_found(tmp_path):
+    text = "\n".join(f"{n} Cuadernos college 100 hojas" for n in range(1, 8))
+    path = tmp_path / "mixto.pdf"
+    path.write_bytes(_pdf([text, text, text, None, text]))
+
+    result = triage_document(path)
+    assert result.pages_sampled == 3 and result.pages_total == 5
+    assert result.route == ROUTE_VISION and result.scanned_pages == [3]
+    assert result.text_route == ROUTE_RULES  # sin visión, el texto sigue yendo a reglas
+
+
+def test_tables_raise_the_rules_threshold():
+    stats = dict(pages_sampled=1, rules_items=9, rules_dubious=1)
+    assert decide_route(TriageResult(route="", reason="", **stats)).route == ROUTE_RULES
+    assert decide_route(TriageResult(route="", reason="", tables=1, **stats)).route == ROUTE_RULES_AI
+
+
+def test_mixed_document_combines_vision_and_text_pages(monkeypatch, tmp_path):
+    seen_pages = []
+
+    async def fake_vision(path, pages=None):
+        seen_pages.append(pages)
+        return {"curso": "3° básico", "items": [{"item_original": "1 Block de dibujo", "detalle": "Block de dibujo", "cantidad": 1}]}
+
+    async def fake_rules_ai(path):
+        return {
+            "raw_text_preview": "2 Cuadernos college", "lines_count": 1, "dubious_sent_to_ai": 0, "curso": None,
+            "items": [{"item_original": "2 Cuadernos college", "detalle": "Cuadernos college", "cantidad": 2}],
+            "llm_error": None,
+        }
+
+    monkeypatch.setenv("LLM_PROVIDER", "openai")
+    monkeypatch.setattr(main, "UPLOAD_DIR", tmp_path)
+    monkeypatch.setattr(main, "triage_document", lambda path: TriageResult(
+        route=ROUTE_VISION, reason="mixto", pages_sampled=2, scanned_pages=[1],
+    ))
+    monkeypatch.setattr(main, "acall_llm_with_vision", fake_vision)
+    monkeypatch.setattr(main, "_parse_rules_ai", fake_rules_ai)
+
+    upload = UploadFile(file=io.BytesIO(b"%PDF mixto"), filename="lista.pdf")
+    response = asyncio.run(main.parse_with_ai_only(file=upload, use_vision=True, current_user=None))
+    data = json.loads(response.body)
+
+    assert seen_pages == [[1]]  # solo la página escaneada va a visión
+    assert data["extraction_method"] == "mixed"
+    assert [it["detalle"] for it in data["items"]] == ["Cuadernos college", "Block de dibujo"]
+    assert data["curso"] == "3° básico" and data["raw_text_preview"] == "2 Cuadernos college"
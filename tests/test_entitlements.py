@@ -0,0 +1,66 @@
+"""
+Pruebas del servicio de límites por usuario (app/entitlements.py).
+Ejecutar: python -m pytest tests/test_entitlements.py
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import entitlements
+from app.database import Base, Plan, Subscription, User
+from app.entitlements import get_entitlements, invalidate_entitlements
+from app.settings import set_setting_bool
+
+
+def _session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all([
+        Plan(id=1, name="free", price=0, billing_cycle="monthly", max_items=5, max_providers=2),
+        Plan(id=2, name="pro", price=4990, billing_cycle="monthly", max_items=100, max_providers=7),
+        User(id=10, email="a@b.cl"),
+        Subscription(user_id=10, plan_id=2, expires_at=datetime.utcnow() + timedelta(days=30)),
+    ])
+    db.commit()
+    return db
+
+
+def test_cached_until_invalidated(monkeypatch):
+    db = _session()
+    monkeypatch.setattr(entitlements, "SessionLocal", lambda: db)
+    monkeypatch.setattr(db, "close", lambda: None)
+    invalidate_entitlements()
+
+    ent = get_entitlements(10)
+    assert ent.is_paid and ent.plan_name == "pro" and ent.max_providers == 7
+    assert get_entitlements(None).is_demo
+
+    db.query(Plan).filter(Plan.id == 2).update({"max_providers": 3})
+    db.commit()
+    hits = entitlements.stats["hits"]
+    assert get_entitlements(10).max_providers == 7  # desde cache, sin ir a la BD
+    assert entitlements.stats["hits"] == hits + 1
+
+    invalidate_entitlements(10)  # p. ej. update_plan / change_user_plan
+    assert get_entitlements(10).max_providers == 3
+
+    set_setting_bool(db, "plans_enabled", False)  # invalida a todos
+    ent = get_entitlements(10)
+    assert not ent.plans_enabled and ent.max_providers is None
+    assert not get_entitlements(None).is_demo
+
+
+def test_limit_providers_by_plan(monkeypatch):
+    db = _session()
+    invalidate_entitlements()
+    free = get_entitlements(99, db)  # sin suscripción → plan free
+    assert free.plan_name == "free" and not free.is_paid
+    assert free.limit_providers(None) == (["dimeiggs", "libreria_nacional"], False)
+    assert free.limit_providers(["jamila", "prisa", "pronobel"]) == (["jamila", "prisa"], True)
+
+    demo = get_entitlements(None, db)
+    assert demo.limit_providers(["jamila"]) == (["jamila"], True)
+    assert get_entitlements(10, db).limit_providers(None)[0] == entitlements.ALL_PROVIDERS[:5]
@@ -0,0 +1,11 @@
+"""
+El import de app.main no debe cargar dependencias pesadas ni crear clientes
+(ver scripts/check_import_time.py para el presupuesto en ms).
+Ejecutar: python -m pytest tests/test_import_time.py
+"""
+
+from scripts.check_import_time import heavy_modules_loaded
+
+
+def test_app_main_imports_no_heavy_dependencies():
+    assert heavy_modules_loaded("app.main") == []
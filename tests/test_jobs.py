@@ -0,0 +1,190 @@
+"""
+Pruebas de los jobs en segundo plano de parseo + cotización (app/jobs.py).
+Ejecutar: python -m pytest tests/test_jobs.py
+"""
+
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import jobs, main
+from app.database import Base, QuoteJob
+
+
+@pytest.fixture
+def job_db(monkeypatch, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    monkeypatch.setattr(jobs, "SessionLocal", Session)
+    monkeypatch.setattr(jobs, "JOB_FLUSH_SECONDS", 0.01)
+    return Session
+
+
+async def _wait_done(Session, job_id, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        db = Session()
+        try:
+            data = jobs.job_to_dict(jobs.get_job(db, job_id))
+        finally:
+            db.close()
+        if data["status"] in (jobs.STATUS_DONE, jobs.STATUS_ERROR):
+            return data
+        assert asyncio.get_running_loop().time() < deadline, data
+        await asyncio.sleep(0.02)
+
+
+def test_batch_job_reports_progress_and_result(job_db, monkeypatch):
+    release = asyncio.Event()
+    seen_partial = []
+
+    def fake_quote(item, providers, limit_per_provider=5, max_results=8, on_provider_done=None):
+        for provider in providers:
+            on_provider_done(provider, 1, None)
+        item["quote"] = {"status": "ok", "line_total": 100 * item["cantidad"]}
+        return item
+
+    monkeypatch.setattr(main, "_quote_single_item", fake_quote)
+
+    @jobs.register_job_runner("test_batch")
+    async def runner(params, progress):
+        progress.add_parsed(len(params["items"]))
+        results = await main._quote_items(params["items"], params["providers"], progress=progress)
+        await release.wait()  # deja ver el avance persistido antes de terminar
+        return {"items": results}
+
+    async def scenario():
+        items = [{"detalle": f"item {i}", "cantidad": i + 1, "item_original": f"item {i}"} for i in range(3)]
+        job_id = await jobs.submit_job("test_batch", {"items": items, "providers": ["a", "b"]})
+
+        while True:
+            db = job_db()
+            data = jobs.job_to_dict(jobs.get_job(db, job_id))
+            db.close()
+            if data["progress"].get("items_quoted") == 3:
+                break
+            await asyncio.sleep(0.02)
+        seen_partial.append(data)
+        release.set()
+        return await _wait_done(job_db, job_id)
+
+    done = asyncio.run(scenario())
+    partial = seen_partial[0]
+    assert partial["status"] == jobs.STATUS_RUNNING and partial["stage"] == jobs.STAGE_QUOTING
+    assert partial["progress"] == {"items_parsed": 3, "items_total": 3, "items_quoted": 3, "providers_pending": 0}
+    assert [it["index"] for it in partial["items"]] == [0, 1, 2]
+
+    assert done["status"] == jobs.STATUS_DONE and done["stage"] == jobs.STAGE_DONE
+    assert [it["quote"]["line_total"] for it in done["result"]["items"]] == [100, 200, 300]
+
+
+def test_failed_job_keeps_error(job_db):
+    @jobs.register_job_runner("test_fail")
+    async def runner(params, progress):
+        raise RuntimeError("proveedor caído")
+
+    async def scenario():
+        return await _wait_done(job_db, await jobs.submit_job("test_fail", {}))
+
+    data = asyncio.run(scenario())
+    assert data["status"] == jobs.STATUS_ERROR and "proveedor caído" in data["error"]
+
+
+def test_recover_requeues_interrupted_jobs(job_db):
+    runs = []
+
+    @jobs.register_job_runner("test_recover")
+    async def runner(params, progress):
+        runs.append(params["n"])
+        return {"n": params["n"]}
+
+    old = datetime.utcnow() - timedelta(seconds=jobs.JOB_STALE_SECONDS + 5)
+    db = job_db()
+    db.add_all([
+        QuoteJob(id="a" * 32, kind="test_recover", status=jobs.STATUS_QUEUED, params={"n": 1}),
+        QuoteJob(id="b" * 32, kind="test_recover", status=jobs.STATUS_RUNNING, params={"n": 2},
+                 attempts=1, updated_at=old),
+        # sigue corriendo en otro proceso (heartbeat reciente): no se toca
+        QuoteJob(id="c" * 32, kind="test_recover", status=jobs.STATUS_RUNNING, params={"n": 3},
+                 attempts=1, updated_at=datetime.utcnow()),
+        QuoteJob(id="d" * 32, kind="test_recover", status=jobs.STATUS_RUNNING, params={"n": 4},
+                 attempts=jobs.JOB_MAX_ATTEMPTS, updated_at=old),
+    ])
+    db.commit()
+    db.close()
+
+    async def scenario():
+        assert jobs.recover_jobs() == 2
+        return [await _wait_done(job_db, job_id) for job_id in ("a" * 32, "b" * 32)]
+
+    done = asyncio.run(scenario())
+    assert sorted(runs) == [1, 2]
+    assert [d["result"]["n"] for d in done] == [1, 2]
+
+    db = job_db()
+    assert jobs.get_job(db, "c" * 32).status == jobs.STATUS_RUNNING
+    assert jobs.get_job(db, "d" * 32).status == jobs.STATUS_ERROR
+    db.close()
+
+
+def test_partial_items_are_saved_only_when_they_change(job_db):
+    db = job_db()
+    db.add(QuoteJob(id="e" * 32, kind="test", status=jobs.STATUS_RUNNING, params={}))
+    db.commit()
+    db.close()
+
+    progress = jobs.QuoteProgress()
+    progress.item_quoted(0, {"detalle": "lápiz"})
+    version, items_version = jobs._save_progress("e" * 32, progress)
+
+    # Cambian solo los contadores: los items persistidos no se reescriben
+    progress.add_parsed(1)
+    assert progress.snapshot(items_version)[-1] is None
+    progress.quoted[0] = {"detalle": "modificado sin avisar"}
+    assert jobs._save_progress("e" * 32, progress, items_version) == (version + 1, items_version)
+
+    db = job_db()
+    job = jobs.get_job(db, "e" * 32)
+    assert job.partial_items == {"0": {"detalle": "lápiz"}} and job.progress["items_parsed"] == 1
+    db.close()
+
+
+def test_anonymous_batch_jobs_take_an_admission_ticket(job_db, monkeypatch):
+    from fastapi import HTTPException
+    from starlette.requests import Request
+
+    from app import admission
+    from app.entitlements import Entitlements
+
+    release = asyncio.Event()
+
+    async def slow_batch(params, progress):
+        await release.wait()
+        return {"items": []}
+
+    pool = admission.AdmissionPool("demo", capacity=4, max_queue=4, max_wait=1, per_ip=1)
+    monkeypatch.setattr(admission, "demo_pool", pool)
+    monkeypatch.setitem(jobs._runners, "batch_quote", slow_batch)
+    monkeypatch.setattr(main, "get_entitlements", lambda user_id: Entitlements(True, True, False, "demo", 5, 2, None))
+
+    def request():
+        return Request({"type": "http", "method": "POST", "headers": [], "client": ("9.9.9.9", 1234)})
+
+    async def scenario():
+        payload = {"items": [{"detalle": "lápiz", "cantidad": 1}]}
+        accepted = await main.submit_batch_quote_job(request(), payload, current_user=None)
+        assert accepted.status_code == 202 and pool.active == 1
+        # Mientras el primero no termina, la misma IP no puede encolar otro
+        with pytest.raises(HTTPException) as exc:
+            await main.submit_batch_quote_job(request(), payload, current_user=None)
+        release.set()
+        await _wait_done(job_db, json.loads(accepted.body)["job_id"])
+        return exc.value
+
+    err = asyncio.run(scenario())
+    assert err.status_code == 429 and pool.active == 0
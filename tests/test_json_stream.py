@@ -0,0 +1,63 @@
+"""
+Pruebas del parser JSON incremental y de las completions en streaming
+(contra el servidor stand-in, scripts/llm_standin_server.py).
+Ejecutar: python -m pytest tests/test_json_stream.py
+"""
+
+import asyncio
+import json
+
+import httpx
+from openai import AsyncOpenAI
+
+from app import llm_client
+from app.json_stream import ItemStreamParser
+from app.llm_client import LLMScheduler, RateBudget
+from app.llm_router import LLMBackend, LLMRouter
+from scripts.llm_standin_server import create_app
+
+
+def test_items_yielded_as_soon_as_they_close():
+    payload = json.dumps({
+        "curso": "1° Básico",
+        "items": [
+            {"detalle": "Cuaderno {college} \"100\" hojas", "cantidad": 2, "tags": ["a", "b"]},
+            {"detalle": "Lápiz \\ grafito", "cantidad": 1, "extra": {"items": [{"x": 1}]}},
+        ],
+    }, ensure_ascii=False)
+
+    parser = ItemStreamParser()
+    seen = []
+    for i in range(0, len(payload), 7):
+        for item in parser.feed(payload[i:i + 7]):
+            seen.append((item["detalle"], i))
+
+    assert [d for d, _ in seen] == ["Cuaderno {college} \"100\" hojas", "Lápiz \\ grafito"]
+    # el primer item sale antes de que termine el texto
+    assert seen[0][1] < payload.index("Lápiz")
+    assert parser.items_seen == 2 and parser.text == payload
+
+
+def test_stream_full_extraction_from_standin(monkeypatch):
+    transport = httpx.ASGITransport(app=create_app())
+    client = AsyncOpenAI(
+        api_key="test",
+        base_url="http://standin.test/v1",
+        max_retries=0,
+        http_client=httpx.AsyncClient(transport=transport),
+    )
+    backend = LLMBackend("local", client, "standin", "standin", scheduler=LLMScheduler(RateBudget(1000, 1_000_000)))
+    monkeypatch.setattr(llm_client, "router", LLMRouter([backend]))
+
+    async def run():
+        meta = {}
+        items = [it async for it in llm_client.astream_llm_full_extraction(
+            "LENGUAJE\n2 Cuaderno college 100 hojas\n1 Lápiz grafito\n3 Gomas de borrar", meta=meta
+        )]
+        fixed = [it async for it in llm_client.astream_llm_fix(["4 Témpera 12 colores"])]
+        return items, meta, fixed
+
+    items, meta, fixed = asyncio.run(run())
+    assert [it["cantidad"] for it in items] == [2, 1, 3]
+    assert "error" not in meta
+    assert fixed[0]["cantidad"] == 4
@@ -0,0 +1,69 @@
+"""
+Pruebas del clasificador local de líneas dudosas.
+Ejecutar: python -m pytest tests/test_line_classifier.py
+"""
+
+import time
+
+from app.line_classifier import LineClassifier, classify_lines, extract_quantity_unit
+
+ITEMS = [
+    "dos cuadernos college 100 hojas", "una caja de lápices de colores", "tres témperas", "un block médium 99",
+    "cuatro plumones de pizarra", "una carpeta roja", "dos gomas de borrar", "un pegamento en barra",
+    "una tijera punta roma", "dos sobres de papel lustre", "un estuche con cierre", "tres lápices grafito",
+]
+NON_ITEMS = [
+    "marcado con nombre", "todos los materiales deben venir marcados", "lista de útiles 2025",
+    "materiales se entregan el primer día", "reunión de apoderados en marzo", "enviar en bolsa marcada",
+    "útiles de uso personal", "los materiales quedan en sala", "favor marcar cada prenda",
+    "entregar a la profesora jefe", "primer día de clases", "se solicita puntualidad",
+]
+
+
+def _model():
+    return LineClassifier().fit(ITEMS + NON_ITEMS, [True] * len(ITEMS) + [False] * len(NON_ITEMS))
+
+
+def test_quantity_words_and_units():
+    assert extract_quantity_unit("dos cajas de lápices") == (2, "caja", "lápices")
+    assert extract_quantity_unit("Témpera 12 colores 3") == (3, None, "Témpera 12 colores")
+    assert extract_quantity_unit("marcado con nombre")[0] is None
+
+
+def test_medio_is_not_a_quantity():
+    assert extract_quantity_unit("Medio pliego de cartulina") == (None, None, "Medio pliego de cartulina")
+    assert extract_quantity_unit("media resma tamaño carta")[0] is None
+    assert extract_quantity_unit("Media docena de lápices grafito") == (6, None, "lápices grafito")
+
+
+def test_classifier_separates_and_roundtrips(tmp_path):
+    model = _model()
+    assert model.predict_proba("dos cuadernos de matemáticas") > 0.5
+    assert model.predict_proba("marcar con nombre todos los materiales") < 0.5
+
+    path = tmp_path / "model.json"
+    model.save(path)
+    loaded = LineClassifier.load(path)
+    assert abs(loaded.predict_proba("una caja de témperas") - model.predict_proba("una caja de témperas")) < 1e-9
+
+
+def test_classify_lines_routes_uncertain_to_llm(monkeypatch):
+    from app import line_classifier
+    monkeypatch.setattr(line_classifier, "LINE_CLASSIFIER_ITEM_THRESHOLD", 0.9)
+    monkeypatch.setattr(line_classifier, "LINE_CLASSIFIER_SKIP_THRESHOLD", 0.1)
+
+    resolved, pending = classify_lines(
+        ["dos cuadernos college 100 hojas", "todos los materiales deben venir marcados", "Compás metálico"],
+        model=_model(),
+    )
+    assert resolved["dos cuadernos college 100 hojas"][0]["cantidad"] == 2
+    assert resolved["todos los materiales deben venir marcados"] == []
+    assert pending == ["Compás metálico"]
+
+
+def test_inference_is_fast():
+    model = _model()
+    start = time.perf_counter()
+    for _ in range(1000):
+        model.predict_proba("una caja de lápices de colores")
+    assert (time.perf_counter() - start) / 1000 < 1e-3
@@ -0,0 +1,90 @@
+"""
+Pruebas de la capa async del LLM (no bloquea el event loop, plazo total).
+Ejecutar: python -m pytest tests/test_llm_async.py
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app import llm_client
+from app.llm_client import LLMScheduler, RateBudget
+from app.llm_router import LLMBackend, LLMRouter
+
+
+class _SlowCompletions:
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    async def create(self, **kwargs):
+        await asyncio.sleep(self.delay)
+        content = json.dumps({"items": [{"detalle": "Témpera 12 colores", "cantidad": 1}]})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def _fake_router(delay: float) -> LLMRouter:
+    client = SimpleNamespace(chat=SimpleNamespace(completions=_SlowCompletions(delay)))
+    scheduler = LLMScheduler(RateBudget(1000, 1_000_000))
+    return LLMRouter([LLMBackend("fake", client, "m", "m", scheduler=scheduler)])
+
+
+def test_llm_call_does_not_block_event_loop(monkeypatch):
+    monkeypatch.setattr(llm_client, "router", _fake_router(0.2))
+    ticks = []
+
+    async def heartbeat():
+        for _ in range(5):
+            ticks.append(1)
+            await asyncio.sleep(0.02)
+
+    async def main():
+        result, _ = await asyncio.gather(llm_client.acall_llm_fix(["Témpera 12 colores"]), heartbeat())
+        return result
+
+    result = asyncio.run(main())
+    assert result["items"][0]["cantidad"] == 1
+    assert len(ticks) == 5
+
+
+def test_deadline_cancels_call(monkeypatch):
+    monkeypatch.setattr(llm_client, "router", _fake_router(5))
+    monkeypatch.setattr(llm_client, "LLM_DEADLINE_SECONDS", 0.05)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(llm_client.acall_llm_fix(["x"]))
+
+    # La extracción completa no propaga el error: devuelve estructura vacía
+    result = asyncio.run(llm_client.acall_llm_full_extraction("1 Cuaderno college 100 hojas"))
+    assert result["items"] == [] and "error" in result
+
+
+def test_deadline_covers_rate_limit_retries(monkeypatch):
+    import httpx
+    from openai import RateLimitError
+
+    calls = []
+
+    class _RateLimited:
+        async def create(self, **kwargs):
+            calls.append(1)
+            await asyncio.sleep(0.04)
+            response = httpx.Response(429, headers={"retry-after": "0"}, request=httpx.Request("POST", "http://llm"))
+            raise RateLimitError("429", response=response, body=None)
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=_RateLimited()))
+    router = LLMRouter([LLMBackend("fake", client, "m", "m", scheduler=LLMScheduler(RateBudget(1000, 1_000_000)))])
+    monkeypatch.setattr(llm_client, "router", router)
+    monkeypatch.setattr(llm_client, "LLM_DEADLINE_SECONDS", 0.1)
+    monkeypatch.setattr(llm_client, "LLM_RATE_LIMIT_RETRIES", 10)
+
+    async def scenario():
+        start = asyncio.get_running_loop().time()
+        with pytest.raises(asyncio.TimeoutError):
+            await llm_client.acall_llm_fix(["x"])
+        return asyncio.get_running_loop().time() - start
+
+    # un plazo para toda la llamada, no 0.1 s por cada uno de los 11 intentos
+    assert asyncio.run(scenario()) < 0.2
+    assert len(calls) <= 3
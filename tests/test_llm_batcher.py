@@ -0,0 +1,87 @@
+"""
+Pruebas del micro-batcher de líneas dudosas entre requests concurrentes.
+Ejecutar: python -m pytest tests/test_llm_batcher.py
+"""
+
+import asyncio
+
+import pytest
+
+from app.llm_batcher import LLMFixBatcher
+
+
+def _fake_fix(calls):
+    async def fix(entries):
+        calls.append(list(entries))
+        items = []
+        for line_id, text in entries:
+            if "horario" in text.lower():
+                continue
+            items.append({"line_id": line_id, "detalle": text.upper(), "cantidad": 1})
+        return {"curso": None, "items": items}
+    return fix
+
+
+def test_concurrent_requests_share_one_call():
+    calls = []
+    batcher = LLMFixBatcher(window_ms=50, max_lines=100, fix_fn=_fake_fix(calls))
+
+    async def main():
+        return await asyncio.gather(
+            batcher.submit(["Témpera 12 colores", "Horario 08:00"]),
+            batcher.submit(["Block 99 1/8", "témpera  12 colores"]),
+        )
+
+    first, second = asyncio.run(main())
+    assert len(calls) == 1
+    # La línea repetida se envía una sola vez
+    assert [text for _, text in calls[0]] == ["Témpera 12 colores", "Horario 08:00", "Block 99 1/8"]
+    assert [it["detalle"] for it in first["items"]] == ["TÉMPERA 12 COLORES"]
+    assert [it["item_original"] for it in second["items"]] == ["Block 99 1/8", "témpera  12 colores"]
+    assert "line_id" not in first["items"][0]
+
+
+def test_max_lines_flushes_and_errors_propagate():
+    calls = []
+
+    async def failing(entries):
+        calls.append(entries)
+        raise RuntimeError("429")
+
+    batcher = LLMFixBatcher(window_ms=10_000, max_lines=2, fix_fn=failing)
+    with pytest.raises(RuntimeError):
+        # Sin esperar la ventana: el tamaño máximo dispara el envío
+        asyncio.run(asyncio.wait_for(batcher.submit(["a", "b"]), timeout=1))
+    assert len(calls) == 1
+
+
+def test_items_without_source_line_are_not_dropped():
+    calls = []
+
+    async def fix(entries):
+        calls.append([text for _, text in entries])
+        items = []
+        for line_id, text in entries:
+            if "lapiceras" in text:
+                # line_id inválido e item_original reescrito: no se puede asociar a una línea
+                items.append({"line_id": "L99", "item_original": "Lápiz pasta azul", "detalle": "Lápiz pasta azul"})
+            elif "goma" in text:
+                items.append({"line_id": line_id, "detalle": "Goma"})
+        return {"curso": None, "items": items}
+
+    async def scenario(requests):
+        batcher = LLMFixBatcher(window_ms=20, fix_fn=fix)
+        results = await asyncio.gather(*(batcher.submit(lines) for lines in requests))
+        return results, batcher.orphans_dropped
+
+    (alone,), _ = asyncio.run(scenario([["2 lapiceras azul"]]))
+    assert [it["detalle"] for it in alone["items"]] == ["Lápiz pasta azul"]
+
+    # Con varias requests el item huérfano no se filtra a las demás: la línea
+    # sin items se vuelve a pedir sola para su request
+    calls.clear()
+    (first, second), dropped = asyncio.run(scenario([["2 lapiceras azul"], ["1 goma"]]))
+    assert dropped == 1
+    assert calls == [["2 lapiceras azul", "1 goma"], ["2 lapiceras azul"]]
+    assert [it["detalle"] for it in first["items"]] == ["Lápiz pasta azul"]
+    assert [it["detalle"] for it in second["items"]] == ["Goma"]
@@ -0,0 +1,97 @@
+"""
+Pruebas del cache por línea para líneas dudosas enviadas al LLM.
+Ejecutar: python -m pytest tests/test_llm_line_cache.py
+"""
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import llm_line_cache
+from app.database import Base, LLMLineCache
+
+
+def _setup(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(llm_line_cache, "SessionLocal", sessionmaker(bind=engine))
+    llm_line_cache.clear_memory_cache()
+
+    calls = []
+
+    def fake_llm_fix(lines):
+        calls.append(list(lines))
+        items = []
+        for ln in lines:
+            if "témpera" in ln.lower():
+                items.append({"item_original": ln, "detalle": "Témpera 12 colores", "cantidad": 1})
+        return {"curso": None, "items": items}
+
+    monkeypatch.setattr(llm_line_cache, "call_llm_fix", fake_llm_fix)
+    return calls
+
+
+def test_only_misses_reach_llm(monkeypatch):
+    calls = _setup(monkeypatch)
+
+    first = llm_line_cache.call_llm_fix_cached(["Témpera 12 colores", "Horario de clases"])
+    assert calls == [["Témpera 12 colores", "Horario de clases"]]
+    assert [it["detalle"] for it in first["items"]] == ["Témpera 12 colores"]
+
+    # Línea repetida (otra forma de escribirla) + línea nueva: solo la nueva va al LLM
+    second = llm_line_cache.call_llm_fix_cached(["Block 99 1/8", "TÉMPERA  12 colores", "Block 99 1/8"])
+    assert calls[1] == ["Block 99 1/8"]
+    assert second["cache_hits"] == 1 and second["cache_misses"] == 1
+    assert second["items"][0]["item_original"] == "TÉMPERA  12 colores"
+
+
+def test_database_survives_memory_eviction(monkeypatch):
+    calls = _setup(monkeypatch)
+
+    llm_line_cache.call_llm_fix_cached(["Témpera 12 colores"])
+    llm_line_cache.clear_memory_cache()
+    result = llm_line_cache.call_llm_fix_cached(["Témpera 12 colores"])
+
+    assert len(calls) == 1
+    assert result["cache_hits"] == 1
+    assert len(result["items"]) == 1
+
+
+def test_line_with_rewritten_item_original_is_not_cached(monkeypatch):
+    _setup(monkeypatch)
+    calls = []
+
+    def rewriting_llm_fix(lines):
+        calls.append(list(lines))
+        # el LLM "corrige" item_original: no se puede asociar a ninguna línea
+        return {"curso": None, "items": [{"item_original": "Lápiz pasta azul", "detalle": "Lápiz pasta azul", "cantidad": 2}]}
+
+    monkeypatch.setattr(llm_line_cache, "call_llm_fix", rewriting_llm_fix)
+
+    first = llm_line_cache.call_llm_fix_cached(["2 lapiceras azul bic"])
+    assert [it["detalle"] for it in first["items"]] == ["Lápiz pasta azul"]
+
+    # no quedó guardada como descarte ([]): la próxima subida vuelve a preguntar
+    second = llm_line_cache.call_llm_fix_cached(["2 lapiceras azul bic"])
+    assert len(calls) == 2 and len(second["items"]) == 1
+
+    db = llm_line_cache.SessionLocal()
+    assert db.query(LLMLineCache).count() == 0
+    db.close()
+
+
+def test_partial_item_original_is_not_attributed_to_a_longer_line(monkeypatch):
+    _setup(monkeypatch)
+
+    def short_original_llm_fix(lines):
+        return {"curso": None, "items": [{"item_original": "Lápiz", "detalle": "Lápiz grafito", "cantidad": 1}]}
+
+    monkeypatch.setattr(llm_line_cache, "call_llm_fix", short_original_llm_fix)
+
+    result = llm_line_cache.call_llm_fix_cached(["Lápiz grafito n°2", "Lápices de colores"])
+    assert [it["detalle"] for it in result["items"]] == ["Lápiz grafito"]
+
+    # "lápiz" no se atribuye a "lápiz grafito n°2": ninguna línea queda cacheada con ese item
+    db = llm_line_cache.SessionLocal()
+    assert db.query(LLMLineCache).count() == 0
+    db.close()
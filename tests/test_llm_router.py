@@ -0,0 +1,139 @@
+"""
+Pruebas del ruteo multi-backend (latencia, failover, hedge) contra el
+servidor stand-in compatible con OpenAI (scripts/llm_standin_server.py).
+Ejecutar: python -m pytest tests/test_llm_router.py
+"""
+
+import asyncio
+
+import httpx
+from openai import AsyncOpenAI
+
+from app import llm_client, llm_router
+from app.llm_client import LLMScheduler, RateBudget
+from app.llm_router import LLMBackend, LLMRouter
+from scripts.llm_standin_server import create_app
+
+
+def _backend(name: str, latency: float = 0.0, error_rate: float = 0.0) -> LLMBackend:
+    transport = httpx.ASGITransport(app=create_app(latency=latency, error_rate=error_rate))
+    client = AsyncOpenAI(
+        api_key="test",
+        base_url="http://standin.test/v1",
+        max_retries=0,
+        http_client=httpx.AsyncClient(transport=transport),
+    )
+    return LLMBackend(name, client, "standin", "standin", scheduler=LLMScheduler(RateBudget(1000, 1_000_000)))
+
+
+def test_standin_answers_fix_prompt(monkeypatch):
+    monkeypatch.setattr(llm_client, "router", LLMRouter([_backend("local")]))
+    result = asyncio.run(llm_client.acall_llm_fix_with_ids([("L1", "2 Lápiz grafito"), ("L2", "Horario")]))
+    assert [(it["line_id"], it["cantidad"]) for it in result["items"]] == [("L1", 2)]
+
+
+def test_routes_to_fastest_and_fails_over():
+    fast, slow = _backend("fast"), _backend("slow")
+    fast.latencies.extend([0.05] * 5)
+    slow.latencies.extend([0.5] * 5)
+    router = LLMRouter([slow, fast])
+    assert [b.name for b in router.ranked()] == ["fast", "slow"]
+
+    fast.outcomes.extend([True] * 5)  # fast empieza a fallar: deja de estar sano
+    assert router.ranked()[0].name == "slow"
+
+    async def attempt(backend):
+        if backend.name == "slow":
+            raise RuntimeError("caído")
+        return backend.name
+
+    assert asyncio.run(router.call(attempt)) == "fast"
+    assert router.stats["failovers"] == 1
+
+
+def test_hedged_request_wins_when_primary_is_slow(monkeypatch):
+    primary = _backend("primary", latency=1.0)
+    backup = _backend("backup", latency=0.0)
+    primary.latencies.extend([0.01] * 5)  # históricamente rápido: p90 = 10 ms
+    backup.latencies.extend([0.02] * 5)
+    router = LLMRouter([primary, backup], hedge=True)
+    monkeypatch.setattr(llm_client, "router", router)
+
+    result = asyncio.run(asyncio.wait_for(llm_client.acall_llm_fix(["3 Témpera 12 colores"]), timeout=0.8))
+    assert result["items"][0]["cantidad"] == 3
+    assert router.stats["hedged"] == 1 and router.stats["hedge_wins"] == 1
+
+
+def test_unhealthy_backend_gets_probe_after_cooldown(monkeypatch):
+    fast, slow = _backend("fast"), _backend("slow")
+    fast.latencies.extend([0.05] * 5)
+    slow.latencies.extend([0.5] * 5)
+    fast.outcomes.extend([True] * 5)
+    router = LLMRouter([slow, fast])
+
+    async def attempt(backend):
+        return backend.name
+
+    assert asyncio.run(router.call(attempt)) == "slow"  # todavía en cooldown
+
+    fast.last_probe -= llm_router.LLM_BACKEND_PROBE_SECONDS
+    assert asyncio.run(router.call(attempt)) == "fast"  # prueba half-open
+    assert router.stats["probes"] == 1 and fast.healthy()
+    assert router.ranked()[0].name == "fast"
+
+
+def test_hedge_closes_the_losing_result():
+    closed = []
+
+    class _Stream:
+        def __init__(self, name):
+            self.name = name
+
+        async def close(self):
+            closed.append(self.name)
+
+    primary, backup = _backend("primary"), _backend("backup")
+    primary.latencies.extend([0.01] * 5)
+    backup.latencies.extend([0.02] * 5)
+    router = LLMRouter([primary, backup], hedge=True)
+
+    async def attempt(backend):
+        # la primaria pasa su p90; al partir el hedge ambas terminan en la misma ronda de wait
+        if backend.name == "backup":
+            gate.set()
+        await gate.wait()
+        return _Stream(backend.name)
+
+    async def scenario():
+        nonlocal gate
+        gate = asyncio.Event()
+        return await router.call(attempt)
+
+    gate = None
+    result = asyncio.run(scenario())
+    assert result.name == "primary" and closed == ["backup"]
+
+
+def test_cancelled_caller_cancels_primary_before_hedge():
+    cancelled = []
+    primary, backup = _backend("primary"), _backend("backup")
+    primary.latencies.extend([0.5] * 5)  # p90 = 500 ms: el llamador se va antes del hedge
+    backup.latencies.extend([0.6] * 5)
+    router = LLMRouter([primary, backup], hedge=True)
+
+    async def attempt(backend):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(backend.name)
+            raise
+
+    async def scenario():
+        try:
+            await asyncio.wait_for(router.call(attempt), timeout=0.05)
+        except asyncio.TimeoutError:
+            pass
+        await asyncio.sleep(0.01)  # deja correr la cancelación del task interno
+        return list(cancelled)  # antes de que asyncio.run cancele lo que quede
+
+    assert asyncio.run(scenario()) == ["primary"] and router.stats["hedged"] == 0
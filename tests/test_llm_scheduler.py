@@ -0,0 +1,83 @@
+"""
+Pruebas del scheduler de llamadas al LLM (presupuesto RPM/TPM, prioridad, 429).
+Ejecutar: python -m pytest tests/test_llm_scheduler.py
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+from openai import RateLimitError
+
+from app import llm_client
+from app.llm_client import (
+    PRIORITY_FREE,
+    PRIORITY_PAID,
+    LLMScheduler,
+    RateBudget,
+    parse_reset_duration,
+    rate_limit_reset_seconds,
+)
+from app.llm_router import LLMBackend, LLMRouter
+
+
+def test_parse_reset_headers():
+    assert parse_reset_duration("2m59.56s") == 179.56
+    assert parse_reset_duration("120ms") == 0.12
+    assert parse_reset_duration("7") == 7.0
+    assert rate_limit_reset_seconds({"x-ratelimit-reset-tokens": "7.66s", "x-ratelimit-reset-requests": "1s"}) == 7.66
+    assert rate_limit_reset_seconds({"retry-after": "3", "x-ratelimit-reset-tokens": "9s"}) == 3.0
+
+
+def test_budget_rpm_and_tpm():
+    budget = RateBudget(rpm=2, tpm=1000)
+    assert budget.wait_time(5000, now=0) == 0  # ventana vacía: siempre sale
+    budget.record(600, now=0)
+    assert budget.wait_time(300, now=1) == 0
+    assert budget.wait_time(500, now=1) == 59  # espera a que expiren los 600 tokens
+    budget.record(300, now=10)
+    assert budget.wait_time(10, now=20) == 40  # 2 requests en la ventana
+    assert budget.wait_time(10, now=61) == 0
+
+
+def test_paid_calls_go_first():
+    budget = RateBudget(rpm=1, tpm=10_000)
+    budget.WINDOW = 0.1
+    scheduler = LLMScheduler(budget)
+    order = []
+
+    async def call(name, priority):
+        await scheduler.acquire(10, priority)
+        order.append(name)
+
+    async def main():
+        await scheduler.acquire(10, PRIORITY_FREE)  # ocupa la ventana
+        await asyncio.gather(call("free", PRIORITY_FREE), call("paid", PRIORITY_PAID))
+
+    asyncio.run(main())
+    assert order == ["paid", "free"]
+
+
+def test_rate_limited_call_is_retried(monkeypatch):
+    attempts = []
+
+    class Completions:
+        async def create(self, **kwargs):
+            attempts.append(1)
+            if len(attempts) == 1:
+                response = httpx.Response(
+                    429, headers={"retry-after": "0.05"}, request=httpx.Request("POST", "http://llm.test")
+                )
+                raise RateLimitError("rate limited", response=response, body=None)
+            content = json.dumps({"items": [{"detalle": "Lápiz", "cantidad": 2}]})
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=Completions()))
+    scheduler = LLMScheduler(RateBudget(100, 100_000))
+    monkeypatch.setattr(llm_client, "router", LLMRouter([LLMBackend("fake", client, "m", "m", scheduler=scheduler)]))
+
+    result = asyncio.run(llm_client.acall_llm_fix(["2 Lápiz"]))
+    assert len(attempts) == 2
+    assert result["items"][0]["cantidad"] == 2
+    assert llm_client.get_scheduler().stats["rate_limited"] == 1
@@ -0,0 +1,50 @@
+"""
+Pruebas del render liviano de páginas para visión (app/page_render.py).
+Ejecutar: python -m pytest tests/test_page_render.py
+"""
+
+import base64
+import io
+
+from PIL import Image, ImageDraw
+
+from app import page_render
+
+
+def _decode(url):
+    header, data = url.split(",", 1)
+    return header, Image.open(io.BytesIO(base64.b64decode(data)))
+
+
+def test_encode_crops_downscales_and_compresses():
+    page = Image.new("RGB", (1700, 2200), "white")  # carta a 200 dpi
+    ImageDraw.Draw(page).rectangle((200, 300, 1500, 1900), fill="black")
+
+    header, img = _decode(page_render.encode_image(page, crop=True))
+    assert header == "data:image/jpeg;base64"
+    assert min(img.size) == 768  # lado corto = resolución efectiva del modelo
+    # recortado al contenido: proporción del rectángulo (1300x1600 + margen), no de la página
+    assert abs(img.width / img.height - 1324 / 1624) < 0.01
+
+    small = Image.new("RGB", (300, 400), "white")
+    assert _decode(page_render.encode_image(small, crop=False))[1].size == (300, 400)  # nunca amplía
+
+
+def test_renders_only_requested_pages(monkeypatch, tmp_path):
+    pdf_path = tmp_path / "lista.pdf"
+    pages = [Image.new("RGB", (612, 792), "white") for _ in range(5)]  # carta a 72 dpi
+    pages[0].save(str(pdf_path), save_all=True, append_images=pages[1:], resolution=72)
+
+    rendered = []
+
+    def fake_render(path, page_index, dpi):
+        rendered.append((page_index, dpi))
+        return Image.new("RGB", (int(8.5 * dpi), int(11 * dpi)), "white")
+
+    monkeypatch.setattr(page_render, "_render_page", fake_render)
+    urls = page_render.render_pdf_pages(pdf_path, pages=[4, 1, 9])
+    assert sorted(rendered) == [(1, 91), (4, 91)] and len(urls) == 2
+
+    rendered.clear()
+    page_render.render_pdf_pages(pdf_path)
+    assert sorted(p for p, _ in rendered) == [0, 1, 2]
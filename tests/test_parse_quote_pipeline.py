@@ -0,0 +1,105 @@
+"""
+Pruebas del pipeline parseo + cotización solapados
+(_parse_and_quote_overlapped en app/main.py).
+Ejecutar: python -m pytest tests/test_parse_quote_pipeline.py
+"""
+
+import asyncio
+import threading
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import main
+from app.database import Base
+from app.rules_parser import RulesParseStream
+
+
+def _sessions():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+def test_quotes_ok_items_while_llm_fixes(monkeypatch, tmp_path):
+    events = []
+    lock = threading.Lock()
+
+    def fake_rules(path):
+        stream = RulesParseStream(iter(["2 Cuaderno college\n1 Lápiz grafito\nalgo raro"]))
+        return stream, list(stream)
+
+    async def fake_fix(dub_lines):
+        await asyncio.sleep(0.3)
+        with lock:
+            events.append("llm")
+        yield {"detalle": "Témpera 12 colores", "cantidad": 3, "item_original": dub_lines[0]}
+
+    def fake_quote(item, providers):
+        time.sleep(0.05)
+        with lock:
+            events.append(item["detalle"])
+        item["quote"] = {"status": "ok", "line_total": 1000}
+        return item
+
+    monkeypatch.setattr(main, "UPLOAD_DIR", tmp_path)
+    monkeypatch.setattr(main, "_run_rules", fake_rules)
+    monkeypatch.setattr(main, "find_dubious_lines", lambda parsed: ["algo raro"])
+    monkeypatch.setattr(main, "astream_llm_fix_cached", fake_fix)
+    monkeypatch.setattr(main, "_quote_single_item", fake_quote)
+
+    monkeypatch.setattr(main, "SessionLocal", _sessions())
+    start = time.monotonic()
+    result = asyncio.run(main._parse_and_quote_overlapped(b"%PDF lista", ".pdf", ["dimeiggs"]))
+    elapsed = time.monotonic() - start
+
+    # los ok_items se cotizan antes de que termine el LLM; el total no es la suma
+    assert events.index("llm") == 2
+    assert elapsed < 0.3 + 0.15
+    assert [it["cantidad"] for it in result["quoted_items"]] == [2, 1, 3]
+    assert result["llm_error"] is None
+
+    # segunda vez: viene del registro por hash y respeta el límite de items
+    again = asyncio.run(main._parse_and_quote_overlapped(b"%PDF lista", ".pdf", ["dimeiggs"], max_quoted=2))
+    assert len(again["items"]) == 3 and len(again["quoted_items"]) == 2
+
+
+def test_incremental_normalizer_matches_batch():
+    items = [
+        {"detalle": "Cuaderno college", "cantidad": 2, "asignatura": "Matemática"},
+        {"detalle": "Regla 30 cm / transparente", "cantidad": 1},
+        {"detalle": "Papelucho (Marcela Paz)", "cantidad": 1, "unidad": "UNID"},
+        {"detalle": "Block médium 99", "cantidad": 1, "asignatura": "Artes"},
+        {"detalle": "Témpera", "cantidad": 1},
+    ]
+    normalize = main.incremental_normalizer()
+    assert [normalize(it) for it in items] == main.normalize_items(items)
+
+
+def test_parse_ai_keeps_llm_fixed_items(monkeypatch, tmp_path):
+    import io
+    import json
+
+    from docx import Document
+    from fastapi import UploadFile
+
+    async def fake_fix_cached(dub_lines):
+        return {"curso": None, "items": [{"detalle": "Témpera 12 colores", "cantidad": 3, "item_original": dub_lines[0]}]}
+
+    monkeypatch.setattr(main, "UPLOAD_DIR", tmp_path)
+    monkeypatch.setattr(main, "acall_llm_fix_cached", fake_fix_cached)
+    monkeypatch.setattr(main, "find_dubious_lines", lambda parsed: ["témpera doce colores"])
+
+    doc = Document()
+    for line in ["2 Cuaderno college", "témpera doce colores"]:
+        doc.add_paragraph(line)
+    buf = io.BytesIO()
+    doc.save(buf)
+    buf.seek(0)
+
+    response = asyncio.run(main.parse_rules_plus_ai(file=UploadFile(file=buf, filename="lista.docx"), quote=False))
+    data = json.loads(response.body)
+    assert data["dubious_sent_to_ai"] == 1
+    assert [it["detalle"] for it in data["items"]] == ["Cuaderno college", "Témpera 12 colores"]
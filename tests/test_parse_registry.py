@@ -0,0 +1,68 @@
+"""
+Pruebas del registro de parseos por hash de documento.
+Ejecutar: python -m pytest tests/test_parse_registry.py
+"""
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import parse_registry
+from app.database import Base, ParsedDocument
+from app.parse_registry import document_hash, get_parsed_document, save_parsed_document
+
+RESULT = {
+    "raw_text_preview": "LISTA DE ÚTILES",
+    "lines_count": 3,
+    "dubious_sent_to_ai": 0,
+    "curso": None,
+    "items": [{"item_original": "2 Lápiz", "detalle": "Lápiz", "cantidad": 2}],
+}
+
+
+def _session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+
+def test_roundtrip_and_hits():
+    db = _session()
+    h = document_hash(b"%PDF-1.4 lista")
+    assert get_parsed_document(db, h) is None
+
+    save_parsed_document(db, h, RESULT)
+    cached = get_parsed_document(db, h)
+    assert cached["items"] == RESULT["items"]
+    assert cached["lines_count"] == 3
+    assert get_parsed_document(db, h, method="vision") is None
+
+
+def test_version_change_invalidates(monkeypatch):
+    db = _session()
+    h = document_hash(b"docx")
+    save_parsed_document(db, h, RESULT)
+
+    monkeypatch.setattr(parse_registry, "PARSER_VERSION", "otra")
+    assert get_parsed_document(db, h) is None
+
+    # Re-guardar con la versión nueva reemplaza la entrada existente
+    save_parsed_document(db, h, {**RESULT, "lines_count": 9})
+    assert get_parsed_document(db, h)["lines_count"] == 9
+
+
+def test_reads_batch_hits_in_memory(monkeypatch):
+    db = _session()
+    h = document_hash(b"%PDF popular")
+    save_parsed_document(db, h, RESULT)
+    parse_registry.flush_hits(db)
+
+    monkeypatch.setattr(parse_registry, "PARSE_HITS_FLUSH_SECONDS", 3600)
+    commits = []
+    monkeypatch.setattr(db, "commit", lambda: commits.append(1))
+    for _ in range(3):
+        assert get_parsed_document(db, h) is not None
+    assert commits == []  # leer no escribe
+
+    monkeypatch.undo()
+    assert parse_registry.flush_hits(db) == 1
+    assert db.query(ParsedDocument).filter_by(content_hash=h).one().hits == 3
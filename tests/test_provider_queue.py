@@ -0,0 +1,119 @@
+"""
+Pruebas de la cola compartida de proveedores con prioridad por plan (app/provider_queue.py).
+Ejecutar: python -m pytest tests/test_provider_queue.py
+"""
+
+import threading
+import time
+
+from app import provider_queue
+from app.entitlements import Entitlements
+from app.provider_queue import TIER_BASIC, TIER_DEMO, TIER_FREE, TIER_PRO, ProviderLanes, ProviderScheduler, tier_for
+from app.quoting import multi_provider
+
+
+def _blocked(scheduler):
+    """Ocupa el único worker hasta que se suelte el evento."""
+    gate = threading.Event()
+    scheduler.submit(gate.wait, tier=TIER_PRO)
+    time.sleep(0.02)
+    return gate
+
+
+def test_higher_tiers_run_first():
+    scheduler = ProviderScheduler(workers=1, aging_seconds=60)
+    order = []
+    gate = _blocked(scheduler)
+
+    futures = [scheduler.submit(lambda t=t: order.append(t), tier=t)
+               for t in (TIER_DEMO, TIER_FREE, TIER_BASIC, TIER_PRO, TIER_DEMO)]
+    gate.set()
+    for f in futures:
+        f.result(timeout=1)
+
+    assert order == [TIER_PRO, TIER_BASIC, TIER_FREE, TIER_DEMO, TIER_DEMO]
+    tiers = scheduler.snapshot()["tiers"]
+    assert tiers["demo"]["completed"] == 2 and tiers["pro"]["completed"] == 2
+    assert tiers["demo"]["wait_p95_ms"] >= tiers["pro"]["wait_avg_ms"]
+
+
+def test_aging_prevents_starvation():
+    scheduler = ProviderScheduler(workers=1, aging_seconds=0.01)
+    order = []
+    gate = _blocked(scheduler)
+
+    demo = scheduler.submit(lambda: order.append("demo"), tier=TIER_DEMO)
+    time.sleep(0.1)  # 10 niveles ganados esperando
+    pro = [scheduler.submit(lambda: order.append("pro"), tier=TIER_PRO) for _ in range(3)]
+    gate.set()
+    for f in [demo] + pro:
+        f.result(timeout=1)
+
+    assert order[0] == "demo"
+    assert scheduler.snapshot()["tiers"]["demo"]["promoted"] == 1
+
+
+def test_cancelled_tasks_are_skipped():
+    scheduler = ProviderScheduler(workers=1, aging_seconds=60)
+    ran = []
+    gate = _blocked(scheduler)
+
+    future = scheduler.submit(lambda: ran.append(1), tier=TIER_FREE)
+    assert future.cancel()
+    gate.set()
+    scheduler.submit(lambda: None, tier=TIER_FREE).result(timeout=1)
+
+    assert ran == [] and scheduler.snapshot()["tiers"]["free"]["cancelled"] == 1
+
+
+def test_tier_for_plans():
+    def ent(plan, is_demo=False, is_paid=False):
+        return Entitlements(True, is_demo, is_paid, plan, None, None, None)
+
+    assert tier_for(ent("pro", is_paid=True)) == TIER_PRO
+    assert tier_for(ent("basic", is_paid=True)) == TIER_BASIC
+    assert tier_for(ent("free")) == TIER_FREE
+    assert tier_for(ent("demo", is_demo=True)) == TIER_DEMO
+    assert tier_for(ent("colegios", is_paid=True)) == TIER_BASIC
+    assert tier_for(ent("unlimited")) == TIER_FREE
+
+
+def test_slow_provider_does_not_block_other_lanes():
+    lanes = ProviderLanes(workers=1, playwright_workers=1, aging_seconds=60)
+    gate = threading.Event()
+    lanes.submit("prisa", gate.wait, tier=TIER_PRO)
+    queued = lanes.submit("prisa", lambda: "prisa", tier=TIER_PRO)
+
+    # Con Prisa ocupada, otro proveedor responde sin esperar su carril
+    assert lanes.submit("dimeiggs", lambda: "dimeiggs", tier=TIER_DEMO).result(timeout=1) == "dimeiggs"
+    assert not queued.done()
+    gate.set()
+    assert queued.result(timeout=1) == "prisa"
+    assert set(lanes.snapshot()) == {"dimeiggs", "prisa"}
+
+
+def test_workers_start_only_when_needed():
+    scheduler = ProviderScheduler(workers=8, aging_seconds=60)
+    for _ in range(3):
+        scheduler.submit(lambda: None, tier=TIER_FREE).result(timeout=1)
+        time.sleep(0.02)  # el worker vuelve a quedar libre
+    assert len(scheduler._threads) == 1
+
+
+def test_quote_uses_tier_from_context(monkeypatch):
+    lanes = ProviderLanes(workers=2, aging_seconds=60)
+    monkeypatch.setattr(multi_provider, "provider_lanes", lanes)
+    monkeypatch.setattr(multi_provider, "_quote_dimeiggs", lambda q, limit: ("dimeiggs", [], None))
+    monkeypatch.setattr(multi_provider, "_quote_jamila", lambda q, limit: ("jamila", [], None))
+
+    def run():
+        provider_queue.set_provider_tier(TIER_PRO)
+        multi_provider.quote_multi_providers("lapiz", providers=["dimeiggs", "jamila"])
+
+    thread = threading.Thread(target=run)  # contexto propio: no contamina el de la prueba
+    thread.start()
+    thread.join()
+
+    for lane in ("dimeiggs", "jamila"):
+        tiers = lanes.snapshot()[lane]["tiers"]
+        assert tiers["pro"]["completed"] == 1 and tiers["free"]["submitted"] == 0
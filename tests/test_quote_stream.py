@@ -0,0 +1,68 @@
+"""
+Pruebas de la cotización en lote por Server-Sent Events
+(/api/quote/multi-providers/batch/stream).
+Ejecutar: python -m pytest tests/test_quote_stream.py
+"""
+
+import asyncio
+import json
+import time
+
+from starlette.requests import Request
+
+from app import main
+from app.entitlements import Entitlements
+
+
+def _parse_sse(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_items_stream_as_they_finish(monkeypatch):
+    delays = {"lento": 0.4, "medio": 0.2, "rapido": 0.02}
+
+    def fake_quote(item, providers, limit_per_provider=5, max_results=8, on_provider_done=None):
+        time.sleep(delays[item["detalle"]])
+        for provider in providers:
+            on_provider_done(provider, 1, None)
+        item["quote"] = {"status": "ok", "line_total": 1000 * item["cantidad"]}
+        return item
+
+    monkeypatch.setattr(main, "_quote_single_item", fake_quote)
+    monkeypatch.setattr(main, "get_entitlements", lambda user_id: Entitlements(True, True, False, "demo", 5, 2, None))
+
+    async def scenario():
+        payload = {"items": [{"detalle": d, "cantidad": 1} for d in ("lento", "medio", "rapido")]}
+        request = Request({"type": "http", "headers": [], "client": ("10.0.0.1", 5000)})
+        response = await main.quote_multi_batch_stream_endpoint(request, payload, current_user=None)
+        assert response.media_type == "text/event-stream"
+        body, arrivals = "", []
+        start = time.monotonic()
+        async for chunk in response.body_iterator:
+            body += chunk
+            if chunk.startswith("event: item"):
+                arrivals.append(time.monotonic() - start)
+        return body, arrivals
+
+    body, arrivals = asyncio.run(scenario())
+    events = _parse_sse(body)
+
+    assert events[0][0] == "start" and events[0][1]["items_total"] == 3
+    assert events[-1][0] == "summary"
+    items = [data for name, data in events if name == "item"]
+    # orden de término, no de entrada; el primero llega sin esperar al más lento
+    assert [it["item"]["detalle"] for it in items] == ["rapido", "medio", "lento"]
+    assert [it["index"] for it in items] == [2, 1, 0]
+    assert arrivals[0] < 0.3
+
+    providers = [data for name, data in events if name == "provider"]
+    assert len(providers) == 3 * 2
+    assert items[-1]["items_quoted"] == 3 and items[-1]["providers_pending"] == 0
+
+    summary = events[-1][1]
+    assert summary["items_priced"] == 3 and summary["subtotal"] == 3000
+    assert summary["is_demo_mode"] and "items" not in summary
@@ -0,0 +1,98 @@
+"""
+Pruebas de serialización, compresión y modo compacto de respuestas (app/responses.py).
+Ejecutar: python -m pytest tests/test_responses.py
+"""
+
+import asyncio
+import gzip
+import json
+from decimal import Decimal
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+from app.responses import CompressionMiddleware, FastJSONResponse, compact_payload
+
+
+def _hit(title, price):
+    return {
+        "title": title, "url": f"https://tienda.cl/{title}", "price": price, "available": True,
+        "provider": "dimeiggs", "relevance": 0.9, "image_url": f"https://cdn.tienda.cl/{title}.jpg",
+    }
+
+
+def _quoted(detalle, hits):
+    quote = {"query": detalle, "status": "ok", "providers_queried": ["dimeiggs"], "providers_failed": [],
+             "hits": hits, "error": None, "unit_price": hits[0]["price"], "line_total": hits[0]["price"] * 2,
+             "best_hit": hits[0]}
+    return {"detalle": detalle, "cantidad": 2, "quote": quote}
+
+
+def _app():
+    app = FastAPI(default_response_class=FastJSONResponse)
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+    @app.get("/big")
+    async def big():
+        return {"items": [{"detalle": f"item {i}", "precio": Decimal("1990.00")} for i in range(100)]}
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @app.get("/sse")
+    async def sse():
+        return StreamingResponse(iter(["data: x\n\n" * 200]), media_type="text/event-stream")
+
+    return app
+
+
+def _get(path):
+    async def run():
+        transport = httpx.ASGITransport(app=_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(path, headers={"Accept-Encoding": "gzip"})
+    return asyncio.run(run())
+
+
+def test_large_responses_are_gzipped_and_decimals_serialized():
+    response = _get("/big")
+    assert response.headers["content-encoding"] == "gzip"
+    assert int(response.headers["content-length"]) < len(response.content) / 5
+    assert response.json()["items"][0] == {"detalle": "item 0", "precio": 1990.0}
+
+
+def test_small_and_sse_responses_are_not_compressed():
+    assert "content-encoding" not in _get("/small").headers
+    assert "content-encoding" not in _get("/sse").headers
+
+
+def test_compact_payload_keeps_only_best_hit():
+    response = {
+        "raw_text_preview": "texto largo " * 100,
+        "resume": {"subtotal": 1000},
+        "items": [_quoted("lapiz", [_hit("a", 300), _hit("b", 350)]), {"detalle": "libro", "quote": {"status": "skip"}}],
+    }
+
+    compact = compact_payload(response)
+    assert "raw_text_preview" not in compact and compact["resume"] == {"subtotal": 1000}
+    quote = compact["items"][0]["quote"]
+    assert quote == {
+        "status": "ok", "unit_price": 300, "line_total": 600, "hits_total": 2,
+        "best_hit": {"title": "a", "url": "https://tienda.cl/a", "price": 300, "provider": "dimeiggs", "available": True},
+    }
+    assert compact["items"][1]["quote"] == {"status": "skip"}
+    assert len(json.dumps(compact)) < len(json.dumps(response)) / 3
+
+    with_hits = compact_payload(response, all_hits=True)["items"][0]["quote"]
+    assert [h["title"] for h in with_hits["hits"]] == ["a", "b"] and "image_url" not in with_hits["hits"][1]
+    assert "best_hit" in response["items"][0]["quote"] and "image_url" in response["items"][0]["quote"]["hits"][0]
+
+
+def test_compact_payload_single_query_and_bulk():
+    single = compact_payload({"query": "lapiz", "hits": [_hit("a", 300), _hit("b", 350)]})
+    assert single["hits_total"] == 2 and [h["title"] for h in single["hits"]] == ["a"]
+
+    bulk = compact_payload({"result": {"lists": [{"filename": "1A.pdf", "items": [_quoted("lapiz", [_hit("a", 300)])]}]}})
+    assert "hits" not in bulk["result"]["lists"][0]["items"][0]["quote"]
@@ -0,0 +1,88 @@
+"""
+Pruebas del parser de reglas (pipeline streaming por generadores).
+Ejecutar: python -m pytest tests/test_rules_parser.py
+"""
+
+from app.keyword_matcher import KeywordMatcher
+from app.rules_parser import (
+    RulesParseStream,
+    iter_merge_loose_continuations,
+    parse_item_line,
+    parse_with_rules,
+    split_lines,
+    stream_parse_pages,
+)
+
+SAMPLE = """LISTA DE ÚTILES 2025
+LENGUAJE
+1 Cuaderno college 100 hojas, 2 Lápiz grafito
+2 Carpeta plastificada roja
+MATEMÁTICA Cuaderno cuadro grande 7mm 3
+Témpera 12 colores caja 2
+horario 08:00 hrs
+SOCIALES
+1 Diccionario
+"""
+
+
+def test_stream_equals_list_pipeline():
+    expected = parse_with_rules(split_lines(SAMPLE))["items"]
+    pages = SAMPLE.split("\n2 Carpeta")
+    pages[1] = "2 Carpeta" + pages[1]
+    assert list(stream_parse_pages(pages)) == expected
+    assert [it["asignatura"] for it in expected] == [
+        "LENGUAJE", "LENGUAJE", "LENGUAJE", "MATEMÁTICA", "MATEMÁTICA", "SOCIALES",
+    ]
+
+
+def test_stream_is_lazy():
+    def pages():
+        yield "1 Cuaderno college\n2 Lápiz grafito"
+        raise AssertionError("no debería leer la segunda página")
+
+    first = next(iter(stream_parse_pages(pages())))
+    assert first["detalle"] == "Cuaderno college"
+
+
+def test_merge_loose_continuations_lookahead():
+    items = [
+        {"detalle": "Carpeta", "item_original": "Carpeta", "cantidad": 1, "unidad": "unid"},
+        {"detalle": "roja", "item_original": "roja", "cantidad": None, "unidad": None},
+        {"detalle": "Lápiz", "item_original": "Lápiz", "cantidad": 2, "unidad": "unid"},
+    ]
+    merged = list(iter_merge_loose_continuations(items))
+    assert [it["detalle"] for it in merged] == ["Carpeta roja", "Lápiz"]
+
+
+def test_rules_parse_stream_stats():
+    stream = RulesParseStream([SAMPLE], preview_chars=20)
+    items = list(stream)
+    assert len(items) == 6
+    assert stream.lines_count == len(split_lines(SAMPLE))
+    assert stream.preview == SAMPLE[:20]
+
+
+def test_lexer_strategies():
+    cases = {
+        "1 Carpeta caja 5": ("Carpeta", 5, "caja"),
+        "1 Caja lápices de colores": ("lápices de colores", 1, "caja"),
+        "3 Pinceles resma 2, 6 y 8": ("Pinceles resma 2, 6 y 8", 3, "resma"),
+        "Pack Separadores 5": ("Separadores", 5, "pack"),
+        "Témpera 12 colores caja 2": ("Témpera 12 colores", 2, "caja"),
+        "Block de dibujo médium 99 1/8": ("Block de dibujo médium 99 1/", 8, "unid"),
+    }
+    for line, (detalle, cantidad, unidad) in cases.items():
+        it = parse_item_line(line)
+        assert (it["detalle"], it["cantidad"], it["unidad"]) == (detalle, cantidad, unidad), line
+    assert parse_item_line("LISTA DE ÚTILES 2025") is None
+    assert parse_item_line("Marcado con nombre") is None
+
+
+def test_keyword_matcher():
+    matcher = KeywordMatcher({"cuota", "cuotas", "sin interés", "hora"})
+    assert matcher.keywords == ("CUOTA", "HORA", "SIN INTERÉS")
+    assert matcher.contains_any("PAGO EN 3 CUOTAS")
+    assert matcher.contains_any("CUADERNO", "3 pagos sin interés")
+    assert not matcher.contains_any("CUADERNO COLLEGE", "LÁPIZ")
+    # el separador entre campos no crea coincidencias falsas
+    assert not KeywordMatcher({"ab"}).contains_any("A", "B")
@@ -0,0 +1,44 @@
+"""
+Pruebas del cache de settings (lecturas desde memoria, write-through y
+propagación entre workers vía la marca de versión).
+Ejecutar: python -m pytest tests/test_settings_cache.py
+"""
+
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app import settings
+from app.database import Base
+from app.settings import get_setting_bool, set_setting_bool
+
+
+def _worker(url):
+    """Un engine propio por "worker" (cada uno con su cache) contando SELECTs."""
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    queries = []
+    event.listen(engine, "before_cursor_execute", lambda *a: queries.append(a[2]))
+    return sessionmaker(bind=engine)(), queries
+
+
+def test_reads_from_memory_and_propagates(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "SETTINGS_POLL_SECONDS", 0.2)
+    url = f"sqlite:///{tmp_path / 'settings.db'}"
+    db_a, _ = _worker(url)
+    db_b, queries_b = _worker(url)
+
+    assert get_setting_bool(db_b, "plans_enabled", True) is True
+    queries_b.clear()
+    for _ in range(100):
+        get_setting_bool(db_b, "plans_enabled", True)
+    assert queries_b == []  # sin ir a la BD
+
+    set_setting_bool(db_a, "plans_enabled", False)
+    assert get_setting_bool(db_a, "plans_enabled", True) is False  # write-through
+    assert get_setting_bool(db_b, "plans_enabled", True) is True  # B aún no consulta la versión
+
+    time.sleep(0.25)
+    assert get_setting_bool(db_b, "plans_enabled", True) is False
+    assert len(queries_b) == 2  # consulta de versión + recarga
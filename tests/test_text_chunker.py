@@ -0,0 +1,47 @@
+"""
+Pruebas del chunker por sección y del merge de la extracción por chunks.
+Ejecutar: python -m pytest tests/test_text_chunker.py
+"""
+
+from app.llm_client import _merge_chunk_results
+from app.text_chunker import TextChunk, chunk_text
+
+DOC = "\n".join(
+    ["LISTA DE ÚTILES 2025", "LENGUAJE"]
+    + [f"{i} Cuaderno college {i}" for i in range(1, 40)]
+    + ["MATEMÁTICA"]
+    + [f"{i} Regla {i}" for i in range(1, 10)]
+)
+
+
+def test_chunks_are_bounded_and_lossless():
+    chunks = chunk_text(DOC, max_chars=300)
+    assert len(chunks) > 1
+    assert all(len(c.text) <= 300 + len("LENGUAJE") + 1 for c in chunks)
+
+    lines = [ln for c in chunks for ln in c.text.splitlines()]
+    for ln in DOC.splitlines():
+        assert ln in lines
+
+
+def test_split_section_keeps_subject():
+    chunks = chunk_text(DOC, max_chars=300)
+    continued = chunks[1]
+    assert continued.subject == "LENGUAJE"
+    assert continued.text.splitlines()[0] == "LENGUAJE"
+
+
+def test_merge_preserves_subject_and_dedupes():
+    chunks = [TextChunk("a", None), TextChunk("b", "LENGUAJE")]
+    results = [
+        {"curso": "4º Básico", "items": [{"asignatura": "LENGUAJE", "detalle": "Cuaderno", "cantidad": 1}]},
+        {"curso": None, "items": [
+            {"asignatura": None, "detalle": "cuaderno", "cantidad": 1},
+            {"asignatura": None, "detalle": "Diccionario", "cantidad": 1},
+        ]},
+    ]
+    merged = _merge_chunk_results(chunks, results)
+    assert merged["curso"] == "4º Básico"
+    assert [it["detalle"] for it in merged["items"]] == ["Cuaderno", "Diccionario"]
+    assert merged["items"][1]["asignatura"] == "LENGUAJE"
+    assert "error" not in merged